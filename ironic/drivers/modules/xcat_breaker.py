@@ -0,0 +1,162 @@
+"""
+per BMC circuit breaker for the xcat baremetal driver
+a node whose BMC keeps failing is fast-failed instead of tying up a
+worker and a command slot until CONF.ipmi.retry_timeout on every power
+request and sync cycle; open circuits are probed again with an
+exponential backoff
+"""
+
+import threading
+import time
+
+from oslo.config import cfg
+
+from ironic.openstack.common import log as logging
+
+xcat_opts = [
+    cfg.IntOpt('bmc_breaker_threshold',
+               default=3,
+               help='Consecutive failed BMC commands after which the '
+               'circuit of a node opens and its BMC commands fail fast, '
+               '0 disables the breaker'),
+    cfg.IntOpt('bmc_breaker_open_time',
+               default=120,
+               help='Seconds an open circuit fails fast before the BMC is '
+               'probed again, doubled after every failed probe'),
+    cfg.IntOpt('bmc_breaker_max_open_time',
+               default=3600,
+               help='Upper bound (seconds) of the time an open circuit '
+               'waits between probes'),
+    cfg.IntOpt('bmc_breaker_probe_interval',
+               default=60,
+               help='Interval (seconds) of the background probe of the '
+               'open circuits, 0 probes them inline on the next request'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# xcat commands talking to the BMC of the node
+BMC_COMMANDS = ('rpower', 'rsetboot', 'rinv', 'rvitals', 'rbeacon', 'rflash')
+
+
+class BMCBreaker(object):
+    """Circuit breaker state of the BMC of every xcat node.
+
+    closed: commands run, failures are counted.
+    open: commands fail fast until the open time has passed.
+    half-open: one probe runs, success closes the circuit, failure opens
+    it again for twice the time.
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def _new(self):
+        return {'state': CLOSED,
+                'failures': 0,
+                'open_time': 0,
+                'retry_at': 0,
+                'opened_at': None,
+                'last_error': None,
+                'fast_failed': 0}
+
+    def allow(self, xcat_node):
+        """Return True if a BMC command of the node may run now."""
+        if not CONF.xcat.bmc_breaker_threshold:
+            return True
+        with self._lock:
+            circuit = self._nodes.get(xcat_node)
+            if circuit is None or circuit['state'] == CLOSED:
+                return True
+            if (circuit['state'] == OPEN and
+                    not CONF.xcat.bmc_breaker_probe_interval and
+                    time.time() >= circuit['retry_at']):
+                # no background probe, let this request be the probe
+                circuit['state'] = HALF_OPEN
+                return True
+            circuit['fast_failed'] += 1
+            return False
+
+    def success(self, xcat_node):
+        with self._lock:
+            circuit = self._nodes.pop(xcat_node, None)
+        if circuit is not None and circuit['state'] != CLOSED:
+            LOG.info(_("BMC of xcat node %s answers again, circuit closed"),
+                     xcat_node)
+
+    def failure(self, xcat_node, error=None):
+        threshold = CONF.xcat.bmc_breaker_threshold
+        if not threshold:
+            return
+        with self._lock:
+            circuit = self._nodes.setdefault(xcat_node, self._new())
+            circuit['failures'] += 1
+            circuit['last_error'] = error and str(error)
+            if circuit['state'] == CLOSED:
+                if circuit['failures'] < threshold:
+                    return
+                open_time = CONF.xcat.bmc_breaker_open_time
+                circuit['opened_at'] = time.time()
+            else:
+                open_time = min(max(circuit['open_time'], 1) * 2,
+                                CONF.xcat.bmc_breaker_max_open_time)
+            circuit['state'] = OPEN
+            circuit['open_time'] = open_time
+            circuit['retry_at'] = time.time() + open_time
+        LOG.warning(_("BMC of xcat node %(node)s failed %(count)d times, "
+                      "failing its BMC commands fast for %(time)ds"),
+                    {'node': xcat_node, 'count': circuit['failures'],
+                     'time': open_time})
+
+    def inconclusive(self, xcat_node):
+        """A command failed before it reached the BMC.
+
+        Nothing is counted; a half-open circuit opens again without a
+        longer open time, so the next request probes the BMC.
+        """
+        with self._lock:
+            circuit = self._nodes.get(xcat_node)
+            if circuit is not None and circuit['state'] == HALF_OPEN:
+                circuit['state'] = OPEN
+
+    def reset(self, xcat_node):
+        """Close the circuit of a node, e.g. after the BMC was fixed."""
+        with self._lock:
+            self._nodes.pop(xcat_node, None)
+
+    def due(self):
+        """Return the open circuits whose open time has passed."""
+        now = time.time()
+        with self._lock:
+            return sorted(n for n, c in self._nodes.items()
+                          if c['state'] == OPEN and now >= c['retry_at'])
+
+    def state(self, xcat_node):
+        """Return the circuit state of a node as a dict."""
+        circuit = self._nodes.get(xcat_node)
+        if circuit is None:
+            return {'node': xcat_node, 'state': CLOSED, 'failures': 0}
+        state = dict(circuit)
+        state['node'] = xcat_node
+        state['retry_in'] = max(int(circuit['retry_at'] - time.time()), 0)
+        return state
+
+    def get_stats(self):
+        """Return the state of every circuit that is not plain closed."""
+        stats = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0, 'nodes': {}}
+        for xcat_node in list(self._nodes):
+            state = self.state(xcat_node)
+            stats[state['state']] += 1
+            stats['nodes'][xcat_node] = state
+        return stats
+
+
+BREAKER = BMCBreaker()
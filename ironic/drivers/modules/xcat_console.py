@@ -0,0 +1,362 @@
+"""
+multiplexed console for the xcat baremetal driver
+one long running shellinabox proxy serves the serial console of every
+node through xCAT's conserver (rcons), instead of a shellinabox daemon
+plus an ipmitool process per node
+"""
+
+import os
+import re
+import stat
+import time
+
+from oslo.config import cfg
+
+from ironic.common import exception
+from ironic.common import paths
+from ironic.common import utils
+from ironic.drivers import base
+from ironic.drivers.modules import console_utils
+from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import lockutils
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import loopingcall
+from ironic.openstack.common import processutils
+
+xcat_opts = [
+    cfg.StrOpt('console_mode',
+               default='shellinabox',
+               help='Console implementation of the xcat driver: '
+               '"shellinabox" runs a shellinabox and ipmitool per node, '
+               '"conserver" serves every node from one shared proxy '
+               'through xcat conserver'),
+    cfg.IntOpt('console_proxy_port',
+               default=8023,
+               help='Port of the shared console proxy'),
+    cfg.StrOpt('console_session_dir',
+               default=paths.state_path_def('xcat_consoles'),
+               help='Directory holding one file per open console session, '
+               'it must be owned by the conductor user and closed to '
+               'other users'),
+    cfg.IntOpt('console_idle_timeout',
+               default=900,
+               help='Seconds without console activity after which a '
+               'session is closed, 0 keeps sessions open'),
+    cfg.StrOpt('conserver_log_dir',
+               default='/var/log/consoles',
+               help='Directory where conserver logs the node consoles'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+CONSOLE_SEMAPHORE = 'xcat_console'
+# nodes whose conserver log a deploy watchdog follows, see keep_conserver
+_kept = set()
+# xcat node names allowed in a console url
+NODE_NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+# run by the proxy for every console connection: map the requested url
+# to a node with an open session and exec rcons for it
+RCONS_SCRIPT = """#!/bin/sh
+url=${1%%%%\\?*}
+url=${url%%/}
+node=${url##*/}
+case "$node" in
+    ''|[!A-Za-z0-9]*|*[!A-Za-z0-9._-]*)
+        echo "invalid console url" >&2
+        exit 1;;
+esac
+if [ ! -f "%(session_dir)s/$node" ]; then
+    echo "no console session for $node" >&2
+    exit 1
+fi
+touch "%(session_dir)s/$node"
+exec rcons "$node"
+"""
+
+
+def _session_path(xcat_node, session_dir=None):
+    return os.path.join(session_dir or CONF.xcat.console_session_dir,
+                        xcat_node)
+
+
+def _proxy_pidfile():
+    return os.path.join(CONF.xcat.console_session_dir, '.proxy.pid')
+
+
+def _rcons_script():
+    return os.path.join(CONF.xcat.console_session_dir, '.rcons.sh')
+
+
+def check_session_dir():
+    """Create the session directory or check that it is private.
+
+    The session files and the proxy pid file are trusted, so the
+    directory must be owned by the conductor user and closed to others.
+
+    :raises: xCATConsoleSessionDirUnsafe
+    """
+    session_dir = CONF.xcat.console_session_dir
+    if not os.path.isdir(session_dir):
+        os.makedirs(session_dir, 0o700)
+    st = os.lstat(session_dir)
+    if not stat.S_ISDIR(st.st_mode):
+        reason = _("not a directory")
+    elif st.st_uid != os.getuid():
+        reason = _("owned by uid %d") % st.st_uid
+    elif st.st_mode & 0o077:
+        reason = _("mode %o is open to other users") % (st.st_mode & 0o777)
+    else:
+        return
+    raise xcat_exception.xCATConsoleSessionDirUnsafe(path=session_dir,
+                                                     reason=reason)
+
+
+def _read_pid(path):
+    try:
+        with open(path) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (IOError, OSError, ValueError):
+        return None
+    return pid
+
+
+def _rss_kb(pid):
+    """Resident memory of a process in kB, None when unknown."""
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def _descendants(pid):
+    """Return the pids of every process below pid, from /proc."""
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                # the command name may hold spaces, ppid follows it
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    result = []
+    todo = [pid]
+    while todo:
+        for child in children.get(todo.pop(), []):
+            result.append(child)
+            todo.append(child)
+    return result
+
+
+def open_sessions():
+    """Return the xcat node names with an open console session."""
+    try:
+        names = os.listdir(CONF.xcat.console_session_dir)
+    except OSError:
+        return []
+    return [n for n in names if not n.startswith('.')]
+
+
+@lockutils.synchronized(CONSOLE_SEMAPHORE, 'xcat-console-')
+def ensure_proxy():
+    """Start the shared console proxy unless it is already running."""
+    check_session_dir()
+    session_dir = CONF.xcat.console_session_dir
+    pidfile = _proxy_pidfile()
+    if _read_pid(pidfile):
+        return
+    script = _rcons_script()
+    with open(script, 'w') as f:
+        f.write(RCONS_SCRIPT % {'session_dir': session_dir})
+    os.chmod(script, 0o700)
+    # shellinabox substitutes ${url} with the requested url, the script
+    # maps it to the node and execs rcons for that node only, no python
+    # process per connection
+    service = ("/:%(uid)s:%(gid)s:HOME:%(script)s ${url}"
+               % {'uid': os.getuid(),
+                  'gid': os.getgid(),
+                  'script': script})
+    cmd = ['shellinaboxd', '-t',
+           '-p', str(CONF.xcat.console_proxy_port),
+           '--background=%s' % pidfile,
+           '-s', service]
+    try:
+        utils.execute(*cmd)
+    except (processutils.ProcessExecutionError, OSError) as e:
+        raise exception.ConsoleSubprocessFailed(error=e)
+    LOG.info(_("Started the shared xcat console proxy on port %s"),
+             CONF.xcat.console_proxy_port)
+
+
+@lockutils.synchronized(CONSOLE_SEMAPHORE, 'xcat-console-')
+def open_session(xcat_node):
+    """Add the node to conserver and allow it through the proxy."""
+    if os.path.exists(_session_path(xcat_node)):
+        return
+    try:
+        xcat_util.xcat_execute(['makeconservercf', xcat_node])
+    except (processutils.ProcessExecutionError, OSError) as e:
+        LOG.warning(_("makeconservercf failed for node %(node)s: "
+                      "%(error)s"), {'node': xcat_node, 'error': e})
+        raise xcat_exception.xCATCmdFailure(cmd='makeconservercf',
+                                            node=xcat_node, args='')
+    with open(_session_path(xcat_node), 'w') as f:
+        f.write('%f\n' % time.time())
+
+
+@lockutils.synchronized(CONSOLE_SEMAPHORE, 'xcat-console-')
+def keep_conserver(xcat_node):
+    """Keep the node in conserver until release_conserver is called.
+
+    Closing a console session of the node meanwhile only ends the proxy
+    session, conserver goes on logging the console for the watchdog.
+    """
+    _kept.add(xcat_node)
+
+
+def release_conserver(xcat_node):
+    _kept.discard(xcat_node)
+
+
+@lockutils.synchronized(CONSOLE_SEMAPHORE, 'xcat-console-')
+def close_session(xcat_node):
+    """End the proxy session and remove the node from conserver.
+
+    A node kept by keep_conserver stays in conserver.
+    """
+    if not os.path.exists(_session_path(xcat_node)):
+        return
+    if xcat_node not in _kept:
+        try:
+            xcat_util.xcat_execute(['makeconservercf', '-d', xcat_node])
+        except (processutils.ProcessExecutionError, OSError) as e:
+            LOG.warning(_("makeconservercf -d failed for node %(node)s: "
+                          "%(error)s"), {'node': xcat_node, 'error': e})
+    utils.unlink_without_raise(_session_path(xcat_node))
+
+
+def _last_activity(xcat_node):
+    """Most recent of the session open/connect time and console output."""
+    times = []
+    for path in (_session_path(xcat_node),
+                 os.path.join(CONF.xcat.conserver_log_dir, xcat_node)):
+        try:
+            times.append(os.path.getmtime(path))
+        except OSError:
+            pass
+    return max(times) if times else 0
+
+
+def close_idle_sessions():
+    """Close the sessions without activity for console_idle_timeout."""
+    timeout = CONF.xcat.console_idle_timeout
+    if not timeout:
+        return []
+    now = time.time()
+    closed = []
+    for xcat_node in open_sessions():
+        if now - _last_activity(xcat_node) > timeout:
+            LOG.info(_("Closing idle console session of node %s"), xcat_node)
+            close_session(xcat_node)
+            closed.append(xcat_node)
+    return closed
+
+
+def get_stats():
+    """Memory used by the shared proxy and conserver per open session.
+
+    connections_rss_kb is the memory of the processes the proxy runs
+    for the connected consoles, rcons and its console client.
+    """
+    sessions = len(open_sessions())
+    proxy_pid = _read_pid(_proxy_pidfile())
+    conserver_pid = _read_pid('/var/run/conserver.pid')
+    proxy_rss = _rss_kb(proxy_pid) if proxy_pid else None
+    conserver_rss = _rss_kb(conserver_pid) if conserver_pid else None
+    connections = _descendants(proxy_pid) if proxy_pid else []
+    connections_rss = sum(_rss_kb(pid) or 0 for pid in connections)
+    total = (proxy_rss or 0) + (conserver_rss or 0) + connections_rss
+    return {'sessions': sessions,
+            'proxy_pid': proxy_pid,
+            'proxy_rss_kb': proxy_rss,
+            'conserver_rss_kb': conserver_rss,
+            'connection_processes': len(connections),
+            'connections_rss_kb': connections_rss,
+            'rss_per_session_kb': total / sessions if sessions else None}
+
+
+class XcatConserverConsole(base.ConsoleInterface):
+    """A ConsoleInterface serving every node from one shared proxy."""
+
+    _reaper = None
+
+    def __init__(self):
+        try:
+            check_session_dir()
+        except (xcat_exception.xCATConsoleSessionDirUnsafe, OSError) as e:
+            raise exception.DriverLoadError(driver=self.__class__.__name__,
+                                            reason=str(e))
+        if (CONF.xcat.console_idle_timeout and
+                XcatConserverConsole._reaper is None):
+            XcatConserverConsole._reaper = loopingcall.FixedIntervalLoopingCall(
+                self._reap)
+            XcatConserverConsole._reaper.start(
+                interval=max(CONF.xcat.console_idle_timeout // 10, 10))
+
+    @staticmethod
+    def _reap():
+        try:
+            close_idle_sessions()
+            LOG.debug("xcat console stats: %s", get_stats())
+        except Exception as e:
+            LOG.warning(_("Failed to close idle console sessions: %s"), e)
+
+    def _xcat_node(self, task):
+        xcat_node = (task.node.driver_info or {}).get('xcat_node')
+        if not xcat_node or not NODE_NAME_RE.match(xcat_node):
+            raise exception.InvalidParameterValue(_(
+                "xcat node name not supplied to xcat baremetal driver."))
+        return xcat_node
+
+    def validate(self, task):
+        """Validate the Node console info.
+
+        :param task: a task from TaskManager.
+        :raises: InvalidParameterValue
+        """
+        self._xcat_node(task)
+
+    def start_console(self, task):
+        """Open a console session for the node on the shared proxy."""
+        xcat_node = self._xcat_node(task)
+        ensure_proxy()
+        open_session(xcat_node)
+
+    def stop_console(self, task):
+        """Close the console session of the node."""
+        close_session(self._xcat_node(task))
+
+    def get_console(self, task):
+        """Get the type and connection information about the console.
+
+        A session closed for idleness is opened again on demand.
+        """
+        xcat_node = self._xcat_node(task)
+        ensure_proxy()
+        open_session(xcat_node)
+        url = console_utils.get_shellinabox_console_url(
+            CONF.xcat.console_proxy_port)
+        return {'type': 'shellinabox', 'url': '%s/%s' % (url, xcat_node)}
+
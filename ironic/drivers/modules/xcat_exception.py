@@ -22,4 +22,20 @@ class GetNetworkIdFailure(IronicException):
     message = _("get node network in failed for mac %(mac_address)s")
 
 class FailedToGetInfoOnPort(IronicException):
-    message = _("Show info on port: %(port_id)s failed.")
\ No newline at end of file
+    message = _("Show info on port: %(port_id)s failed.")
+
+class xCATMacRegistrationFailure(IronicException):
+    message = _("xcat mac address registration failed for node %(node)s: "
+                "%(error)s")
+
+class xCATBMCCircuitOpen(xCATCmdFailure):
+    message = _("BMC of xcat node %(node)s is failing, %(cmd)s not run, "
+                "retry in %(retry_in)s seconds: %(error)s")
+
+class xCATInspectionFailure(IronicException):
+    message = _("xcat hardware inspection failed for node %(node)s: "
+                "%(error)s")
+
+class xCATConsoleSessionDirUnsafe(IronicException):
+    message = _("console session directory %(path)s is not safe: "
+                "%(reason)s")
@@ -0,0 +1,328 @@
+"""
+rolling firmware flash for the xcat baremetal driver
+flash a noderange with xcat rflash in waves of CONF.xcat.flash_parallelism
+nodes, power cycle every wave through the ironic power interface once
+its flashes are done and stop the rollout when a wave fails too often;
+the jobs run in the background and report per node progress and
+throughput
+"""
+
+import threading
+import time
+import uuid
+
+import eventlet
+from oslo.config import cfg
+
+from ironic.common import context
+from ironic.common import exception
+from ironic.common import states
+from ironic.conductor import task_manager
+from ironic.conductor import utils as manager_utils
+from ironic.drivers import base
+from ironic.drivers.modules import xcat_breaker
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import processutils
+
+xcat_opts = [
+    cfg.IntOpt('flash_parallelism',
+               default=10,
+               help='Nodes flashed at the same time in one wave of a '
+               'rolling rflash'),
+    cfg.FloatOpt('flash_max_failure_ratio',
+                 default=0.2,
+                 help='Failed fraction of a wave above which the remaining '
+                 'waves of a rolling rflash are not started'),
+    cfg.IntOpt('flash_jobs_kept',
+               default=20,
+               help='Finished rflash jobs kept for get_flash_status'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+PENDING = 'pending'
+FLASHING = 'flashing'
+REBOOTING = 'rebooting'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class FlashJob(object):
+    """State of one rolling rflash over a list of nodes."""
+
+    def __init__(self, nodes, args, parallelism, reboot,
+                 include_provisioned=False):
+        self.id = str(uuid.uuid4())
+        self.args = args
+        self.parallelism = parallelism
+        self.reboot = reboot
+        self.include_provisioned = include_provisioned
+        self.ironic_nodes = {}
+        self.nodes = dict((n, {'state': PENDING, 'wave': None,
+                               'error': None}) for n in nodes)
+        self.order = list(nodes)
+        self.waves = []
+        self.started_at = None
+        self.finished_at = None
+        self.aborted = None
+
+    def _set(self, xcat_node, state, error=None):
+        self.nodes[xcat_node]['state'] = state
+        if error:
+            self.nodes[xcat_node]['error'] = error
+
+    def _flash(self, wave):
+        """rflash a wave with one command, return the nodes flashed."""
+        flashed = []
+        for xcat_node in wave:
+            if not xcat_breaker.BREAKER.allow(xcat_node):
+                self._set(xcat_node, FAILED, _("BMC circuit open"))
+            else:
+                self._set(xcat_node, FLASHING)
+                flashed.append(xcat_node)
+        if not flashed:
+            return []
+        errors = {}
+        try:
+            for record in xcat_util.stream_xcatcmd(
+                    flashed, 'rflash', self.args,
+                    priority=xcat_util.PRIORITY_CRITICAL):
+                if record.error:
+                    errors.setdefault(record.node, record.value)
+        except OSError as e:
+            errors = dict((n, str(e)) for n in flashed)
+        # an error xcat did not attribute to a node fails the whole wave
+        if None in errors:
+            errors = dict((n, errors[None]) for n in flashed)
+        for xcat_node, error in errors.items():
+            if xcat_node in self.nodes:
+                self._set(xcat_node, FAILED, error)
+        return [n for n in flashed if n not in errors]
+
+    def _select(self):
+        """Skip the nodes the job may not power cycle.
+
+        Nodes without an ironic node can not be rebooted through the
+        power interface, provisioned nodes are only flashed when the
+        caller included them.
+        """
+        if not self.reboot:
+            return
+        self.ironic_nodes = _ironic_nodes()
+        for xcat_node in self.order:
+            node = self.ironic_nodes.get(xcat_node)
+            if node is None:
+                self._set(xcat_node, SKIPPED, _("no ironic node"))
+            elif not self.include_provisioned and _provisioned(node):
+                self._set(xcat_node, SKIPPED, _("node is provisioned"))
+
+    def _reboot(self, xcat_node):
+        self._set(xcat_node, REBOOTING)
+        ctx = context.get_admin_context()
+        with task_manager.acquire(
+                ctx, self.ironic_nodes[xcat_node].uuid) as task:
+            if not self.include_provisioned and _provisioned(task.node):
+                raise exception.InvalidParameterValue(_(
+                    "node was provisioned meanwhile"))
+            manager_utils.node_power_action(task, states.REBOOT)
+
+    def run(self):
+        self.started_at = time.time()
+        self._select()
+        pending = [n for n in self.order
+                   if self.nodes[n]['state'] == PENDING]
+        for index, wave in enumerate(
+                xcat_util._chunks(pending, self.parallelism)):
+            wave_start = time.time()
+            for xcat_node in wave:
+                self.nodes[xcat_node]['wave'] = index
+            flashed = self._flash(wave)
+            if self.reboot and flashed:
+                for xcat_node, result, error in xcat_util.run_concurrently(
+                        self._reboot, flashed):
+                    if error is not None:
+                        self._set(xcat_node, FAILED,
+                                  _("reboot failed: %s") % error)
+            for xcat_node in flashed:
+                if self.nodes[xcat_node]['state'] != FAILED:
+                    self._set(xcat_node, DONE)
+            failed = len([n for n in wave
+                          if self.nodes[n]['state'] == FAILED])
+            self.waves.append({'nodes': len(wave), 'failed': failed,
+                               'duration': time.time() - wave_start})
+            LOG.info(_("rflash job %(job)s wave %(wave)d: %(ok)d of "
+                       "%(count)d nodes flashed"),
+                     {'job': self.id, 'wave': index,
+                      'ok': len(wave) - failed, 'count': len(wave)})
+            if float(failed) / len(wave) > CONF.xcat.flash_max_failure_ratio:
+                self.aborted = _("%(failed)d of %(count)d nodes of wave "
+                                 "%(wave)d failed") % {'failed': failed,
+                                                       'count': len(wave),
+                                                       'wave': index}
+                LOG.error(_("rflash job %(job)s stopped: %(reason)s"),
+                          {'job': self.id, 'reason': self.aborted})
+                for xcat_node, node in self.nodes.items():
+                    if node['state'] == PENDING:
+                        node['state'] = SKIPPED
+                break
+        self.finished_at = time.time()
+
+    def status(self, with_nodes=True):
+        """Return the progress, throughput and per node states."""
+        counts = dict((s, 0) for s in (PENDING, FLASHING, REBOOTING, DONE,
+                                       FAILED, SKIPPED))
+        for node in self.nodes.values():
+            counts[node['state']] += 1
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        finished = counts[DONE] + counts[FAILED]
+        rate = finished / elapsed * 60 if elapsed else 0.0
+        status = {'id': self.id,
+                  'args': self.args,
+                  'running': self.finished_at is None,
+                  'aborted': self.aborted,
+                  'counts': counts,
+                  'waves': self.waves,
+                  'elapsed': elapsed,
+                  'nodes_per_minute': rate,
+                  'eta': (counts[PENDING] / rate * 60
+                          if rate and self.finished_at is None else None)}
+        if with_nodes:
+            status['nodes'] = self.nodes
+        return status
+
+
+def _provisioned(node):
+    return (node.instance_uuid is not None or
+            node.provision_state != states.NOSTATE)
+
+
+def _ironic_nodes():
+    """Return dict of xcat node name to its ironic node."""
+    from ironic import objects
+    result = {}
+    for node in objects.Node.list(context.get_admin_context()):
+        xcat_node = (node.driver_info or {}).get('xcat_node')
+        if xcat_node:
+            result[xcat_node] = node
+    return result
+
+
+def _forget_old_jobs():
+    finished = sorted((j for j in _jobs.values() if j.finished_at),
+                      key=lambda j: j.finished_at)
+    for job in finished[:max(len(finished) - CONF.xcat.flash_jobs_kept, 0)]:
+        _jobs.pop(job.id, None)
+
+
+def start(nodes, args, parallelism=None, reboot=True,
+          include_provisioned=False):
+    """Start a rolling rflash in the background.
+
+    :param nodes: list of xcat node names or a noderange string.
+    :param args: space separated rflash arguments, e.g. the firmware
+        file or directory and its options.
+    :param parallelism: nodes per wave, CONF.xcat.flash_parallelism
+        when not given.
+    :param reboot: power cycle every wave after its flashes, through
+        the power interface of the ironic node under its node lock.
+    :param include_provisioned: also flash and reboot the nodes with an
+        instance or a provision state, skipped otherwise.
+    :returns: the FlashJob.
+    """
+    try:
+        nodes = xcat_util.expand_noderange(nodes)
+    except (processutils.ProcessExecutionError, OSError) as e:
+        raise exception.InvalidParameterValue(_(
+            "Can not resolve the noderange to flash: %s") % e)
+    if not nodes:
+        raise exception.InvalidParameterValue(_("No nodes to flash."))
+    job = FlashJob(nodes, args, parallelism or CONF.xcat.flash_parallelism,
+                   reboot, include_provisioned)
+    with _jobs_lock:
+        _forget_old_jobs()
+        _jobs[job.id] = job
+    eventlet.spawn_n(_run, job)
+    return job
+
+
+def _run(job):
+    try:
+        job.run()
+    except Exception as e:
+        LOG.exception(_("rflash job %(job)s failed: %(error)s"),
+                      {'job': job.id, 'error': e})
+        job.aborted = str(e)
+        job.finished_at = time.time()
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+def list_jobs():
+    return [job.status(with_nodes=False) for job in _jobs.values()]
+
+
+class XcatFlash(base.VendorInterface):
+    """Rolling firmware flash through xcat rflash.
+
+    driver method flash_firmware: start a rolling rflash, parameters
+    nodes (xcat noderange), args (rflash arguments), parallelism, reboot
+    and include_provisioned; returns the job status.
+    driver method get_flash_status: status of the job given by job_id,
+    of every job when not given.
+    """
+
+    NODE_METHODS = ()
+    DRIVER_METHODS = ('flash_firmware', 'get_flash_status')
+
+    def validate(self, task, **kwargs):
+        raise exception.InvalidParameterValue(_(
+            "Unsupported method (%s) passed to xcat driver.")
+            % kwargs.get('method'))
+
+    def vendor_passthru(self, task, **kwargs):
+        raise exception.InvalidParameterValue(_(
+            "Unsupported method (%s) passed to xcat driver.")
+            % kwargs.get('method'))
+
+    def driver_vendor_passthru(self, context, method, **kwargs):
+        if method == 'get_flash_status':
+            job_id = kwargs.get('job_id')
+            if not job_id:
+                return list_jobs()
+            job = get_job(job_id)
+            if job is None:
+                raise exception.InvalidParameterValue(_(
+                    "Unknown rflash job %s.") % job_id)
+            return job.status()
+        if method != 'flash_firmware':
+            raise exception.InvalidParameterValue(_(
+                "Unsupported method (%s) passed to xcat driver.")
+                % method)
+        nodes = kwargs.get('nodes')
+        args = kwargs.get('args')
+        if not nodes or not args:
+            raise exception.InvalidParameterValue(_(
+                "flash_firmware needs a xcat noderange in 'nodes' and the "
+                "rflash arguments in 'args'."))
+        try:
+            parallelism = int(kwargs.get('parallelism') or 0)
+        except ValueError:
+            raise exception.InvalidParameterValue(_(
+                "parallelism must be an integer."))
+        reboot = kwargs.get('reboot', True) not in (False, 'false', 'False',
+                                                    '0')
+        include_provisioned = kwargs.get('include_provisioned') in (
+            True, 'true', 'True', '1')
+        job = start(nodes, args, parallelism, reboot, include_provisioned)
+        return job.status(with_nodes=False)
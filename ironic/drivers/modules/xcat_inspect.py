@@ -0,0 +1,424 @@
+"""
+hardware inspection for the xcat baremetal driver
+run rinv against many nodes in chunked, concurrent batches, parse the
+cpus, memory, disks and NIC MACs into node properties and ports, and
+cache the results keyed by the serial number and firmware of the node
+so a rerun only inventories the hardware that changed; batch inspections
+run in the background as jobs whose per node results are fetched later
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import eventlet
+from oslo.config import cfg
+
+from ironic.common import exception
+from ironic.common import paths
+from ironic.conductor import task_manager
+from ironic.drivers import base
+from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import lockutils
+from ironic.openstack.common import log as logging
+
+xcat_opts = [
+    cfg.IntOpt('inspect_chunk_size',
+               default=100,
+               help='Nodes per rinv command of a batch inspection'),
+    cfg.IntOpt('inspect_parallel_chunks',
+               default=8,
+               help='rinv commands of a batch inspection run at the same '
+               'time'),
+    cfg.StrOpt('inspect_cache_file',
+               default=paths.state_path_def('xcat_inspect_cache.json'),
+               help='File caching the inventory of every serial number '
+               'and firmware'),
+    cfg.StrOpt('inspect_default_cpu_arch',
+               default='x86_64',
+               help='cpu_arch set on inspected nodes when rinv does not '
+               'report it'),
+    cfg.IntOpt('inspect_jobs_kept',
+               default=20,
+               help='Finished batch inspection jobs kept for '
+               'get_inspection_status'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+CACHE_SEMAPHORE = 'xcat_inspect'
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+CPU_RE = re.compile(r'^(?:CPU|Processor)\s*(\d+)\b', re.I)
+CORES_RE = re.compile(r'(?:CPU|Processor)\s*\d+\s+(?:Cores|Core Count)'
+                      r'\s*:\s*(\d+)', re.I)
+ARCH_RE = re.compile(r'\b(x86_64|ppc64le|ppc64|aarch64)\b')
+DIMM_RE = re.compile(r'^(?:DIMM|Memory)[^:]*:\s*(\d+(?:\.\d+)?)\s*(MB|GB|TB)',
+                     re.I)
+TOTAL_MEMORY_RE = re.compile(r'^Total Memory\s*:\s*(\d+(?:\.\d+)?)\s*'
+                             r'(MB|GB|TB)', re.I)
+DISK_RE = re.compile(r'^(?:Disk|Drive|HDD|SSD|Hard Disk)[^:]*:.*?'
+                     r'(\d+(?:\.\d+)?)\s*(GB|TB)', re.I)
+MAC_RE = re.compile(r'^MAC Address\s*\d*\s*:\s*'
+                    r'([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})')
+SERIAL_RE = re.compile(r'^(?:Product |System |Board )?Serial Number\s*:\s*'
+                       r'(\S+)', re.I)
+FIRMWARE_RE = re.compile(r'^(?:BMC Firmware|Firmware Version|'
+                         r'BIOS Version)\s*:\s*(.+)$', re.I)
+
+MB = {'MB': 1, 'GB': 1024, 'TB': 1024 * 1024}
+GB = {'GB': 1, 'TB': 1024}
+
+
+def parse_inventory(lines):
+    """Parse the rinv lines of one node.
+
+    :param lines: the values of the node, without the node prefix.
+    :returns: dict with cpus, cpu_arch, memory_mb, local_gb, macs,
+        serial and firmware, the keys rinv did not report are left out.
+    """
+    sockets = set()
+    cores = 0
+    memory_mb = 0
+    total_memory_mb = 0
+    disks_gb = []
+    macs = []
+    result = {}
+    for line in lines:
+        line = line.strip()
+        match = CPU_RE.match(line)
+        if match:
+            sockets.add(match.group(1))
+            arch = ARCH_RE.search(line)
+            if arch:
+                result['cpu_arch'] = arch.group(1)
+        match = CORES_RE.match(line)
+        if match:
+            cores += int(match.group(1))
+            continue
+        match = DIMM_RE.match(line)
+        if match:
+            memory_mb += int(float(match.group(1)) *
+                             MB[match.group(2).upper()])
+            continue
+        match = TOTAL_MEMORY_RE.match(line)
+        if match:
+            total_memory_mb = int(float(match.group(1)) *
+                                  MB[match.group(2).upper()])
+            continue
+        match = DISK_RE.match(line)
+        if match:
+            disks_gb.append(int(float(match.group(1)) *
+                                GB[match.group(2).upper()]))
+            continue
+        match = MAC_RE.match(line)
+        if match:
+            mac = match.group(1).lower()
+            if mac not in macs:
+                macs.append(mac)
+            continue
+        match = SERIAL_RE.match(line)
+        if match and 'serial' not in result:
+            result['serial'] = match.group(1)
+            continue
+        match = FIRMWARE_RE.match(line)
+        if match and 'firmware' not in result:
+            result['firmware'] = match.group(1).strip()
+    if cores or sockets:
+        result['cpus'] = cores or len(sockets)
+    if total_memory_mb or memory_mb:
+        result['memory_mb'] = total_memory_mb or memory_mb
+    if disks_gb:
+        # the root disk, ironic has no notion of the sum of the disks
+        result['local_gb'] = max(disks_gb)
+    if macs:
+        result['macs'] = macs
+    return result
+
+
+def _cache_key(identity):
+    if not identity.get('serial'):
+        return None
+    return '%s|%s' % (identity['serial'], identity.get('firmware', ''))
+
+
+def _load_cache():
+    try:
+        with open(CONF.xcat.inspect_cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        cache = {}
+    cache.setdefault('inventory', {})
+    cache.setdefault('nodes', {})
+    return cache
+
+
+def _save_cache(cache):
+    path = CONF.xcat.inspect_cache_file
+    tmp = '%s.tmp' % path
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        LOG.warning(_("Failed to save the xcat inspection cache: %s"), e)
+
+
+def _rinv(nodes, args):
+    """Run rinv on chunks of nodes concurrently.
+
+    :returns: dict of xcat node name to the list of its output lines.
+    """
+    chunks = list(xcat_util._chunks(list(nodes), CONF.xcat.inspect_chunk_size))
+
+    def _run(chunk):
+        lines = {}
+        for record in xcat_util.stream_xcatcmd(
+                chunk, 'rinv', args, priority=xcat_util.PRIORITY_READ):
+            if record.error:
+                LOG.debug("rinv error for node %(node)s: %(error)s",
+                          {'node': record.node, 'error': record.value})
+                continue
+            lines.setdefault(record.node, []).append(record.value)
+        return lines
+
+    result = {}
+    for chunk, lines, error in xcat_util.run_concurrently(
+            _run, chunks, CONF.xcat.inspect_parallel_chunks):
+        if error is not None:
+            LOG.warning(_("rinv %(args)s failed for %(count)d nodes: "
+                          "%(error)s"), {'args': args, 'count': len(chunk),
+                                         'error': error})
+            continue
+        result.update(lines)
+    return result
+
+
+def inspect_nodes(nodes, refresh=False):
+    """Inventory many xcat nodes.
+
+    A cheap rinv vpd identifies every node by serial number and firmware,
+    only the nodes whose identity is not cached run the full rinv all.
+    The cache is locked while it is read and written, not while rinv
+    runs, so a single node inspection does not wait for a batch.
+
+    :param nodes: list of xcat node names or a noderange string.
+    :param refresh: ignore the cached inventories.
+    :returns: dict of xcat node name to its inventory, see
+        parse_inventory; nodes rinv did not answer for are left out.
+    """
+    nodes = xcat_util.expand_noderange(nodes)
+    keys = dict((xcat_node, _cache_key(parse_inventory(lines)))
+                for xcat_node, lines in _rinv(nodes, 'vpd').items())
+    result = {}
+    todo = []
+    with lockutils.lock(CACHE_SEMAPHORE, 'xcat-inspect-'):
+        inventories = _load_cache()['inventory']
+        for xcat_node, key in keys.items():
+            if key and key in inventories and not refresh:
+                result[xcat_node] = inventories[key]
+            else:
+                todo.append(xcat_node)
+    cached = len(result)
+    inspected = {}
+    if todo:
+        for xcat_node, lines in _rinv(todo, 'all').items():
+            inspected[xcat_node] = parse_inventory(lines)
+    result.update(inspected)
+    with lockutils.lock(CACHE_SEMAPHORE, 'xcat-inspect-'):
+        cache = _load_cache()
+        for xcat_node in result:
+            if xcat_node in inspected:
+                key = _cache_key(inspected[xcat_node])
+                if not key:
+                    continue
+                cache['inventory'][key] = inspected[xcat_node]
+            else:
+                key = keys[xcat_node]
+            cache['nodes'][xcat_node] = key
+        _save_cache(cache)
+    LOG.info(_("Inspected %(count)d xcat nodes, %(cached)d from the cache"),
+             {'count': len(result), 'cached': cached})
+    return result
+
+
+def cached_inventory(xcat_node):
+    """Return the last inventory of a node, None if never inspected."""
+    cache = _load_cache()
+    key = cache['nodes'].get(xcat_node)
+    return cache['inventory'].get(key) if key else None
+
+
+class InspectJob(object):
+    """State of one batch inspection running in the background."""
+
+    def __init__(self, nodes, refresh):
+        self.id = str(uuid.uuid4())
+        self.nodes = nodes
+        self.refresh = refresh
+        self.results = {}
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def run(self):
+        try:
+            self.results = inspect_nodes(self.nodes, self.refresh)
+        except Exception as e:
+            LOG.exception(_("Inspection job %(job)s failed: %(error)s"),
+                          {'job': self.id, 'error': e})
+            self.error = str(e)
+        self.finished_at = time.time()
+
+    def status(self, xcat_node=None):
+        """Return the progress, with the inventory of one node if given."""
+        end = self.finished_at or time.time()
+        status = {'id': self.id,
+                  'nodes': self.nodes,
+                  'running': self.finished_at is None,
+                  'error': self.error,
+                  'elapsed': end - self.started_at,
+                  'inspected': sorted(self.results)}
+        if xcat_node is not None:
+            status['inventory'] = self.results.get(xcat_node)
+        return status
+
+
+def _forget_old_jobs():
+    finished = sorted((j for j in _jobs.values() if j.finished_at),
+                      key=lambda j: j.finished_at)
+    for job in finished[:max(len(finished) - CONF.xcat.inspect_jobs_kept,
+                             0)]:
+        _jobs.pop(job.id, None)
+
+
+def start(nodes, refresh=False):
+    """Start a batch inspection in the background.
+
+    :param nodes: list of xcat node names or a noderange string.
+    :param refresh: ignore the cached inventories.
+    :returns: the InspectJob.
+    """
+    job = InspectJob(nodes, refresh)
+    with _jobs_lock:
+        _forget_old_jobs()
+        _jobs[job.id] = job
+    eventlet.spawn_n(job.run)
+    return job
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+def list_jobs():
+    return [job.status() for job in _jobs.values()]
+
+
+def _create_ports(task, macs):
+    from ironic import objects
+    known = set(p.address.lower() for p in task.ports)
+    created = []
+    for mac in macs:
+        if mac in known:
+            continue
+        port = objects.Port(task.context, address=mac,
+                            node_id=task.node.id)
+        try:
+            port.create()
+        except exception.MACAlreadyExists:
+            LOG.warning(_("Port %(mac)s of node %(node)s exists on another "
+                          "node"), {'mac': mac, 'node': task.node.uuid})
+            continue
+        created.append(mac)
+    return created
+
+
+def apply_inventory(task, inventory):
+    """Write an inventory to the node properties and create its ports.
+
+    :returns: dict of the properties set and the MACs of the new ports.
+    """
+    properties = dict(task.node.properties or {})
+    updated = {}
+    for key in ('cpus', 'memory_mb', 'local_gb', 'cpu_arch'):
+        if key in inventory:
+            updated[key] = inventory[key]
+    if 'cpu_arch' not in properties and 'cpu_arch' not in updated:
+        updated['cpu_arch'] = CONF.xcat.inspect_default_cpu_arch
+    properties.update(updated)
+    task.node.properties = properties
+    task.node.save()
+    return {'properties': updated,
+            'ports': _create_ports(task, inventory.get('macs', []))}
+
+
+class XcatInspect(base.VendorInterface):
+    """Hardware inspection through xcat rinv.
+
+    node method inspect_hardware: inventory the node, or take the result
+    of an earlier batch, and update its properties and ports.
+    driver method inspect_nodes: start the inventory of a noderange in
+    batches in the background and return the job; the following
+    inspect_hardware calls of those nodes use the result.
+    driver method get_inspection_status: status of the job given by
+    job_id, of every job when not given; with node, the inventory of
+    that xcat node.
+    """
+
+    NODE_METHODS = ('inspect_hardware',)
+    DRIVER_METHODS = ('inspect_nodes', 'get_inspection_status')
+
+    def validate(self, task, **kwargs):
+        method = kwargs.get('method')
+        if method not in self.NODE_METHODS:
+            raise exception.InvalidParameterValue(_(
+                "Unsupported method (%s) passed to xcat driver.")
+                % method)
+        if not (task.node.driver_info or {}).get('xcat_node'):
+            raise exception.InvalidParameterValue(_(
+                "xcat node name not supplied to xcat baremetal driver."))
+
+    @task_manager.require_exclusive_lock
+    def vendor_passthru(self, task, **kwargs):
+        xcat_node = task.node.driver_info['xcat_node']
+        refresh = kwargs.get('refresh') in (True, 'true', 'True', '1')
+        inventory = None if refresh else cached_inventory(xcat_node)
+        if inventory is None:
+            inventory = inspect_nodes([xcat_node], refresh).get(xcat_node)
+        if not inventory:
+            raise xcat_exception.xCATInspectionFailure(
+                node=task.node.uuid,
+                error=_("rinv returned no inventory for xcat node %s")
+                % xcat_node)
+        return apply_inventory(task, inventory)
+
+    def driver_vendor_passthru(self, context, method, **kwargs):
+        if method == 'get_inspection_status':
+            job_id = kwargs.get('job_id')
+            if not job_id:
+                return list_jobs()
+            job = get_job(job_id)
+            if job is None:
+                raise exception.InvalidParameterValue(_(
+                    "Unknown inspection job %s.") % job_id)
+            return job.status(kwargs.get('node'))
+        if method != 'inspect_nodes':
+            raise exception.InvalidParameterValue(_(
+                "Unsupported method (%s) passed to xcat driver.")
+                % method)
+        nodes = kwargs.get('nodes')
+        if not nodes:
+            raise exception.InvalidParameterValue(_(
+                "inspect_nodes needs a xcat noderange in 'nodes'."))
+        refresh = kwargs.get('refresh') in (True, 'true', 'True', '1')
+        return start(nodes, refresh).status()
@@ -0,0 +1,326 @@
+"""
+ledger of the per node state the xcat baremetal driver creates outside
+ironic: iptables DROP rules in the qdhcp namespaces of the network node,
+neutron port dhcp options, /etc/hosts lines and xcat dhcp entries.  The
+ledger is persisted so the state can be released idempotently on
+tear_down/clean_up, and a periodic reconciler removes the DROP rules
+nobody owns any more.
+"""
+
+import json
+import os
+import re
+
+from oslo.config import cfg
+
+from ironic.common import context
+from ironic.common import exception
+from ironic.common import paths
+from ironic.drivers.modules import xcat_neutron
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import lockutils
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import processutils
+
+xcat_opts = [
+    cfg.StrOpt('ledger_file',
+               default=paths.state_path_def('xcat_ledger.json'),
+               help='File persisting the network node rules, hosts lines '
+               'and dhcp entries created for every node'),
+    cfg.IntOpt('ledger_reconcile_interval',
+               default=600,
+               help='Interval (seconds) to remove orphaned iptables rules '
+               'from the network node, 0 disables the reconciler'),
+    cfg.StrOpt('ledger_reconcile_scope',
+               default='ledger',
+               help='Which DROP rules the reconciler may remove: "ledger" '
+               'only rules for MACs this conductor manages, "all" '
+               'every MAC DROP rule not in the ledger.  The ledger file '
+               'belongs to one conductor, so both scopes are only safe '
+               'with a single conductor'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+LEDGER_SEMAPHORE = 'xcat_ledger'
+# the host file is shared with PXEDeploy._config_host_file
+HOSTS_SEMAPHORE = 'xcat_pxe'
+
+KIND_IPTABLES = 'iptables'
+KIND_HOSTS = 'hosts'
+KIND_DHCP = 'dhcp'
+KIND_DHCP_OPTS = 'dhcp_opts'
+# the state keeping neutron from answering the network boot of a node
+DHCP_SUPPRESSION_KINDS = [KIND_IPTABLES, KIND_DHCP_OPTS]
+
+DROP_RULE_RE = re.compile(r'^-A INPUT -m mac --mac-source (\S+) -j DROP$')
+NETNS_MARK = 'XCAT_NETNS '
+
+
+def _empty():
+    return {'nodes': {}, 'known_macs': []}
+
+
+def _load():
+    try:
+        with open(CONF.xcat.ledger_file) as f:
+            ledger = json.load(f)
+    except (IOError, OSError):
+        return _empty()
+    except ValueError:
+        LOG.warning(_("Ignoring the corrupted xcat ledger %s"),
+                    CONF.xcat.ledger_file)
+        return _empty()
+    ledger.setdefault('nodes', {})
+    ledger.setdefault('known_macs', [])
+    return ledger
+
+
+def _save(ledger):
+    path = CONF.xcat.ledger_file
+    tmp = '%s.tmp' % path
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(ledger, f, indent=1, sort_keys=True)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        LOG.warning(_("Failed to save the xcat ledger: %s"), e)
+
+
+def _same(entry, kind, attrs):
+    if entry['kind'] != kind:
+        return False
+    for key, value in attrs.items():
+        if entry.get(key) != value:
+            return False
+    return True
+
+
+@lockutils.synchronized(LEDGER_SEMAPHORE, 'xcat-ledger-')
+def record(node_uuid, kind, **attrs):
+    """Record a piece of state created for a node.
+
+    Record before creating the state, so a crash in between leaves a
+    ledger entry and not an untracked rule.
+    """
+    ledger = _load()
+    entries = ledger['nodes'].setdefault(node_uuid, [])
+    for entry in entries:
+        if _same(entry, kind, attrs):
+            entry.pop('pending_delete', None)
+            break
+    else:
+        entry = dict(attrs)
+        entry['kind'] = kind
+        entries.append(entry)
+    if kind == KIND_IPTABLES:
+        mac = attrs['mac'].lower()
+        if mac not in ledger['known_macs']:
+            ledger['known_macs'].append(mac)
+    _save(ledger)
+
+
+@lockutils.synchronized(LEDGER_SEMAPHORE, 'xcat-ledger-')
+def forget(node_uuid, kind, **attrs):
+    """Drop the ledger entries of a node matching kind and attrs."""
+    ledger = _load()
+    entries = ledger['nodes'].get(node_uuid, [])
+    remaining = [e for e in entries if not _same(e, kind, attrs)]
+    if len(remaining) == len(entries):
+        return
+    if remaining:
+        ledger['nodes'][node_uuid] = remaining
+    else:
+        ledger['nodes'].pop(node_uuid, None)
+    if kind == KIND_IPTABLES and 'mac' in attrs:
+        # the rules of the MAC are gone, stop claiming it
+        mac = attrs['mac'].lower()
+        if not any(e['kind'] == KIND_IPTABLES and e['mac'].lower() == mac
+                   for node_entries in ledger['nodes'].values()
+                   for e in node_entries):
+            ledger['known_macs'] = [m for m in ledger['known_macs']
+                                    if m != mac]
+    _save(ledger)
+
+
+@lockutils.synchronized(LEDGER_SEMAPHORE, 'xcat-ledger-')
+def _mark_pending(node_uuid, entries):
+    ledger = _load()
+    for entry in ledger['nodes'].get(node_uuid, []):
+        for failed in entries:
+            if _same(entry, failed['kind'], dict(
+                    (k, v) for k, v in failed.items()
+                    if k not in ('kind', 'pending_delete'))):
+                entry['pending_delete'] = True
+    _save(ledger)
+
+
+def entries(node_uuid):
+    """Return the ledger entries of a node."""
+    return list(_load()['nodes'].get(node_uuid, []))
+
+
+def _delete_rule_cmd(netns, mac):
+    return ('sudo ip netns exec %s iptables -D INPUT -m mac --mac-source %s '
+            '-j DROP' % (netns, mac))
+
+
+def _ssh(cmds):
+    return xcat_util.xcat_ssh(CONF.xcat.network_node_ip, CONF.xcat.ssh_port,
+                              CONF.xcat.ssh_user, CONF.xcat.ssh_password,
+                              cmds)
+
+
+@lockutils.synchronized(HOSTS_SEMAPHORE, 'xcat-hosts-')
+def remove_host_entry(xcat_node):
+    """Remove the lines of the node from the host file."""
+    with open(CONF.xcat.host_filepath, 'r+') as f:
+        lines = []
+        changed = False
+        for line in f:
+            fields = line.split('#')[0].split()
+            if len(fields) > 1 and xcat_node in fields[1:]:
+                changed = True
+                continue
+            lines.append(line)
+        if changed:
+            f.seek(0)
+            f.truncate()
+            f.writelines(lines)
+
+
+def release(node_uuid, kinds=None):
+    """Remove the state recorded for a node, idempotently.
+
+    All iptables rules of the node are deleted in one ssh session.
+    Entries whose removal failed stay in the ledger marked
+    pending_delete and are retried by the reconciler.
+
+    :param node_uuid: the node to clean up.
+    :param kinds: optional list of the entry kinds to release, all
+        kinds when not given.
+    """
+    todo = [e for e in entries(node_uuid)
+            if kinds is None or e['kind'] in kinds]
+    if not todo:
+        return
+    failed = []
+    rules = [e for e in todo if e['kind'] == KIND_IPTABLES]
+    if rules:
+        try:
+            _ssh([_delete_rule_cmd(e['netns'], e['mac']) for e in rules])
+        except Exception as e:
+            LOG.warning(_("Failed to delete the dhcp rules of node "
+                          "%(node)s: %(error)s"),
+                        {'node': node_uuid, 'error': e})
+            failed.extend(rules)
+    for entry in todo:
+        try:
+            if entry['kind'] == KIND_HOSTS:
+                remove_host_entry(entry['name'])
+            elif entry['kind'] == KIND_DHCP:
+                xcat_util.xcat_execute(['makedhcp', '-d', entry['name']])
+            elif entry['kind'] == KIND_DHCP_OPTS:
+                xcat_neutron.restore_port_dhcp_opts(
+                    context.get_admin_context(), entry['port_id'],
+                    entry['previous'])
+        except (processutils.ProcessExecutionError, IOError, OSError,
+                exception.IronicException) as e:
+            LOG.warning(_("Failed to release %(kind)s state of node "
+                          "%(node)s: %(error)s"),
+                        {'kind': entry['kind'], 'node': node_uuid,
+                         'error': e})
+            failed.append(entry)
+    for entry in todo:
+        if entry not in failed:
+            attrs = dict((k, v) for k, v in entry.items()
+                         if k not in ('kind', 'pending_delete'))
+            forget(node_uuid, entry['kind'], **attrs)
+    if failed:
+        _mark_pending(node_uuid, failed)
+
+
+def _list_rules():
+    """Return {netns: [mac, ...]} of the DROP rules on the network node.
+
+    One shell loop lists the INPUT chain of every qdhcp namespace so the
+    whole network node is read in a single ssh round trip.
+    """
+    cmd = ("for ns in $(ip netns list | awk '/^qdhcp-/{print $1}'); do "
+           "echo %s$ns; sudo ip netns exec $ns iptables -S INPUT; done"
+           % NETNS_MARK)
+    return _parse_rules(_ssh([cmd])[0])
+
+
+def _parse_rules(output):
+    """Parse the iptables -S listing of _list_rules into {netns: [mac]}."""
+    rules = {}
+    netns = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith(NETNS_MARK):
+            netns = line[len(NETNS_MARK):]
+            rules.setdefault(netns, [])
+            continue
+        match = DROP_RULE_RE.match(line)
+        if netns and match:
+            rules[netns].append(match.group(1).lower())
+    return rules
+
+
+def reconcile():
+    """Remove the DROP rules no ledger entry owns, in one ssh session.
+
+    :returns: list of (netns, mac) of the rules removed.
+    """
+    ledger = _load()
+    has_rules = any(e['kind'] == KIND_IPTABLES
+                    for node_entries in ledger['nodes'].values()
+                    for e in node_entries)
+    if CONF.xcat.dhcp_suppression != 'iptables' and not has_rules:
+        # no ssh to the network node when no rules were created
+        rules = {}
+    else:
+        rules = _list_rules()
+    # a deploy may have recorded a rule during the ssh round trip, diff
+    # against the ledger as it is now
+    ledger = _load()
+    owned = set()
+    for node_uuid, node_entries in ledger['nodes'].items():
+        for entry in node_entries:
+            if (entry['kind'] == KIND_IPTABLES and
+                    not entry.get('pending_delete')):
+                owned.add((entry['netns'], entry['mac'].lower()))
+    known = set(ledger['known_macs'])
+    everything = CONF.xcat.ledger_reconcile_scope == 'all'
+
+    orphans = []
+    for netns, macs in rules.items():
+        for mac in macs:
+            if (netns, mac) in owned:
+                continue
+            if everything or mac in known:
+                orphans.append((netns, mac))
+    if orphans:
+        LOG.info(_("Removing %d orphaned dhcp rules from the network node"),
+                 len(orphans))
+        _ssh([_delete_rule_cmd(netns, mac) for netns, mac in orphans])
+
+    # the pending entries are gone from the network node now
+    for node_uuid, node_entries in ledger['nodes'].items():
+        for entry in node_entries:
+            if (entry['kind'] == KIND_IPTABLES and
+                    entry.get('pending_delete')):
+                forget(node_uuid, KIND_IPTABLES, netns=entry['netns'],
+                       mac=entry['mac'])
+    # retry the hosts and dhcp entries whose release failed before
+    for node_uuid, node_entries in ledger['nodes'].items():
+        kinds = set(e['kind'] for e in node_entries
+                    if e.get('pending_delete') and
+                    e['kind'] != KIND_IPTABLES)
+        if kinds:
+            release(node_uuid, kinds=list(kinds))
+    return orphans
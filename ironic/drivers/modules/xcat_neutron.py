@@ -3,17 +3,54 @@ Get the network from neutron
 This is a xcat patch for the ironic/common/neutron.py
 """
 
-from neutronclient.common import exceptions as neutron_client_exc
+from oslo.config import cfg
+
 from ironic.common import exception
+from ironic.openstack.common import importutils
 from ironic.openstack.common import log as logging
-from ironic.common import neutron
 from ironic.drivers.modules import xcat_exception
 
+xcat_opts = [
+    cfg.StrOpt('dhcp_suppression',
+               default='iptables',
+               help='How neutron is kept from answering the network boot '
+               'of a deploying node: "iptables" drops its dhcp requests '
+               'in the qdhcp namespace over ssh, "neutron" sets extra '
+               'dhcp options on its neutron port pointing the network '
+               'boot at xcat'),
+    cfg.StrOpt('dhcp_next_server',
+               default=None,
+               help='Address of the xcat tftp server neutron sends '
+               'deploying nodes to with dhcp_suppression=neutron'),
+    cfg.StrOpt('dhcp_bootfile',
+               default='xcat/xnba.kpxe',
+               help='Boot file neutron hands deploying nodes with '
+               'dhcp_suppression=neutron'),
+    ]
+
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+# neutronclient is slow to import, ironic.common.neutron and the client
+# exceptions are imported on first use, see _neutron()
+neutron = None
+neutron_client_exc = None
+
+
+def _neutron():
+    """Import ironic.common.neutron and neutronclient on first use."""
+    global neutron, neutron_client_exc
+    if neutron is None:
+        neutron_client_exc = importutils.import_module(
+            'neutronclient.common.exceptions')
+        neutron = importutils.import_module('ironic.common.neutron')
+    return neutron
+
 def get_vif_port_info(task, port_id):
     """ Get  detail port info from neutron with a given port id """
-    api = neutron.NeutronAPI(task.context)
+    api = _neutron().NeutronAPI(task.context)
     try:
         port_info = api.client.show_port(port_id)
     except neutron_client_exc.NeutronClientException:
@@ -24,7 +61,7 @@ def get_vif_port_info(task, port_id):
 
 def get_ports_info_from_neutron(task):
     """  Get neutron port info from neutron about this task """
-    vifs = neutron.get_node_vif_ids(task)
+    vifs = _neutron().get_node_vif_ids(task)
     if not vifs:
         LOG.warning(_("No VIFs found for node %(node)s when attempting to "
                       "update Neutron DHCP BOOT options."),
@@ -39,3 +76,61 @@ def get_ports_info_from_neutron(task):
             failures.append(port_vif)
     return vif_ports_info
 
+
+DHCP_SUPPRESSION_MODES = ('iptables', 'neutron')
+
+
+def check_dhcp_suppression():
+    """Check the dhcp suppression options.
+
+    :raises: InvalidParameterValue for an unknown mode or a neutron mode
+        without dhcp_next_server.
+    """
+    if CONF.xcat.dhcp_suppression not in DHCP_SUPPRESSION_MODES:
+        raise exception.InvalidParameterValue(_(
+            "dhcp_suppression must be one of %(modes)s, not %(mode)s.")
+            % {'modes': ', '.join(DHCP_SUPPRESSION_MODES),
+               'mode': CONF.xcat.dhcp_suppression})
+    if (CONF.xcat.dhcp_suppression == 'neutron' and
+            not CONF.xcat.dhcp_next_server):
+        raise exception.InvalidParameterValue(_(
+            "dhcp_next_server must be set with dhcp_suppression=neutron."))
+
+
+def xcat_dhcp_opts():
+    """Return the extra dhcp options sending the network boot to xcat."""
+    if not CONF.xcat.dhcp_next_server:
+        raise exception.InvalidParameterValue(_(
+            "dhcp_next_server must be set with dhcp_suppression=neutron."))
+    return [{'opt_name': 'bootfile-name',
+             'opt_value': CONF.xcat.dhcp_bootfile},
+            {'opt_name': 'server-ip-address',
+             'opt_value': CONF.xcat.dhcp_next_server},
+            {'opt_name': 'tftp-server',
+             'opt_value': CONF.xcat.dhcp_next_server}]
+
+
+def port_dhcp_opts(port_info):
+    """Return the extra dhcp options of a port as name/value dicts."""
+    return [{'opt_name': o['opt_name'], 'opt_value': o['opt_value']}
+            for o in port_info['port'].get('extra_dhcp_opts') or []]
+
+
+def set_port_dhcp_opts(context, port_id, dhcp_opts):
+    """Update the extra dhcp options of a neutron port.
+
+    :param context: request context, an admin context for background
+        work.
+    :param dhcp_opts: list of opt_name/opt_value dicts, a None value
+        removes the option.
+    """
+    _neutron().NeutronAPI(context).update_port_dhcp_opts(port_id, dhcp_opts)
+
+
+def restore_port_dhcp_opts(context, port_id, previous):
+    """Put back the extra dhcp options a port had before the deploy."""
+    names = set(o['opt_name'] for o in previous)
+    opts = list(previous)
+    opts.extend({'opt_name': o['opt_name'], 'opt_value': None}
+                for o in xcat_dhcp_opts() if o['opt_name'] not in names)
+    set_port_dhcp_opts(context, port_id, opts)
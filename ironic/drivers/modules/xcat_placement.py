@@ -0,0 +1,175 @@
+"""
+install server placement for the xcat baremetal driver
+spread the concurrent installs over the xcat servers of
+CONF.xcat.install_servers: every deploy is placed on the server with the
+fewest installs in flight, servers in the rack of the node preferred,
+and the node is pointed at it with chdef before nodeset
+"""
+
+import threading
+
+from oslo.config import cfg
+
+from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_state
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import log as logging
+
+xcat_opts = [
+    cfg.ListOpt('install_servers',
+                default=[],
+                help='xcat servers the nodes install from, as address or '
+                'address:rack; empty installs every node from its '
+                'driver_info xcatmaster'),
+    cfg.IntOpt('install_server_rack_weight',
+               default=2,
+               help='In-flight installs a server in the rack of the node '
+               'may have above the least loaded server and still be '
+               'preferred'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+# the node attributes pointing the install at a server
+SERVER_ATTRS = ('xcatmaster', 'nfsserver', 'tftpserver')
+
+
+class InstallServers(object):
+    """In-flight installs of every configured install server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._placed = {}
+
+    def _configured(self):
+        servers = []
+        for entry in CONF.xcat.install_servers:
+            address, sep, rack = entry.strip().partition(':')
+            if address:
+                servers.append((address, rack or None))
+        return servers
+
+    def _server(self, address, rack=None):
+        return self._servers.setdefault(address, {'rack': rack,
+                                                  'in_flight': 0,
+                                                  'placed': 0,
+                                                  'completed': 0,
+                                                  'failed': 0})
+
+    def choose(self, xcat_node, rack=None):
+        """Reserve the server the install of a node should use.
+
+        The server is picked and its in-flight count raised under one
+        lock, so concurrent deploys spread over the servers.
+
+        :returns: the address of the server, None when no install
+            servers are configured.
+        """
+        servers = self._configured()
+        if not servers:
+            return None
+        weight = CONF.xcat.install_server_rack_weight
+        with self._lock:
+            for address, server_rack in servers:
+                self._server(address)['rack'] = server_rack
+
+            def score(server):
+                address, server_rack = server
+                stats = self._servers[address]
+                local = rack is not None and server_rack == rack
+                return (stats['in_flight'] - (weight if local else 0),
+                        stats['placed'], address)
+            address = min(servers, key=score)[0]
+            if xcat_node in self._placed:
+                self._release(xcat_node, ok=False)
+            stats = self._servers[address]
+            stats['in_flight'] += 1
+            stats['placed'] += 1
+            self._placed[xcat_node] = address
+            return address
+
+    def cancel(self, xcat_node):
+        """Undo the reservation of an install that did not start."""
+        with self._lock:
+            address = self._placed.pop(xcat_node, None)
+            if address is not None:
+                self._servers[address]['in_flight'] -= 1
+                self._servers[address]['placed'] -= 1
+
+    def _release(self, xcat_node, ok):
+        address = self._placed.pop(xcat_node, None)
+        if address is None:
+            return
+        stats = self._servers[address]
+        stats['in_flight'] -= 1
+        stats['completed' if ok else 'failed'] += 1
+
+    def release(self, xcat_node, ok=True):
+        with self._lock:
+            self._release(xcat_node, ok)
+
+    def placed(self, xcat_node):
+        """Return the server of an install in flight, None if none."""
+        return self._placed.get(xcat_node)
+
+    def get_stats(self):
+        with self._lock:
+            return dict((address, dict(stats))
+                        for address, stats in self._servers.items())
+
+
+SERVERS = InstallServers()
+
+
+def _node_rack(driver_info):
+    rack = driver_info.get('rack')
+    if rack:
+        return rack
+    attrs = xcat_state.STATE.get(driver_info['xcat_node'], 'attrs',
+                                 CONF.xcat.state_cache_ttl) or {}
+    return attrs.get('rack')
+
+
+def place(driver_info):
+    """Pick the install server of a deploy and point the node at it.
+
+    :param driver_info: xcat node deploy info.
+    :returns: the address of the server, None when no install servers
+        are configured or the node could not be changed.
+    """
+    xcat_node = driver_info['xcat_node']
+    address = SERVERS.choose(xcat_node, _node_rack(driver_info))
+    if address is None:
+        return None
+    args = ' '.join('%s=%s' % (attr, address) for attr in SERVER_ATTRS)
+    try:
+        xcat_util.exec_xcatcmd(driver_info, 'chdef', args)
+    except xcat_exception.xCATCmdFailure as e:
+        SERVERS.cancel(xcat_node)
+        LOG.warning(_("Failed to place the install of node %(node)s on "
+                      "%(server)s: %(error)s"),
+                    {'node': xcat_node, 'server': address, 'error': e})
+        return None
+    finally:
+        xcat_state.STATE.invalidate(xcat_node, 'attrs')
+    LOG.info(_("Node %(node)s installs from %(server)s"),
+             {'node': xcat_node, 'server': address})
+    return address
+
+
+def release(xcat_node, ok=True):
+    """Account the end of the install of a node."""
+    SERVERS.release(xcat_node, ok)
+
+
+def placed(xcat_node):
+    return SERVERS.placed(xcat_node)
+
+
+def get_stats():
+    """Return the placement counters of every install server."""
+    return SERVERS.get_stats()
@@ -0,0 +1,420 @@
+"""
+warm pool for the xcat baremetal driver
+idle nodes of CONF.xcat.warm_pool_noderange are installed in the
+background with the most requested osimages, so a deploy of such a
+node with the same image only reconfigures the network and reboots
+instead of waiting for a full install.  A pool install holds the ironic
+node lock while it starts and keeps the node in maintenance until it is
+done, so deploys and the power sync leave the node alone meanwhile.  The
+pool state, the image popularity and the hit metrics are persisted in
+CONF.xcat.warm_pool_file.
+"""
+
+import json
+import os
+import time
+
+from oslo.config import cfg
+
+from ironic.common import context
+from ironic.common import exception
+from ironic.common import paths
+from ironic.common import states
+from ironic.conductor import task_manager
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import lockutils
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import processutils
+
+xcat_opts = [
+    cfg.IntOpt('warm_pool_size',
+               default=0,
+               help='Number of idle nodes kept installed with popular '
+               'osimages, 0 disables the warm pool'),
+    cfg.StrOpt('warm_pool_noderange',
+               default=None,
+               help='xcat noderange of the nodes the warm pool may install '
+               'while they are idle, they need an install ip defined in '
+               'xcat'),
+    cfg.IntOpt('warm_pool_images',
+               default=3,
+               help='Maximum number of distinct osimages kept warm'),
+    cfg.FloatOpt('warm_pool_decay',
+                 default=0.95,
+                 help='Factor applied to the popularity of every image on '
+                 'each deploy request, lower values follow shifts in '
+                 'popularity faster'),
+    cfg.IntOpt('warm_pool_interval',
+               default=300,
+               help='Interval (seconds) to check the pool installs and '
+               'start new ones'),
+    cfg.IntOpt('warm_pool_install_timeout',
+               default=3600,
+               help='Seconds after which a pool install is considered '
+               'failed'),
+    cfg.StrOpt('warm_pool_file',
+               default=paths.state_path_def('xcat_warm_pool.json'),
+               help='File persisting the warm pool state'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+POOL_SEMAPHORE = 'xcat_pool'
+
+IDLE = 'idle'
+INSTALLING = 'installing'
+READY = 'ready'
+
+STAT_KEYS = ('hits', 'misses', 'installs', 'failed', 'evictions')
+
+# pool installs never delay the commands of real deploys
+POOL_PRIORITY = xcat_util.PRIORITY_READ
+
+_state = [None]
+
+
+def enabled():
+    return bool(CONF.xcat.warm_pool_size and CONF.xcat.warm_pool_noderange)
+
+
+def _empty():
+    return {'nodes': {},
+            'popularity': {},
+            'stats': dict((k, 0) for k in STAT_KEYS)}
+
+
+def _load():
+    if _state[0] is not None:
+        return _state[0]
+    try:
+        with open(CONF.xcat.warm_pool_file) as f:
+            state = json.load(f)
+    except (IOError, OSError):
+        state = _empty()
+    except ValueError:
+        LOG.warning(_("Ignoring the corrupted xcat warm pool state %s"),
+                    CONF.xcat.warm_pool_file)
+        state = _empty()
+    for key, value in _empty().items():
+        state.setdefault(key, value)
+    _state[0] = state
+    return state
+
+
+def _save(state):
+    path = CONF.xcat.warm_pool_file
+    tmp = '%s.tmp' % path
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        LOG.warning(_("Failed to save the xcat warm pool state: %s"), e)
+
+
+@lockutils.synchronized(POOL_SEMAPHORE, 'xcat-pool-')
+def record_request(image):
+    """Count a deploy request of an osimage for the popularity."""
+    if not enabled() or not image:
+        return
+    state = _load()
+    popularity = state['popularity']
+    for name in list(popularity):
+        popularity[name] *= CONF.xcat.warm_pool_decay
+        if popularity[name] < 0.01:
+            del popularity[name]
+    popularity[image] = popularity.get(image, 0.0) + 1.0
+    _save(state)
+
+
+@lockutils.synchronized(POOL_SEMAPHORE, 'xcat-pool-')
+def claim(task, xcat_node, image):
+    """Take a node out of the pool for a deploy.
+
+    :param task: the deploy task, holding the exclusive node lock.
+    :returns: True if the node is installed with the image already.
+    """
+    if not enabled():
+        return False
+    state = _load()
+    entry = state['nodes'].pop(xcat_node, None)
+    hit = (entry is not None and entry['state'] == READY and
+           entry.get('image') == image)
+    state['stats']['hits' if hit else 'misses'] += 1
+    _save(state)
+    if entry is not None and entry.get('maintenance'):
+        _leave_maintenance(task.node)
+    if hit:
+        LOG.info(_("Warm pool hit, node %(node)s is installed with "
+                   "%(image)s"), {'node': xcat_node, 'image': image})
+    return hit
+
+
+@lockutils.synchronized(POOL_SEMAPHORE, 'xcat-pool-')
+def mark_idle(xcat_node, node_uuid):
+    """Offer a torn down node to the pool.
+
+    :param xcat_node: the xcat node name.
+    :param node_uuid: the uuid of its ironic node.
+    """
+    if not enabled() or not xcat_node:
+        return
+    state = _load()
+    state['nodes'][xcat_node] = {'state': IDLE, 'image': None,
+                                 'node': node_uuid, 'since': time.time()}
+    _save(state)
+
+
+def targets(popularity, size=None, images=None):
+    """Split the pool slots among the most popular images.
+
+    :returns: dict of image name to its number of pool nodes.
+    """
+    size = CONF.xcat.warm_pool_size if size is None else size
+    images = CONF.xcat.warm_pool_images if images is None else images
+    top = sorted(popularity.items(), key=lambda kv: (-kv[1], kv[0]))
+    top = top[:min(images, size)]
+    total = sum(score for name, score in top)
+    if not total:
+        return {}
+    shares = [(name, size * score / total) for name, score in top]
+    result = dict((name, int(share)) for name, share in shares)
+    # hand the slots left by rounding down to the largest remainders
+    left = size - sum(result.values())
+    for name, share in sorted(shares, key=lambda s: -(s[1] - int(s[1]))):
+        if left <= 0:
+            break
+        result[name] += 1
+        left -= 1
+    return dict((name, count) for name, count in result.items() if count)
+
+
+def _pool_members():
+    out, err = xcat_util.xcat_execute(
+        ['nodels', CONF.xcat.warm_pool_noderange], POOL_PRIORITY)
+    return set(line.strip() for line in out.splitlines() if line.strip())
+
+
+def _leave_maintenance(node):
+    """Take a node out of the maintenance a pool install put it in."""
+    if node.maintenance:
+        node.maintenance = False
+        node.save()
+
+
+def _in_use(node):
+    return (node.instance_uuid is not None or
+            node.provision_state != states.NOSTATE)
+
+
+def _still_installing(xcat_node, entry, image, node):
+    """Whether a pool install still owns the node, checked under its lock.
+
+    A deploy which claimed the node meanwhile replaced the entry.
+    """
+    return (_load()['nodes'].get(xcat_node) is entry and
+            entry['state'] == INSTALLING and entry['image'] == image and
+            not _in_use(node))
+
+
+def _start_install(xcat_node, image):
+    """Start the install of a pool node under its ironic node lock.
+
+    The entry is checked again under the lock, a deploy which claimed
+    the node meanwhile keeps it.  The node stays in maintenance until
+    the install is done, so it is neither scheduled nor power synced.
+
+    :returns: True if the install was started.
+    """
+    entry = _load()['nodes'].get(xcat_node)
+    if entry is None or not entry.get('node'):
+        return False
+    with task_manager.acquire(context.get_admin_context(),
+                              entry['node']) as task:
+        if not _still_installing(xcat_node, entry, image, task.node):
+            return False
+        if not task.node.maintenance:
+            task.node.maintenance = True
+            task.node.save()
+            _update(xcat_node, INSTALLING, maintenance=True)
+        for cmd in (['nodeset', xcat_node, 'osimage=%s' % image],
+                    ['rsetboot', xcat_node, 'net'],
+                    ['rpower', xcat_node, 'boot']):
+            xcat_util.xcat_execute(cmd, POOL_PRIORITY)
+    return True
+
+
+def _release_maintenance():
+    """Clear the maintenance of the nodes whose pool install ended."""
+    for xcat_node, entry in list(_load()['nodes'].items()):
+        if entry['state'] == INSTALLING or not entry.get('maintenance'):
+            continue
+        try:
+            with task_manager.acquire(context.get_admin_context(),
+                                      entry['node']) as task:
+                _leave_maintenance(task.node)
+        except exception.NodeNotFound:
+            pass
+        except exception.NodeLocked:
+            # retried on the next pass
+            continue
+        _update(xcat_node, entry['state'], maintenance=False)
+
+
+@lockutils.synchronized(POOL_SEMAPHORE, 'xcat-pool-')
+def _update(xcat_node, expect, **fields):
+    """Update a node entry unless a deploy claimed it meanwhile."""
+    state = _load()
+    entry = state['nodes'].get(xcat_node)
+    if entry is None or entry['state'] != expect:
+        return False
+    stat = fields.pop('stat', None)
+    if stat:
+        state['stats'][stat] += 1
+    entry.update(fields)
+    entry['since'] = time.time()
+    _save(state)
+    return True
+
+
+def _finish_install(xcat_node, entry):
+    """Power off a pool node whose install is done, under its node lock.
+
+    Nothing is done when a deploy or power action took the node since
+    the install was started.
+    """
+    if not entry.get('node'):
+        return
+    with task_manager.acquire(context.get_admin_context(),
+                              entry['node']) as task:
+        if not _still_installing(xcat_node, entry, entry['image'],
+                                 task.node):
+            return
+        xcat_util.xcat_execute(['rpower', xcat_node, 'off'], POOL_PRIORITY)
+        _update(xcat_node, INSTALLING, state=READY)
+
+
+def _check_installs(installing):
+    """Move the finished installs to ready, the timed out ones to idle."""
+    if not installing:
+        return
+    out, err = xcat_util.exec_xcatcmd_range(
+        installing, 'nodels', 'nodelist.status', POOL_PRIORITY)
+    status = xcat_util.parse_node_output(out)
+    entries = _load()['nodes']
+    for xcat_node in installing:
+        entry = entries.get(xcat_node)
+        if entry is None:
+            continue
+        if status.get(xcat_node) == 'booted':
+            try:
+                _finish_install(xcat_node, entry)
+            except (exception.NodeLocked, exception.NodeNotFound) as e:
+                # retried on the next pass
+                LOG.debug("Not powering off pool node %(node)s: %(error)s",
+                          {'node': xcat_node, 'error': e})
+            except (processutils.ProcessExecutionError, OSError) as e:
+                LOG.warning(_("Failed to power off pool node %(node)s: "
+                              "%(error)s"), {'node': xcat_node, 'error': e})
+        elif (time.time() - entry['since'] >
+                CONF.xcat.warm_pool_install_timeout):
+            LOG.warning(_("Warm pool install of node %(node)s with "
+                          "%(image)s timed out"),
+                        {'node': xcat_node, 'image': entry['image']})
+            _update(xcat_node, INSTALLING, state=IDLE, image=None,
+                    stat='failed')
+
+
+def _plan(state, members):
+    """Return [(xcat_node, image)] of the installs to start.
+
+    Nodes holding an image that is no longer wanted, or more copies of
+    an image than its share, are evicted and reinstalled.
+    """
+    wanted = targets(state['popularity'])
+    have = {}
+    free = []
+    surplus = []
+    for xcat_node, entry in sorted(state['nodes'].items()):
+        if xcat_node not in members or not entry.get('node'):
+            continue
+        image = entry.get('image')
+        if entry['state'] == IDLE:
+            free.append(xcat_node)
+        elif have.get(image, 0) >= wanted.get(image, 0):
+            # popularity shifted away from this image
+            surplus.append(xcat_node)
+        else:
+            have[image] = have.get(image, 0) + 1
+    plan = []
+    for image, count in sorted(wanted.items(), key=lambda kv: -kv[1]):
+        for i in range(count - have.get(image, 0)):
+            if free:
+                plan.append((free.pop(0), image))
+            elif surplus:
+                plan.append((surplus.pop(0), image))
+                state['stats']['evictions'] += 1
+            else:
+                return plan
+    return plan
+
+
+def replenish():
+    """Check the pool installs and start the installs the pool lacks.
+
+    :returns: list of (xcat_node, image) of the installs started.
+    """
+    if not enabled():
+        return []
+    members = _pool_members()
+    state = _load()
+    _check_installs(sorted(n for n, e in state['nodes'].items()
+                           if e['state'] == INSTALLING))
+    _release_maintenance()
+    with lockutils.lock(POOL_SEMAPHORE, 'xcat-pool-'):
+        plan = _plan(state, members)
+        for xcat_node, image in plan:
+            state['nodes'][xcat_node].update({'state': INSTALLING,
+                                              'image': image,
+                                              'since': time.time()})
+        _save(state)
+    # every start waits for its node lock and three xcat commands, start
+    # them side by side
+    started = []
+    for (xcat_node, image), ok, error in xcat_util.run_concurrently(
+            lambda item: _start_install(*item), plan):
+        if isinstance(error, (exception.NodeLocked, exception.NodeNotFound)):
+            LOG.debug("Not installing pool node %(node)s: %(error)s",
+                      {'node': xcat_node, 'error': error})
+        elif error is not None:
+            LOG.warning(_("Failed to start the pool install of node "
+                          "%(node)s: %(error)s"),
+                        {'node': xcat_node, 'error': error})
+            _update(xcat_node, INSTALLING, state=IDLE, image=None,
+                    stat='failed')
+            continue
+        if not ok:
+            _update(xcat_node, INSTALLING, state=IDLE, image=None)
+            continue
+        _update(xcat_node, INSTALLING, stat='installs')
+        started.append((xcat_node, image))
+    return started
+
+
+def get_stats():
+    """Return the pool content, the image targets and the hit rate."""
+    state = _load()
+    stats = dict(state['stats'])
+    requests = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / requests if requests else None
+    stats['targets'] = targets(state['popularity'])
+    nodes = {}
+    for entry in state['nodes'].values():
+        key = entry['state'] if entry['state'] == IDLE else '%s:%s' % (
+            entry['state'], entry['image'])
+        nodes[key] = nodes.get(key, 0) + 1
+    stats['nodes'] = nodes
+    return stats
@@ -5,14 +5,12 @@ use xcat to config dhcp and tftp
 
 import os
 import time
-import paramiko
 import datetime
 from oslo.config import cfg
 from ironic.common import exception
 from ironic.common import image_service as service
 from ironic.common import keystone
 from ironic.common import states
-from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.conductor import utils as manager_utils
 from ironic.drivers import base
@@ -22,9 +20,16 @@ from ironic.openstack.common import strutils
 from ironic.drivers.modules import xcat_neutron
 from ironic.drivers.modules import xcat_util
 from ironic.openstack.common import loopingcall
-from nova.openstack.common import timeutils
+from ironic.openstack.common import timeutils
 from ironic.openstack.common import lockutils
 from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_ledger
+from ironic.drivers.modules import xcat_placement
+from ironic.drivers.modules import xcat_pool
+from ironic.drivers.modules import xcat_profile
+from ironic.drivers.modules import xcat_state
+from ironic.drivers.modules import xcat_timeline
+from ironic.drivers.modules import xcat_watchdog
 
 
 pxe_opts = [
@@ -58,6 +63,10 @@ xcat_opts = [
     cfg.IntOpt('deploy_checking_interval',
                default=30,
                help='interval time(seconds) to check the xcat deploy state'),
+    cfg.IntOpt('deploy_netboot_timeout',
+               default=900,
+               help='max time(seconds) for a diskless or statelite node '
+               'to boot'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -67,6 +76,14 @@ CONF.register_opts(pxe_opts, group='pxe')
 CONF.register_opts(xcat_opts, group='xcat')
 CONF.import_opt('use_ipv6', 'ironic.netconf')
 
+# deploy modes, selected by the xcat_deploy_mode image property or the
+# provmethod part of the xcat osimage name (<os>-<arch>-<provmethod>-...)
+DEPLOY_MODE_PROPERTY = 'xcat_deploy_mode'
+MODE_INSTALL = 'install'
+MODE_NETBOOT = 'netboot'
+MODE_STATELITE = 'statelite'
+DEPLOY_MODES = (MODE_INSTALL, MODE_NETBOOT, MODE_STATELITE)
+
 EM_SEMAPHORE = 'xcat_pxe'
 
 def _check_for_missing_params(info_dict, param_prefix=''):
@@ -93,6 +110,8 @@ def _parse_driver_info(node):
     info = node.driver_info
     d_info = {}
     d_info['xcat_node'] = info.get('xcat_node')
+    d_info['xcatmaster'] = info.get('xcatmaster')
+    d_info['rack'] = info.get('rack')
     return d_info
 
 def _parse_instance_info(node):
@@ -144,20 +163,40 @@ def _parse_instance_info(node):
     return i_info
 
 
+class DeployInfo(xcat_util.InfoRecord):
+    """Parsed instance_info and driver_info of a node being deployed."""
+    __slots__ = ('image_source', 'root_gb', 'image_file', 'deploy_key',
+                 'swap_mb', 'ephemeral_gb', 'ephemeral_format',
+                 'preserve_ephemeral', 'xcat_node', 'xcatmaster', 'rack')
+
+
 def _parse_deploy_info(node):
     """Gets the instance and driver specific Node deployment info.
 
     This method validates whether the 'instance_info' and 'driver_info'
     property of the supplied node contains the required information for
-    this driver to deploy images to the node.
+    this driver to deploy images to the node. The result is cached until
+    the driver_info or instance_info keys it reads change.
 
     :param node: a single Node.
-    :returns: A dict with the instance_info and driver_info values.
+    :returns: A DeployInfo record with the instance_info and driver_info
+        values.
     """
+    return _deploy_info_cache(node)
+
+
+def _do_parse_deploy_info(node):
+    """Parse and validate the deploy info of the node, uncached."""
     info = {}
     info.update(_parse_instance_info(node))
     info.update(_parse_driver_info(node))
-    return info
+    return DeployInfo(**info)
+
+_deploy_info_cache = xcat_util.NodeInfoCache(_do_parse_deploy_info, {
+    'instance_info': ('image_source', 'root_gb', 'deploy_key', 'swap_mb',
+                      'ephemeral_gb', 'ephemeral_format',
+                      'preserve_ephemeral'),
+    'driver_info': ('xcat_node', 'xcatmaster', 'rack')})
 
 def _validate_glance_image(ctx, deploy_info):
     """Validate the image in Glance.
@@ -171,9 +210,67 @@ def _validate_glance_image(ctx, deploy_info):
     if not image_id:
         raise exception.ImageNotFound
 
+def _image_deploy_mode(image):
+    """Return the deploy mode of a glance image.
+
+    :param image: the image dict returned by glance.
+    :returns: one of DEPLOY_MODES, MODE_INSTALL when nothing says
+        otherwise.
+    """
+    mode = (image.get('properties') or {}).get(DEPLOY_MODE_PROPERTY)
+    if mode:
+        if mode not in DEPLOY_MODES:
+            raise exception.InvalidParameterValue(_(
+                "Invalid %(prop)s %(mode)s of image %(image)s, must be one "
+                "of %(modes)s.") % {'prop': DEPLOY_MODE_PROPERTY,
+                                   'mode': mode,
+                                   'image': image.get('name'),
+                                   'modes': ', '.join(DEPLOY_MODES)})
+        return mode
+    parts = (image.get('name') or '').split('-')
+    for mode in (MODE_NETBOOT, MODE_STATELITE):
+        if mode in parts:
+            return mode
+    return MODE_INSTALL
+
 class PXEDeploy(base.DeployInterface):
     """PXE Deploy Interface: just a stub until the real driver is ported."""
 
+    _reconciler = None
+    _pool_keeper = None
+
+    def __init__(self):
+        if (CONF.xcat.ledger_reconcile_interval and
+                PXEDeploy._reconciler is None):
+            PXEDeploy._reconciler = loopingcall.FixedIntervalLoopingCall(
+                self._reconcile_ledger)
+            PXEDeploy._reconciler.start(
+                interval=CONF.xcat.ledger_reconcile_interval,
+                initial_delay=CONF.xcat.ledger_reconcile_interval)
+        if xcat_pool.enabled() and PXEDeploy._pool_keeper is None:
+            PXEDeploy._pool_keeper = loopingcall.FixedIntervalLoopingCall(
+                self._replenish_pool)
+            PXEDeploy._pool_keeper.start(
+                interval=CONF.xcat.warm_pool_interval,
+                initial_delay=CONF.xcat.warm_pool_interval)
+
+    @staticmethod
+    def _replenish_pool():
+        try:
+            xcat_pool.replenish()
+            LOG.debug("xcat warm pool stats: %s", xcat_pool.get_stats())
+        except Exception as e:
+            LOG.warning(_("Failed to replenish the xcat warm pool: %s") % e)
+
+    @staticmethod
+    def _reconcile_ledger():
+        try:
+            xcat_ledger.reconcile()
+        except Exception as e:
+            LOG.warning(_("Failed to reconcile the network node dhcp "
+                          "rules: %s") % e)
+
+    @xcat_profile.profiled
     def validate(self, task):
         """Validate the deployment information for the task's node.
 
@@ -186,6 +283,7 @@ class PXEDeploy(base.DeployInterface):
                                 "any port associated with it.") % node.uuid)
 
         d_info = _parse_deploy_info(node)
+        xcat_neutron.check_dhcp_suppression()
         # Try to get the URL of the Ironic API
         try:
             # TODO(lucasagomes): Validate the format of the URL
@@ -199,6 +297,7 @@ class PXEDeploy(base.DeployInterface):
 
         _validate_glance_image(task.context, d_info)
 
+    @xcat_profile.profiled
     @task_manager.require_exclusive_lock
     def deploy(self, task):
         """Start deployment of the task's node'.
@@ -216,19 +315,76 @@ class PXEDeploy(base.DeployInterface):
         d_info = _parse_deploy_info(task.node)
         if not task.node.instance_info.get('fixed_ip_address') or not task.node.instance_info.get('image_name'):
             raise exception.InvalidParameterValue
-        self._config_host_file(d_info,task.node.instance_info.get('fixed_ip_address'))
-        self._make_dhcp()
-        self._nodeset_osimage(d_info,task.node.instance_info.get('image_name'))
-        manager_utils.node_set_boot_device(task, 'pxe', persistent=True)
-        manager_utils.node_power_action(task, states.REBOOT)
+        timeline = xcat_timeline.DeployTimeline.load(task.node)
         try:
-            self._wait_for_node_deploy(task)
-        except xcat_exception.xCATDeploymentFailure:
-            LOG.info(_("xcat deployment failed"))
-            return states.ERROR
-
+            return self._deploy(task, d_info, timeline)
+        finally:
+            # keep the phases recorded up to an unexpected failure too
+            if 'finished_at' not in timeline.data:
+                timeline.finish(states.ERROR)
+            timeline.save(task.node)
+
+    def _deploy(self, task, d_info, timeline):
+        """Run the deploy phases, recording them on the timeline."""
+        with timeline.phase('hosts'):
+            xcat_ledger.record(task.node.uuid, xcat_ledger.KIND_HOSTS,
+                               name=d_info['xcat_node'])
+            self._config_host_file(d_info,task.node.instance_info.get('fixed_ip_address'))
+        with timeline.phase('makedhcp'):
+            xcat_ledger.record(task.node.uuid, xcat_ledger.KIND_DHCP,
+                               name=d_info['xcat_node'])
+            self._make_dhcp()
+        mode = task.node.instance_info.get(DEPLOY_MODE_PROPERTY,
+                                           MODE_INSTALL)
+        image_name = task.node.instance_info.get('image_name')
+        if (mode == MODE_INSTALL and
+                xcat_pool.claim(task, d_info['xcat_node'], image_name)):
+            # the warm pool installed the image already, the node only
+            # reboots into it with the new network configuration
+            timeline.data['warm_pool_hit'] = True
+            with timeline.phase('reboot'):
+                manager_utils.node_power_action(task, states.REBOOT)
+            xcat_ledger.release(task.node.uuid,
+                                kinds=xcat_ledger.DHCP_SUPPRESSION_KINDS)
+            timeline.finish(states.DEPLOYDONE)
+            return states.DEPLOYDONE
+        installed = False
+        watchdog = None
+        try:
+            with timeline.phase('nodeset'):
+                timeline.data['install_server'] = xcat_placement.place(d_info)
+                self._nodeset_osimage(d_info, image_name)
+            if CONF.xcat.deploy_console_watchdog:
+                watchdog = xcat_watchdog.ConsoleWatchdog(
+                    d_info['xcat_node']).start()
+            with timeline.phase('reboot'):
+                manager_utils.node_set_boot_device(task, 'pxe',
+                                                   persistent=True)
+                manager_utils.node_power_action(task, states.REBOOT)
+            try:
+                # a diskless or statelite node only boots, nothing is
+                # installed
+                with timeline.phase('install' if mode == MODE_INSTALL
+                                    else 'boot'):
+                    self._wait_for_node_deploy(task, timeline, watchdog,
+                                               mode)
+            except xcat_exception.xCATDeploymentFailure as e:
+                LOG.info(_("xcat deployment failed: %s") % e)
+                # stop dropping the dhcp requests of the failed node
+                xcat_ledger.release(task.node.uuid,
+                                    kinds=xcat_ledger.DHCP_SUPPRESSION_KINDS)
+                timeline.finish(states.ERROR)
+                return states.ERROR
+            installed = True
+        finally:
+            xcat_placement.release(d_info['xcat_node'], ok=installed)
+            if watchdog is not None:
+                watchdog.stop()
+
+        timeline.finish(states.DEPLOYDONE)
         return states.DEPLOYDONE
 
+    @xcat_profile.profiled
     @task_manager.require_exclusive_lock
     def tear_down(self, task):
         """Tear down a previous deployment on the task's node.
@@ -240,8 +396,12 @@ class PXEDeploy(base.DeployInterface):
         :returns: deploy state DELETED.
         """
         manager_utils.node_power_action(task, states.POWER_OFF)
+        xcat_ledger.release(task.node.uuid)
+        xcat_pool.mark_idle(task.node.driver_info.get('xcat_node'),
+                            task.node.uuid)
         return states.DELETED
 
+    @xcat_profile.profiled
     def prepare(self, task):
         """Prepare the deployment environment for this task's node.
         Get the image info from glance, config the mac for the xcat
@@ -252,25 +412,35 @@ class PXEDeploy(base.DeployInterface):
         d_info = _parse_deploy_info(task.node)
         i_info = task.node.instance_info
         image_id = d_info['image_source']
+        timeline = xcat_timeline.DeployTimeline.start()
         try:
-            glance_service = service.Service(version=1, context=task.context)
-            image_name = glance_service.show(image_id)['name']
+            with timeline.phase('glance'):
+                glance_service = service.Service(version=1, context=task.context)
+                image = glance_service.show(image_id)
+            image_name = image['name']
             i_info['image_name'] = image_name
+            timeline.set_image(image_name)
         except (exception.GlanceConnectionFailed,
                 exception.ImageNotAuthorized,
                 exception.Invalid):
             LOG.warning(_("Failed to connect to Glance to get the properties "
                 "of the image %s") % image_id)
+        else:
+            i_info[DEPLOY_MODE_PROPERTY] = _image_deploy_mode(image)
+            xcat_pool.record_request(image_name)
 
         node_mac_addresses = driver_utils.get_node_mac_addresses(task)
-        vif_ports_info = xcat_neutron.get_ports_info_from_neutron(task)
+        with timeline.phase('neutron'):
+            vif_ports_info = xcat_neutron.get_ports_info_from_neutron(task)
         try:
             network_info = self._get_deploy_network_info(vif_ports_info, node_mac_addresses)
         except (xcat_exception.GetNetworkFixedIPFailure,xcat_exception.GetNetworkIdFailure):
             LOG.error(_("Failed to get network info"))
+            timeline.save(task.node)
             return
         if not network_info:
             LOG.error(_("Failed to get network info"))
+            timeline.save(task.node)
             return
 
         fixed_ip_address = network_info['fixed_ip_address']
@@ -281,24 +451,54 @@ class PXEDeploy(base.DeployInterface):
         i_info['network_id'] = network_id
         i_info['deploy_mac_address'] = deploy_mac_address
 
-        # use iptables to drop the dhcp mac of baremetal machine
-        self._ssh_append_dhcp_rule(CONF.xcat.network_node_ip,CONF.xcat.ssh_port,CONF.xcat.ssh_user,
-                                     CONF.xcat.ssh_password,network_id,deploy_mac_address)
-        self._chdef_node_mac_address(d_info,deploy_mac_address)
+        if CONF.xcat.dhcp_suppression == 'neutron':
+            # point the neutron dhcp answer of the port at xcat, no ssh
+            # to the network node
+            dhcp_opts = xcat_neutron.xcat_dhcp_opts()
+            xcat_ledger.record(task.node.uuid, xcat_ledger.KIND_DHCP_OPTS,
+                               port_id=network_info['port_id'],
+                               previous=network_info['extra_dhcp_opts'])
+            with timeline.phase('dhcp_opts'):
+                xcat_neutron.set_port_dhcp_opts(
+                    task.context, network_info['port_id'], dhcp_opts)
+        else:
+            # use iptables to drop the dhcp mac of baremetal machine
+            xcat_ledger.record(task.node.uuid, xcat_ledger.KIND_IPTABLES,
+                               netns='qdhcp-%s' % network_id,
+                               mac=deploy_mac_address)
+            with timeline.phase('ssh'):
+                self._ssh_append_dhcp_rule(CONF.xcat.network_node_ip,CONF.xcat.ssh_port,CONF.xcat.ssh_user,
+                                             CONF.xcat.ssh_password,network_id,deploy_mac_address)
+        try:
+            with timeline.phase('chdef'):
+                self._chdef_node_mac_address(d_info,deploy_mac_address)
+        finally:
+            timeline.save(task.node)
 
+    @xcat_profile.profiled
     def clean_up(self, task):
         """Clean up the deployment environment for the task's node.
 
-        Unlinks TFTP and instance images and triggers image cache cleanup.
-        Removes the TFTP configuration files for this node. As a precaution,
-        this method also ensures the keystone auth token file was removed.
+        Removes the network node dhcp rules, host file lines and xcat dhcp
+        entries recorded in the ledger for this node.
 
         :param task: a TaskManager instance containing the node to act on.
         """
-        pass
+        xcat_ledger.release(task.node.uuid)
 
+    @xcat_profile.profiled
     def take_over(self, task):
-        pass
+        """Take over the node from another conductor.
+
+        Queue the node for a bulk load of its xcat definition, power
+        state and status, so that the nodes taken over together are
+        queried with one command each instead of one per node.
+
+        :param task: a TaskManager instance containing the node to act on.
+        """
+        xcat_node = (task.node.driver_info or {}).get('xcat_node')
+        if xcat_node:
+            xcat_state.request_warm_up(xcat_node)
 
     def _get_deploy_network_info(self, vif_ports_info, valid_node_mac_addrsses):
         """Get network info from mac address of ironic node.
@@ -318,21 +518,29 @@ class PXEDeploy(base.DeployInterface):
                 if not network_info['network_id']:
                     raise xcat_exception.GetNetworkIdFailure(mac_address=port_info['port']['mac_address'])
                 network_info['port_id'] = port_info['port']['id']
+                network_info['extra_dhcp_opts'] = (
+                    xcat_neutron.port_dhcp_opts(port_info))
                 return network_info
         return network_info
 
     def _chdef_node_mac_address(self, driver_info, deploy_mac):
-        """ run chdef command to set mac address"""
-        cmd = 'chdef'
-        args = 'mac='+ deploy_mac
+        """ run chdef command to set mac address
+
+        :param driver_info: xcat node deploy info
+        :param deploy_mac: mac address the node deploys with
+        :raises: xCATMacRegistrationFailure if xcat refused the mac
+        """
+        xcat_node = driver_info['xcat_node']
         try:
-            out_err = xcat_util.exec_xcatcmd(driver_info, cmd, args)
-            LOG.info(_("xcat chdef cmd exetute output: %(out_err)s") % {'out_err':out_err})
+            errors = xcat_util.chdef_mac_addresses({xcat_node: deploy_mac})
         except xcat_exception.xCATCmdFailure as e:
+            errors = {xcat_node: e}
+        if errors:
             LOG.warning(_("xcat chdef failed for node %(xcat_node)s with "
                         "error: %(error)s.")
-                        % {'xcat_node': driver_info['xcat_node'], 'error': e})
-            raise exception.IPMIFailure(cmd=cmd)
+                        % {'xcat_node': xcat_node, 'error': errors[xcat_node]})
+            raise xcat_exception.xCATMacRegistrationFailure(
+                node=xcat_node, error=errors[xcat_node])
 
     @lockutils.synchronized(EM_SEMAPHORE, 'xcat-hosts-')
     def _config_host_file(self, driver_info, deploy_ip):
@@ -361,6 +569,7 @@ class PXEDeploy(base.DeployInterface):
         """
         cmd = 'nodeset'
         args = 'osimage='+ image_name
+        xcat_state.STATE.invalidate(driver_info['xcat_node'], 'status')
         try:
             xcat_util.exec_xcatcmd(driver_info, cmd, args)
         except xcat_exception.xCATCmdFailure as e:
@@ -374,7 +583,7 @@ class PXEDeploy(base.DeployInterface):
             '-n'
             ]
         try:
-            out, err = utils.execute(*cmd)
+            out, err = xcat_util.xcat_execute(cmd)
             LOG.info(_(" excute cmd: %(cmd)s \n output: %(out)s \n. Error: %(err)s \n"),
                       {'cmd':cmd,'out': out, 'err': err})
         except Exception as e:
@@ -385,7 +594,7 @@ class PXEDeploy(base.DeployInterface):
             '-a'
             ]
         try:
-            out, err = utils.execute(*cmd)
+            out, err = xcat_util.xcat_execute(cmd)
             LOG.info(_(" excute cmd: %(cmd)s \n output: %(out)s \n. Error: %(err)s \n"),
                       {'cmd':cmd,'out': out, 'err': err})
         except Exception as e:
@@ -400,38 +609,65 @@ class PXEDeploy(base.DeployInterface):
         cmd = [append_cmd]
         xcat_util.xcat_ssh(ip,port,username,password,cmd)
 
-    def _ssh_delete_dhcp_rule(self,ip,port,username,password,network_id,mac_address):
-        """ delete the iptable rule on network node to recover the environment"""
-        netns = 'qdhcp-%s' %network_id
-        cancel_cmd = 'sudo ip netns exec %s iptables -D INPUT -m mac --mac-source %s -j DROP' % \
-               (netns,mac_address)
-        cmd = [cancel_cmd]
-        xcat_util.xcat_ssh(ip,port,username,password,cmd)
+    def _wait_for_node_deploy(self, task, timeline=None, watchdog=None,
+                              mode=MODE_INSTALL):
+        """Wait for xCAT node deployment to complete.
 
-    def _wait_for_node_deploy(self, task):
-        """Wait for xCAT node deployment to complete."""
-        locals = {'errstr':''}
+        :param task: a TaskManager instance containing the node to act on.
+        :param timeline: optional DeployTimeline recording the observed
+            nodelist.status transitions.
+        :param watchdog: optional ConsoleWatchdog, the deploy fails as soon
+            as it sees a fatal message on the node console.
+        :param mode: one of DEPLOY_MODES, a diskless or statelite node
+            has CONF.xcat.deploy_netboot_timeout to boot.
+        """
+        locals = {'errstr':'', 'last_check': 0}
         driver_info = _parse_deploy_info(task.node)
-        node_mac_addrsses = driver_utils.get_node_mac_addresses(task)
-        i_info = task.node.instance_info
+        interval = CONF.xcat.deploy_checking_interval
+        timeout = CONF.xcat.deploy_timeout
+        if mode != MODE_INSTALL:
+            timeout = CONF.xcat.deploy_netboot_timeout
+        if watchdog is not None:
+            interval = min(interval, CONF.xcat.deploy_watchdog_interval)
 
         def _wait_for_deploy():
-            out,err = xcat_util.exec_xcatcmd(driver_info,'nodels','nodelist.status')
+            if watchdog is not None:
+                fatal = watchdog.poll()
+                if fatal:
+                    locals['errstr'] = _("Fatal console output while "
+                               "deploying node %(node)s: %(line)s\n"
+                               "%(tail)s") % {'node': driver_info['xcat_node'],
+                                             'line': fatal,
+                                             'tail': watchdog.tail()}
+                    LOG.warning(locals['errstr'])
+                    raise loopingcall.LoopingCallDone()
+                if (time.time() - locals['last_check'] <
+                        CONF.xcat.deploy_checking_interval):
+                    return
+            locals['last_check'] = time.time()
+            cached = xcat_state.STATE.take(driver_info['xcat_node'], 'status',
+                                           CONF.xcat.deploy_checking_interval)
+            if cached is not None:
+                out,err = "%s: %s" % (driver_info['xcat_node'], cached), ''
+            else:
+                out,err = xcat_util.exec_xcatcmd(driver_info,'nodels','nodelist.status')
             if err:
                 locals['errstr'] = _("Error returned when quering node status"
                            " for node %s:%s") % (driver_info['xcat_node'], err)
                 LOG.warning(locals['errstr'])
                 raise loopingcall.LoopingCallDone()
 
-            if out:
-                node,status = out.split(": ")
-                status = status.strip()
+            status = xcat_util.parse_node_output(out).get(
+                driver_info['xcat_node'])
+            if status:
+                if timeline is not None:
+                    timeline.record_status(status)
                 if status == "booted":
                     LOG.info(_("Deployment for node %s completed.")
                              % driver_info['xcat_node'])
                     raise loopingcall.LoopingCallDone()
 
-            if (CONF.xcat.deploy_timeout and
+            if (timeout and
                     timeutils.utcnow() > expiration):
                 locals['errstr'] = _("Timeout while waiting for"
                            " deployment of node %s.") % driver_info['xcat_node']
@@ -439,15 +675,18 @@ class PXEDeploy(base.DeployInterface):
                 raise loopingcall.LoopingCallDone()
 
         expiration = timeutils.utcnow() + datetime.timedelta(
-                seconds=CONF.xcat.deploy_timeout)
+                seconds=timeout)
         timer = loopingcall.FixedIntervalLoopingCall(_wait_for_deploy)
         # default check every 10 seconds
-        timer.start(interval=CONF.xcat.deploy_checking_interval).wait()
+        timer.start(interval=interval).wait()
 
         if locals['errstr']:
             raise xcat_exception.xCATDeploymentFailure(locals['errstr'])
-        # deploy end, delete the dhcp rule for xcat
-        self._ssh_delete_dhcp_rule(CONF.xcat.network_node_ip,CONF.xcat.ssh_port,CONF.xcat.ssh_user,
-                                     CONF.xcat.ssh_password,i_info['network_id'],node_mac_addrsses[0])
+        # deploy end, delete the dhcp rule for xcat.  A diskless or
+        # statelite node network boots from xcat on every power on, its
+        # rule is kept until tear_down.
+        if mode == MODE_INSTALL:
+            xcat_ledger.release(task.node.uuid,
+                                kinds=xcat_ledger.DHCP_SUPPRESSION_KINDS)
 
 
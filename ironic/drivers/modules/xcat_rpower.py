@@ -21,7 +21,13 @@ from ironic.openstack.common import excutils
 from ironic.openstack.common import log as logging
 from ironic.openstack.common import loopingcall
 from ironic.openstack.common import processutils
+from ironic.drivers.modules import xcat_breaker
+from ironic.drivers.modules import xcat_console
 from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_placement
+from ironic.drivers.modules import xcat_pool
+from ironic.drivers.modules import xcat_profile
+from ironic.drivers.modules import xcat_state
 from ironic.drivers.modules import xcat_util
 
 CONF = cfg.CONF
@@ -65,18 +71,24 @@ def check_timing_support():
     :raises: OSError
     """
     if _is_timing_supported() is None:
-        # Directly check ipmitool for support of -N and -R options. Because
-        # of the way ipmitool processes' command line options, if the local
-        # ipmitool does not support setting the timing options, the command
-        # below will fail.
-        try:
-            out, err = utils.execute(*['ipmitool', '-N', '0', '-R', '0', '-h'])
-        except processutils.ProcessExecutionError:
-            # the local ipmitool does not support the -N and -R options.
-            _is_timing_supported(False)
-        else:
-            # looks like ipmitool supports timing options.
-            _is_timing_supported(True)
+        # The probe result is persisted and only rerun when the ipmitool
+        # binary changes, see xcat_util.cached_probe.
+        _is_timing_supported(xcat_util.cached_probe(
+            'ipmitool_timing', 'ipmitool', _probe_timing_support))
+
+
+def _probe_timing_support():
+    # Directly check ipmitool for support of -N and -R options. Because
+    # of the way ipmitool processes' command line options, if the local
+    # ipmitool does not support setting the timing options, the command
+    # below will fail.
+    try:
+        out, err = utils.execute(*['ipmitool', '-N', '0', '-R', '0', '-h'])
+    except processutils.ProcessExecutionError:
+        # the local ipmitool does not support the -N and -R options.
+        return False
+    # looks like ipmitool supports timing options.
+    return True
 
 
 def _console_pwfile_path(uuid):
@@ -84,14 +96,27 @@ def _console_pwfile_path(uuid):
     file_name = "%(uuid)s.pw" % {'uuid': uuid}
     return os.path.join(tempfile.gettempdir(), file_name)
 
+class DriverInfo(xcat_util.InfoRecord):
+    """Parsed xcat driver_info of a node."""
+    __slots__ = ('address', 'username', 'password', 'port', 'uuid',
+                 'priv_level', 'xcat_node', 'xcatmaster', 'netboot')
+
+
 def _parse_driver_info(node):
     """Gets the parameters required for ipmitool to access the node.
 
+    The result is cached until the driver_info keys it reads change.
+
     :param node: the Node of interest.
-    :returns: dictionary of parameters.
+    :returns: DriverInfo record of parameters.
     :raises: InvalidParameterValue if any required parameters are missing.
 
     """
+    return _driver_info_cache(node)
+
+
+def _do_parse_driver_info(node):
+    """Parse and validate the driver_info of the node, uncached."""
     info = node.driver_info or {}
     address = info.get('ipmi_address')
     username = info.get('ipmi_username')
@@ -132,35 +157,60 @@ def _parse_driver_info(node):
         raise exception.InvalidParameterValue(_(
             "netboot not supplied to xcat driver"))
 
-    return {
-            'address': address,
-            'username': username,
-            'password': password,
-            'port': port,
-            'uuid': node.uuid,
-            'priv_level': priv_level,
-            'xcat_node': xcat_node,
-            'xcatmaster': xcatmaster,
-            'netboot': netboot
-           }
+    return DriverInfo(address=address,
+                      username=username,
+                      password=password,
+                      port=port,
+                      uuid=node.uuid,
+                      priv_level=priv_level,
+                      xcat_node=xcat_node,
+                      xcatmaster=xcatmaster,
+                      netboot=netboot)
+
+_driver_info_cache = xcat_util.NodeInfoCache(_do_parse_driver_info, {
+    'driver_info': ('ipmi_address', 'ipmi_username', 'ipmi_password',
+                    'ipmi_terminal_port', 'ipmi_priv_level', 'xcat_node',
+                    'xcatmaster', 'netboot')})
+
+
+def _node_attrs(driver_info):
+    """Return the xcat node attributes the driver manages, in order.
+
+    While the node installs, the install server it was placed on is kept.
+    """
+    install_server = (xcat_placement.placed(driver_info['xcat_node']) or
+                      driver_info['xcatmaster'])
+    return [('mgt', 'ipmi'),
+            ('bmc', driver_info['address']),
+            ('bmcusername', driver_info['username']),
+            ('bmcpassword', driver_info['password']),
+            ('xcatmaster', install_server),
+            ('netboot', driver_info['netboot']),
+            ('primarynic', 'mac'),
+            ('installnic', 'mac'),
+            ('monserver', driver_info['xcatmaster']),
+            ('nfsserver', install_server),
+            ('serialflow', 'hard'),
+            ('serialspeed', '115200'),
+            ('serialport', str(driver_info['port']))]
+
+
 def chdef_node(driver_info):
     """Run the chdef command in xcat, config the node
+
+    The command is skipped when the xcat definition of the node, bulk
+    loaded within CONF.xcat.state_cache_ttl seconds, already has all the
+    attributes.
+
     :param driver_info: driver_info for the xcat node
     """
     cmd = 'chdef'
-    args = 'mgt=ipmi' + \
-           ' bmc=' + driver_info['address'] + \
-           ' bmcusername=' + driver_info['username'] + \
-           ' bmcpassword=' + driver_info['password'] + \
-           ' xcatmaster='  + driver_info['xcatmaster']+ \
-           ' netboot=' + driver_info['netboot']+ \
-           ' primarynic=mac'+ \
-           ' installnic=mac'+ \
-           ' monserver=' + driver_info['xcatmaster'] + \
-           ' nfsserver=' + driver_info['xcatmaster'] + \
-           ' serialflow=hard'+ \
-           ' serialspeed=115200' + \
-           ' serialport=' + str(driver_info['port']);
+    attrs = _node_attrs(driver_info)
+    current = xcat_state.STATE.get(driver_info['xcat_node'], 'attrs',
+                                   CONF.xcat.state_cache_ttl)
+    if current and all(current.get(k) == v for k, v in attrs):
+        return
+    args = ' '.join('%s=%s' % (k, v) for k, v in attrs)
 
     try:
         xcat_util.exec_xcatcmd(driver_info, cmd, args)
@@ -168,6 +218,12 @@ def chdef_node(driver_info):
         LOG.warning(_("xcat chdef failed for node %(node_id)s with "
                     "error: %(error)s.")
                     % {'node_id': driver_info['uuid'], 'error': e})
+        xcat_state.STATE.invalidate(driver_info['xcat_node'], 'attrs')
+    else:
+        if current:
+            current = dict(current)
+            current.update(attrs)
+            xcat_state.STATE.update(driver_info['xcat_node'], attrs=current)
 
 def _sleep_time(iter):
     """Return the time-to-sleep for the n'th iteration of a retry loop.
@@ -204,6 +260,7 @@ def _set_and_wait(target_state, driver_info):
         state_name = "on"
     elif target_state == states.POWER_OFF:
         state_name = "off"
+    xcat_state.STATE.invalidate(driver_info['xcat_node'], 'power')
 
     def _wait(mutable):
         try:
@@ -212,6 +269,11 @@ def _set_and_wait(target_state, driver_info):
                 xcat_util.exec_xcatcmd(driver_info,'rpower',state_name)
             else:
                 mutable['power'] = _power_status(driver_info)
+        except xcat_exception.xCATBMCCircuitOpen as e:
+            # the BMC is known to be dead, do not wait for retry_timeout
+            LOG.error(e.format_message())
+            mutable['power'] = states.ERROR
+            raise loopingcall.LoopingCallDone()
         except Exception:
             # Log failures but keep trying
             LOG.warning(_("xcat rpower %(state)s failed for node %(node)s."),
@@ -264,6 +326,16 @@ def _power_off(driver_info):
     """
     return _set_and_wait(states.POWER_OFF, driver_info)
 
+def _reboot(driver_info):
+    """Cycle the power of this node.
+
+    :param driver_info: the xcat parameters for accessing a node.
+    :returns: one of ironic.common.states POWER_ON or ERROR.
+
+    """
+    _power_off(driver_info)
+    return _power_on(driver_info)
+
 def _power_status(driver_info):
     """Get the power status for a node.
 
@@ -272,24 +344,73 @@ def _power_status(driver_info):
     :raises: IPMIFailure on an error from ipmitool.
 
     """
+    cached = xcat_state.STATE.take(driver_info['xcat_node'], 'power',
+                                   CONF.xcat.state_cache_ttl)
+    if cached is not None:
+        return cached
     cmd = "rpower"
     try:
         out_err = xcat_util.exec_xcatcmd(driver_info,cmd,'status')
+    except xcat_exception.xCATBMCCircuitOpen as e:
+        LOG.debug(e.format_message())
+        return states.ERROR
     except Exception as e:
         LOG.warning(_("xcat rpower status failed for node %(node_id)s with "
                       "error: %(error)s.")
                     % {'node_id': driver_info['uuid'], 'error': e})
+        return states.ERROR
 
-    if out_err[0].split(' ')[1].strip() == "on":
+    status = xcat_util.parse_node_output(out_err[0]).get(
+        driver_info['xcat_node'])
+    if status == "on":
         return states.POWER_ON
-    elif out_err[0].split(' ')[1].strip() == "off":
+    elif status == "off":
         return states.POWER_OFF
     else:
         return states.ERROR
 
 
+def probe_open_circuits():
+    """Probe the BMCs with an open circuit whose open time has passed.
+
+    All the due nodes are probed with one rpower stat, a node answering
+    on or off closes its circuit, any other answer keeps it open for
+    twice the time.
+
+    :returns: list of the xcat nodes whose circuit was closed.
+    """
+    due = xcat_breaker.BREAKER.due()
+    if not due:
+        return []
+    answered = {}
+    try:
+        for record in xcat_util.stream_xcatcmd(
+                due, 'rpower', 'stat', priority=xcat_util.PRIORITY_READ):
+            answered[record.node] = record
+    except OSError as e:
+        LOG.warning(_("Failed to probe the failing BMCs: %s"), e)
+        return []
+    closed = []
+    for xcat_node in due:
+        record = answered.get(xcat_node)
+        if (record is not None and not record.error and
+                record.value in xcat_state.POWER_STATES):
+            xcat_breaker.BREAKER.success(xcat_node)
+            xcat_state.STATE.update(
+                xcat_node, power=xcat_state.POWER_STATES[record.value])
+            closed.append(xcat_node)
+        else:
+            xcat_breaker.BREAKER.failure(
+                xcat_node, record.value if record is not None else
+                _("no answer to rpower stat"))
+    return closed
+
+
 class XcatPower(base.PowerInterface):
 
+    _warmed_up = False
+    _prober = None
+
     def __init__(self):
         try:
             check_timing_support()
@@ -298,7 +419,26 @@ class XcatPower(base.PowerInterface):
                     driver=self.__class__.__name__,
                     reason="Unable to locate usable xcat command in "
                            "the system path when checking xcat version")
+        if not XcatPower._warmed_up:
+            XcatPower._warmed_up = True
+            xcat_state.warm_up_at_start()
+        if (CONF.xcat.bmc_breaker_threshold and
+                CONF.xcat.bmc_breaker_probe_interval and
+                XcatPower._prober is None):
+            XcatPower._prober = loopingcall.FixedIntervalLoopingCall(
+                self._probe)
+            XcatPower._prober.start(
+                interval=CONF.xcat.bmc_breaker_probe_interval,
+                initial_delay=CONF.xcat.bmc_breaker_probe_interval)
+
+    @staticmethod
+    def _probe():
+        try:
+            probe_open_circuits()
+        except Exception as e:
+            LOG.warning(_("Failed to probe the failing BMCs: %s") % e)
 
+    @xcat_profile.profiled
     def validate(self, task):
         """Validate driver_info for xcat driver.
 
@@ -314,6 +454,7 @@ class XcatPower(base.PowerInterface):
         except exception:
             LOG.error(_("chdef xcat info error!"))
 
+    @xcat_profile.profiled
     def get_power_state(self, task):
         """Get the current power state of the task's node.
 
@@ -324,6 +465,7 @@ class XcatPower(base.PowerInterface):
         driver_info = _parse_driver_info(task.node)
         return _power_status(driver_info)
 
+    @xcat_profile.profiled
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
@@ -348,6 +490,7 @@ class XcatPower(base.PowerInterface):
         if state != pstate:
             raise exception.PowerStateFailure(pstate=pstate)
 
+    @xcat_profile.profiled
     @task_manager.require_exclusive_lock
     def reboot(self, task):
         """Cycles the power to the task's node.
@@ -359,8 +502,7 @@ class XcatPower(base.PowerInterface):
 
         """
         driver_info = _parse_driver_info(task.node)
-        _power_off(driver_info)
-        state = _power_on(driver_info)
+        state = _reboot(driver_info)
 
         if state != states.POWER_ON:
             raise exception.PowerStateFailure(pstate=states.POWER_ON)
@@ -418,6 +560,55 @@ class VendorPassthru(base.VendorInterface):
                         kwargs.get('persistent', False))
 
 
+class XcatVendorPassthru(base.VendorInterface):
+    """Operator methods of the xcat driver.
+
+    node methods: reset_bmc_circuit
+    driver methods: get_bmc_circuit (node: the xcat node name),
+    list_bmc_circuits, get_warm_pool, get_install_servers,
+    get_command_stats, get_console_stats
+    """
+
+    NODE_METHODS = ('reset_bmc_circuit',)
+    DRIVER_METHODS = ('get_bmc_circuit', 'list_bmc_circuits',
+                      'get_warm_pool', 'get_install_servers',
+                      'get_command_stats', 'get_console_stats')
+
+    def validate(self, task, **kwargs):
+        method = kwargs.get('method')
+        if method not in self.NODE_METHODS:
+            raise exception.InvalidParameterValue(_(
+                "Unsupported method (%s) passed to xcat driver.")
+                % method)
+        if not (task.node.driver_info or {}).get('xcat_node'):
+            raise exception.InvalidParameterValue(_(
+                "xcat node name not supplied to xcat baremetal driver."))
+
+    def vendor_passthru(self, task, **kwargs):
+        xcat_breaker.BREAKER.reset(task.node.driver_info['xcat_node'])
+
+    def driver_vendor_passthru(self, context, method, **kwargs):
+        if method not in self.DRIVER_METHODS:
+            raise exception.InvalidParameterValue(_(
+                "Unsupported method (%s) passed to xcat driver.")
+                % method)
+        if method == 'get_bmc_circuit':
+            if not kwargs.get('node'):
+                raise exception.InvalidParameterValue(_(
+                    "get_bmc_circuit needs a xcat node name in 'node'."))
+            return xcat_breaker.BREAKER.state(kwargs['node'])
+        if method == 'get_warm_pool':
+            return xcat_pool.get_stats()
+        if method == 'get_install_servers':
+            return xcat_placement.get_stats()
+        if method == 'get_console_stats':
+            return xcat_console.get_stats()
+        if method == 'get_command_stats':
+            return {'executor': xcat_util.get_executor().get_stats(),
+                    'service_nodes': xcat_util.get_router().get_stats()}
+        return xcat_breaker.BREAKER.get_stats()
+
+
 class IPMIShellinaboxConsole(base.ConsoleInterface):
     """A ConsoleInterface that uses ipmitool and shellinabox."""
 
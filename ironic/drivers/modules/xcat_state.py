@@ -0,0 +1,183 @@
+"""
+in-memory xcat node state for the xcat baremetal driver
+node definitions (lsdef), power states (rpower stat) and install status
+(nodelist.status) loaded in bulk with one noderange command each, so a
+conductor start or rebalance does not query xcat once per node
+"""
+
+import threading
+import time
+
+import eventlet
+from oslo.config import cfg
+
+from ironic.common import states
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import processutils
+
+xcat_opts = [
+    cfg.StrOpt('warmup_noderange',
+               default=None,
+               help='xcat noderange, usually a group, of the nodes managed '
+               'by ironic; when set their state is loaded in bulk at '
+               'conductor start'),
+    cfg.FloatOpt('warmup_batch_window',
+                 default=2.0,
+                 help='Seconds to collect take_over requests before loading '
+                 'their state with one bulk query'),
+    cfg.IntOpt('state_cache_ttl',
+               default=120,
+               help='Seconds a bulk loaded node definition, power state '
+               'or status is used instead of querying xcat'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+POWER_STATES = {'on': states.POWER_ON,
+                'off': states.POWER_OFF}
+
+
+class NodeStateCache(object):
+    """State of the xcat nodes with the time every field was loaded."""
+
+    def __init__(self):
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def update(self, xcat_node, **fields):
+        now = time.time()
+        with self._lock:
+            node = self._nodes.setdefault(xcat_node, {})
+            for key, value in fields.items():
+                node[key] = (now, value)
+
+    def get(self, xcat_node, field, max_age=None):
+        """Return a field if loaded within max_age seconds, else None."""
+        entry = self._nodes.get(xcat_node, {}).get(field)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry[0] > max_age:
+            return None
+        return entry[1]
+
+    def take(self, xcat_node, field, max_age=None):
+        """Return a fresh field and drop it, so it is used only once."""
+        with self._lock:
+            value = self.get(xcat_node, field, max_age)
+            self._nodes.get(xcat_node, {}).pop(field, None)
+        return value
+
+    def invalidate(self, xcat_node, field=None):
+        with self._lock:
+            if field is None:
+                self._nodes.pop(xcat_node, None)
+            else:
+                self._nodes.get(xcat_node, {}).pop(field, None)
+
+    def __contains__(self, xcat_node):
+        return xcat_node in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+STATE = NodeStateCache()
+
+_pending = set()
+_pending_lock = threading.Lock()
+_flush_scheduled = [False]
+
+
+def _query(nodes, command, args, service_node=None):
+    """Yield the node records of a bulk query as they arrive."""
+    try:
+        for record in xcat_util.stream_xcatcmd(
+                nodes, command, args, priority=xcat_util.PRIORITY_READ,
+                service_node=service_node):
+            if record.error:
+                LOG.debug("Bulk %(cmd)s error for node %(node)s: "
+                          "%(error)s", {'cmd': command, 'node': record.node,
+                                        'error': record.value})
+            else:
+                yield record
+    except OSError as e:
+        LOG.warning(_("Bulk %(cmd)s failed: %(error)s"),
+                    {'cmd': command, 'error': e})
+
+
+def warm_up(nodes):
+    """Load the definition, power state and status of nodes in bulk.
+
+    :param nodes: list of xcat node names or a single noderange string.
+    :returns: number of nodes loaded.
+    """
+    # a group is one word to xcat, expand it so the commands are chunked
+    try:
+        nodes = xcat_util.expand_noderange(nodes)
+    except (processutils.ProcessExecutionError, OSError) as e:
+        LOG.warning(_("Failed to expand the noderange %(nodes)s: "
+                      "%(error)s"), {'nodes': nodes, 'error': e})
+        return 0
+    if not nodes:
+        return 0
+    start = time.time()
+    # lsdef prints stanzas, not node records, load it in one go
+    try:
+        out, err = xcat_util.exec_xcatcmd_range(
+            nodes, 'lsdef', '', priority=xcat_util.PRIORITY_READ)
+    except (processutils.ProcessExecutionError, OSError) as e:
+        LOG.warning(_("Bulk lsdef failed: %s"), e)
+        out = ''
+    definitions = xcat_util.parse_lsdef_output(out)
+    for name, attrs in definitions.items():
+        STATE.update(name, attrs=attrs)
+    # the BMCs are queried from the service node of every node
+    groups = xcat_util.group_by_service_node(dict(
+        (name, definitions.get(name, {}).get('xcatmaster'))
+        for name in (definitions or nodes)))
+    for service_node, group in groups.items():
+        for record in _query(group, 'rpower', 'stat', service_node):
+            STATE.update(record.node,
+                         power=POWER_STATES.get(record.value, states.ERROR))
+    for record in _query(nodes, 'nodels', 'nodelist.status'):
+        STATE.update(record.node, status=record.value)
+    LOG.info(_("Loaded the xcat state of %(count)d nodes in %(time).1fs"),
+             {'count': len(definitions), 'time': time.time() - start})
+    return len(definitions)
+
+
+def _flush():
+    with _pending_lock:
+        nodes = sorted(_pending)
+        _pending.clear()
+        _flush_scheduled[0] = False
+    try:
+        warm_up(nodes)
+    except Exception as e:
+        LOG.warning(_("Failed to warm up the xcat state: %s"), e)
+
+
+def request_warm_up(xcat_node):
+    """Queue a node for the next bulk warm up.
+
+    Requests arriving within CONF.xcat.warmup_batch_window are loaded
+    together with one query per command.
+    """
+    if STATE.get(xcat_node, 'attrs', CONF.xcat.state_cache_ttl) is not None:
+        return
+    with _pending_lock:
+        _pending.add(xcat_node)
+        if _flush_scheduled[0]:
+            return
+        _flush_scheduled[0] = True
+    eventlet.spawn_after(CONF.xcat.warmup_batch_window, _flush)
+
+
+def warm_up_at_start():
+    """Load the state of CONF.xcat.warmup_noderange in the background."""
+    if CONF.xcat.warmup_noderange:
+        eventlet.spawn_n(warm_up, CONF.xcat.warmup_noderange)
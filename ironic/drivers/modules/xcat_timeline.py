@@ -0,0 +1,216 @@
+"""
+deploy timeline for the xcat baremetal driver
+record the start/end time of every deploy phase and the observed
+nodelist.status transitions on the node, keep the finished timelines
+in CONF.xcat.timeline_file, and aggregate the recorded timelines of many
+nodes into per phase percentiles
+"""
+
+import contextlib
+import json
+import math
+import os
+import time
+
+from oslo.config import cfg
+
+from ironic.common import paths
+from ironic.openstack.common import lockutils
+from ironic.openstack.common import log as logging
+
+xcat_opts = [
+    cfg.StrOpt('timeline_file',
+               default=paths.state_path_def('xcat_timelines.json'),
+               help='File keeping the finished deploy timelines, they '
+               'outlive the instance_info of the node cleared on '
+               'tear_down'),
+    cfg.IntOpt('timeline_history',
+               default=1000,
+               help='Finished deploy timelines kept in timeline_file'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+TIMELINE_KEY = 'xcat_deploy_timeline'
+TIMELINE_SEMAPHORE = 'xcat_timeline'
+
+# deploy phases in the order they normally happen
+# boot replaces install for the diskless and statelite deploy modes,
+# dhcp_opts replaces ssh with dhcp_suppression=neutron
+PHASES = ('glance', 'neutron', 'ssh', 'dhcp_opts', 'chdef', 'hosts',
+          'makedhcp', 'nodeset', 'reboot', 'install', 'boot')
+
+
+def _node_store_name(node):
+    """Return the name of the node field holding the timeline.
+
+    Newer ironic releases have a driver_internal_info field for data
+    owned by the driver, fall back to instance_info when it is missing.
+    """
+    if hasattr(node, 'driver_internal_info'):
+        return 'driver_internal_info'
+    return 'instance_info'
+
+
+class DeployTimeline(object):
+    """Per deploy timeline of a single node."""
+
+    def __init__(self, data=None):
+        self.data = data or {'phases': {}, 'status': []}
+
+    @classmethod
+    def start(cls, image=None):
+        """Begin a new timeline for a deployment."""
+        return cls({'started_at': time.time(),
+                    'image': image,
+                    'phases': {},
+                    'status': []})
+
+    @classmethod
+    def load(cls, node):
+        """Load the timeline of the node, or begin a new one."""
+        store = getattr(node, _node_store_name(node)) or {}
+        data = store.get(TIMELINE_KEY)
+        if not data:
+            return cls.start()
+        return cls(data)
+
+    def save(self, node):
+        """Write the timeline back to the node and persist it.
+
+        A finished timeline is also added to the history file.
+        """
+        name = _node_store_name(node)
+        store = dict(getattr(node, name) or {})
+        store[TIMELINE_KEY] = self.data
+        setattr(node, name, store)
+        try:
+            node.save()
+        except Exception as e:
+            LOG.warning(_("Failed to save the deploy timeline of node "
+                          "%(node)s: %(error)s"),
+                        {'node': node.uuid, 'error': e})
+        if 'finished_at' in self.data:
+            _remember(node.uuid, self.data)
+
+    def set_image(self, image):
+        self.data['image'] = image
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager recording the duration of a deploy phase."""
+        start = time.time()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            end = time.time()
+            self.data['phases'][name] = {'start': start,
+                                         'end': end,
+                                         'duration': end - start,
+                                         'ok': ok}
+
+    def record_status(self, status):
+        """Record a nodelist.status value if it differs from the last one."""
+        transitions = self.data['status']
+        if transitions and transitions[-1][1] == status:
+            return
+        transitions.append([time.time(), status])
+
+    def finish(self, result):
+        self.data['finished_at'] = time.time()
+        self.data['result'] = result
+
+
+def load_history():
+    """Return the finished timelines kept in the history file."""
+    try:
+        with open(CONF.xcat.timeline_file) as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return []
+    except ValueError:
+        LOG.warning(_("Ignoring the corrupted deploy timeline history %s"),
+                    CONF.xcat.timeline_file)
+        return []
+
+
+@lockutils.synchronized(TIMELINE_SEMAPHORE, 'xcat-timeline-')
+def _remember(node_uuid, data):
+    history = load_history()
+    entry = dict(data, node=node_uuid)
+    # a timeline saved again replaces its earlier copy
+    history = [t for t in history
+               if (t.get('node'), t.get('started_at')) !=
+               (node_uuid, data.get('started_at'))]
+    history.append(entry)
+    history = history[-CONF.xcat.timeline_history:]
+    path = CONF.xcat.timeline_file
+    tmp = '%s.tmp' % path
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(history, f)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        LOG.warning(_("Failed to save the deploy timeline history: %s"), e)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(ordered))) - 1
+    rank = max(0, min(rank, len(ordered) - 1))
+    return ordered[rank]
+
+
+def summarize(timelines):
+    """Compute the p50/p95 duration of each phase across timelines.
+
+    :param timelines: iterable of timeline dicts as saved on the nodes.
+    :returns: dict keyed by group ('all' and every image name), each value
+        is a dict of phase name to {'count', 'p50', 'p95', 'max'}.
+    """
+    durations = {}
+    for timeline in timelines:
+        if not timeline:
+            continue
+        groups = ['all']
+        if timeline.get('image'):
+            groups.append(timeline['image'])
+        for name, phase in timeline.get('phases', {}).items():
+            for group in groups:
+                durations.setdefault(group, {}).setdefault(
+                    name, []).append(phase['duration'])
+
+    report = {}
+    for group, phases in durations.items():
+        report[group] = {}
+        for name, values in phases.items():
+            report[group][name] = {'count': len(values),
+                                   'p50': percentile(values, 50),
+                                   'p95': percentile(values, 95),
+                                   'max': max(values)}
+    return report
+
+
+def format_report(report):
+    """Format the summarize() result as a text table."""
+    lines = []
+    known = list(PHASES)
+    for group in sorted(report, key=lambda g: (g != 'all', g)):
+        lines.append(group)
+        phases = report[group]
+        names = [p for p in known if p in phases]
+        names.extend(sorted(p for p in phases if p not in known))
+        for name in names:
+            stat = phases[name]
+            lines.append("  %-10s count=%-5d p50=%8.1fs p95=%8.1fs "
+                         "max=%8.1fs" % (name, stat['count'], stat['p50'],
+                                         stat['p95'], stat['max']))
+    return "\n".join(lines)
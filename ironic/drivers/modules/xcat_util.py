@@ -2,14 +2,36 @@
 util for xcat baremetal driver
 exec_xcatcmd
 xcat_ssh  to excute remote cmd
+XcatExecutor to bound the number of concurrent xcat processes
+ServiceNodeRouter to run xcat commands on the service node of the node
+stream_xcatcmd to parse noderange output while it arrives
+run_concurrently to drive many xcat operations from a pool of green
+threads
 """
-import paramiko
+import collections
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
 import time
 import socket
+import eventlet
+from eventlet.green import subprocess
+import six
+
+from ironic.openstack.common import importutils
 from ironic.openstack.common import log as logging
 from oslo.config import cfg
+from ironic.drivers.modules import xcat_breaker
 from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_profile
+from ironic.drivers.modules import xcat_timeline
+from ironic.common import paths
 from ironic.common import utils
+from ironic.openstack.common import processutils
 
 xcat_opts = [
     cfg.IntOpt('ssh_session_timeout',
@@ -29,6 +51,58 @@ xcat_opts = [
                default=None,
                help='Maximum size (in charactor) of cache for ssh, '
                'including those in use'),
+    cfg.IntOpt('max_concurrent_cmds',
+               default=32,
+               help='Maximum number of xcat commands running at the same '
+               'time on this conductor, 0 means no limit'),
+    cfg.IntOpt('node_info_cache_size',
+               default=10000,
+               help='Maximum number of parsed driver/deploy info records '
+               'cached per kind, 0 disables the cache'),
+    cfg.IntOpt('noderange_chunk_size',
+               default=500,
+               help='Maximum number of nodes passed to one xcat command '
+               'run against a noderange'),
+    cfg.StrOpt('probe_cache_file',
+               default=paths.state_path_def('xcat_probe_cache.json'),
+               help='File persisting the results of the tool capability '
+               'probes run at driver load, empty to disable'),
+    cfg.BoolOpt('service_node_routing',
+                default=False,
+                help='Run the xcat commands of a node on its xcatmaster '
+                'service node instead of the management node'),
+    cfg.StrOpt('management_node',
+               default=None,
+               help='Address of the xcat management node, commands of '
+               'nodes whose xcatmaster is this address are not routed'),
+    cfg.IntOpt('xcatd_port',
+               default=3001,
+               help='Port of the xcatd daemon on the service nodes'),
+    cfg.IntOpt('service_node_max_concurrent_cmds',
+               default=8,
+               help='Maximum number of xcat commands running at the same '
+               'time on one service node, 0 means no limit'),
+    cfg.IntOpt('service_node_failure_threshold',
+               default=3,
+               help='Consecutive failures after which a service node is '
+               'considered down and its commands run on the management '
+               'node'),
+    cfg.IntOpt('service_node_retry_interval',
+               default=60,
+               help='Seconds before a service node considered down is '
+               'tried again'),
+    cfg.FloatOpt('max_cmd_rate',
+                 default=0,
+                 help='Maximum number of xcat commands started per second '
+                 'by this process, 0 means no limit'),
+    cfg.IntOpt('cmd_rate_burst',
+               default=10,
+               help='Number of xcat commands that may start at once before '
+               'max_cmd_rate applies'),
+    cfg.IntOpt('max_concurrent_operations',
+               default=1000,
+               help='Default number of green threads run_concurrently '
+               'drives at the same time'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -38,17 +112,548 @@ CONF.register_opts(xcat_opts, group='xcat')
 
 LAST_CMD_TIME = {}
 
+# imported on first use, see _paramiko()
+paramiko = None
+
+# priority classes of the xcat commands, lower value runs first
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_READ = 2
+PRIORITY_NAMES = {PRIORITY_CRITICAL: 'critical',
+                  PRIORITY_NORMAL: 'normal',
+                  PRIORITY_READ: 'read'}
+
+# default priority of the xcat commands when the caller does not pass one
+COMMAND_PRIORITY = {'nodeset': PRIORITY_CRITICAL,
+                    'makedhcp': PRIORITY_CRITICAL,
+                    'rsetboot': PRIORITY_CRITICAL,
+                    'chdef': PRIORITY_NORMAL,
+                    'nodech': PRIORITY_NORMAL,
+                    'nodels': PRIORITY_READ,
+                    'lsdef': PRIORITY_READ,
+                    'rinv': PRIORITY_READ,
+                    'rvitals': PRIORITY_READ}
+RPOWER_READ_ARGS = ('stat', 'state', 'status')
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+_ROUTER = None
+_RATE_LIMITER = None
+
+# stderr of the xcat client when it can not reach xcatd itself; the
+# socket errors of a BMC are reported on lines naming the node
+XCATD_UNREACHABLE_RE = re.compile(
+    r'Unable to open socket connection to xcatd', re.I)
+
+
+def command_priority(command, args=''):
+    """Return the priority class of a xcat command."""
+    if command == 'rpower':
+        if args.strip() in RPOWER_READ_ARGS:
+            return PRIORITY_READ
+        return PRIORITY_CRITICAL
+    return COMMAND_PRIORITY.get(command, PRIORITY_NORMAL)
+
+
+class XcatExecutor(object):
+    """Run xcat commands with a bound on the concurrent processes.
+
+    Callers waiting for a free slot are woken up by priority class first
+    and in arrival order within a class, the time spent in the queue is
+    recorded for every class.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._peak = 0
+        self._stats = dict((p, {'count': 0,
+                                'queued': 0,
+                                'wait_total': 0.0,
+                                'wait_max': 0.0,
+                                'samples': collections.deque(maxlen=1000)})
+                           for p in PRIORITY_NAMES)
+
+    def _acquire(self, priority):
+        with self._lock:
+            if (not self.max_workers or
+                    (self._running < self.max_workers and
+                     not self._waiters)):
+                self._take()
+                return
+            event = threading.Event()
+            heapq.heappush(self._waiters, (priority, next(self._seq), event))
+            self._stats[priority]['queued'] += 1
+        event.wait()
+
+    def _take(self):
+        self._running += 1
+        self._peak = max(self._peak, self._running)
+
+    def _release(self):
+        with self._lock:
+            self._running -= 1
+            if self._waiters:
+                priority, seq, event = heapq.heappop(self._waiters)
+                self._stats[priority]['queued'] -= 1
+                self._take()
+                event.set()
+
+    def _record(self, priority, waited):
+        stat = self._stats[priority]
+        stat['count'] += 1
+        stat['wait_total'] += waited
+        stat['wait_max'] = max(stat['wait_max'], waited)
+        stat['samples'].append(waited)
+
+    @contextlib.contextmanager
+    def slot(self, priority=PRIORITY_NORMAL):
+        """Context manager holding one process slot."""
+        queued_at = time.time()
+        get_rate_limiter().acquire()
+        with xcat_profile.timed(xcat_profile.QUEUE):
+            self._acquire(priority)
+        self._record(priority, time.time() - queued_at)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def execute(self, cmd, priority=PRIORITY_NORMAL, **kwargs):
+        """Execute a command once a slot is free.
+
+        :param cmd: the command and its arguments as a list.
+        :param priority: one of the PRIORITY_* classes.
+        :returns: (stdout, stderr) from utils.execute.
+        """
+        with self.slot(priority):
+            with xcat_profile.timed(xcat_profile.SUBPROCESS):
+                return utils.execute(*cmd, **kwargs)
+
+    def get_stats(self):
+        """Return the queue time metrics of every priority class."""
+        stats = {'max_workers': self.max_workers,
+                 'running': self._running,
+                 'peak_running': self._peak,
+                 'queued': len(self._waiters),
+                 'rate_limit_wait': get_rate_limiter().waited,
+                 'classes': {}}
+        for priority, stat in self._stats.items():
+            stats['classes'][PRIORITY_NAMES[priority]] = {
+                'count': stat['count'],
+                'queued': stat['queued'],
+                'wait_avg': (stat['wait_total'] / stat['count']
+                             if stat['count'] else 0.0),
+                'wait_p95': xcat_timeline.percentile(stat['samples'],
+                                                     95) or 0.0,
+                'wait_max': stat['wait_max']}
+        return stats
+
+
+class RateLimiter(object):
+    """Token bucket bounding the rate xcat commands are started at.
+
+    Waiting callers sleep cooperatively, other green threads keep
+    running meanwhile.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._stamp = time.time()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                self._refill(time.time())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            self.waited += delay
+            with xcat_profile.timed(xcat_profile.RATE_LIMIT):
+                eventlet.sleep(delay)
+
+
+def get_rate_limiter():
+    """Return the command rate limiter shared by the process."""
+    global _RATE_LIMITER
+    if _RATE_LIMITER is None:
+        with _EXECUTOR_LOCK:
+            if _RATE_LIMITER is None:
+                _RATE_LIMITER = RateLimiter(CONF.xcat.max_cmd_rate,
+                                            CONF.xcat.cmd_rate_burst)
+    return _RATE_LIMITER
+
+
+def get_executor():
+    """Return the executor shared by every xcat command of the process."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = XcatExecutor(CONF.xcat.max_concurrent_cmds)
+    return _EXECUTOR
+
+
+class ServiceNodeRouter(object):
+    """Route xcat commands to the service node managing the node.
+
+    The xcat client talks to the xcatd given by XCATHOST, every service
+    node gets its own bound on the concurrent commands and a health
+    record: after service_node_failure_threshold consecutive failures
+    the service node is skipped, its commands run on the management
+    node, until service_node_retry_interval has passed.
+    """
+
+    def __init__(self, max_workers, failure_threshold, retry_interval):
+        self.max_workers = max_workers
+        self.failure_threshold = failure_threshold
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._nodes = {}
+
+    def _get(self, service_node):
+        with self._lock:
+            sn = self._nodes.get(service_node)
+            if sn is None:
+                sn = {'semaphore': (threading.BoundedSemaphore(
+                                        self.max_workers)
+                                    if self.max_workers else None),
+                      'running': 0,
+                      'sent': 0,
+                      'failed': 0,
+                      'fallbacks': 0,
+                      'consecutive_failures': 0,
+                      'down_until': 0}
+                self._nodes[service_node] = sn
+        return sn
+
+    def route(self, xcatmaster):
+        """Return the service node to run a command on, None for local."""
+        if not CONF.xcat.service_node_routing or not xcatmaster:
+            return None
+        if xcatmaster in (CONF.xcat.management_node, 'localhost',
+                          '127.0.0.1'):
+            return None
+        sn = self._get(xcatmaster)
+        if sn['down_until'] > time.time():
+            sn['fallbacks'] += 1
+            return None
+        return xcatmaster
+
+    def report(self, service_node, ok):
+        """Record the outcome of a command run on a service node."""
+        sn = self._get(service_node)
+        with self._lock:
+            if ok:
+                sn['consecutive_failures'] = 0
+                sn['down_until'] = 0
+                return
+            sn['failed'] += 1
+            sn['consecutive_failures'] += 1
+            if (sn['consecutive_failures'] >= self.failure_threshold and
+                    not sn['down_until']):
+                sn['down_until'] = time.time() + self.retry_interval
+                LOG.warning(_("xcat service node %(sn)s failed %(count)d "
+                              "times, running its commands on the "
+                              "management node for %(retry)ds"),
+                            {'sn': service_node,
+                             'count': sn['consecutive_failures'],
+                             'retry': self.retry_interval})
+            elif sn['down_until']:
+                # the probe after the retry interval failed as well
+                sn['down_until'] = time.time() + self.retry_interval
+
+    @contextlib.contextmanager
+    def slot(self, service_node):
+        """Hold a command slot of the service node.
+
+        :returns: the environment to run the xcat client with.
+        """
+        sn = self._get(service_node)
+        if sn['semaphore'] is not None:
+            sn['semaphore'].acquire()
+        sn['running'] += 1
+        sn['sent'] += 1
+        try:
+            env = dict(os.environ)
+            env['XCATHOST'] = '%s:%d' % (service_node, CONF.xcat.xcatd_port)
+            yield env
+        finally:
+            sn['running'] -= 1
+            if sn['semaphore'] is not None:
+                sn['semaphore'].release()
+
+    def get_stats(self):
+        """Return the load and health of every service node."""
+        now = time.time()
+        stats = {}
+        for service_node, sn in self._nodes.items():
+            stats[service_node] = {
+                'running': sn['running'],
+                'sent': sn['sent'],
+                'failed': sn['failed'],
+                'fallbacks': sn['fallbacks'],
+                'consecutive_failures': sn['consecutive_failures'],
+                'down': sn['down_until'] > now}
+        return stats
+
+
+def get_router():
+    """Return the service node router shared by the process."""
+    global _ROUTER
+    if _ROUTER is None:
+        with _EXECUTOR_LOCK:
+            if _ROUTER is None:
+                _ROUTER = ServiceNodeRouter(
+                    CONF.xcat.service_node_max_concurrent_cmds,
+                    CONF.xcat.service_node_failure_threshold,
+                    CONF.xcat.service_node_retry_interval)
+    return _ROUTER
+
+
+def group_by_service_node(node_masters):
+    """Group xcat nodes by the service node their commands run on.
+
+    :param node_masters: dict of xcat node name to its xcatmaster.
+    :returns: dict of service node, None for the management node, to the
+        sorted list of its xcat nodes.
+    """
+    router = get_router()
+    groups = {}
+    for xcat_node, xcatmaster in node_masters.items():
+        groups.setdefault(router.route(xcatmaster), []).append(xcat_node)
+    for nodes in groups.values():
+        nodes.sort()
+    return groups
+
+
+@contextlib.contextmanager
+def _local():
+    """Counterpart of ServiceNodeRouter.slot for the management node."""
+    yield None
+
+
+def _xcatd_unreachable(err):
+    """Whether the xcat client failed to connect to xcatd."""
+    for line in (err or '').splitlines():
+        record = parse_node_line(line)
+        if record is not None and record.node is not None:
+            continue
+        if XCATD_UNREACHABLE_RE.search(line):
+            return True
+    return False
+
+
+def xcat_execute(cmd, priority=None, service_node=None, **kwargs):
+    """Execute a xcat command through the shared executor.
+
+    When a service node is given the command runs against its xcatd, if
+    the service node can not be reached the command is run again on the
+    management node.
+
+    :param cmd: the command and its arguments as a list.
+    :param priority: one of the PRIORITY_* classes, derived from the
+        command when not given.
+    :param service_node: optional service node returned by
+        ServiceNodeRouter.route.
+    """
+    if priority is None:
+        priority = command_priority(cmd[0], ' '.join(cmd[2:]))
+    if service_node is None:
+        return get_executor().execute(cmd, priority, **kwargs)
+    router = get_router()
+    try:
+        with router.slot(service_node) as env:
+            out, err = get_executor().execute(cmd, priority,
+                                              env_variables=env, **kwargs)
+    except (processutils.ProcessExecutionError, OSError) as e:
+        err = getattr(e, 'stderr', None) or str(e)
+        if not _xcatd_unreachable(err):
+            router.report(service_node, True)
+            raise
+    else:
+        if not _xcatd_unreachable(err):
+            router.report(service_node, True)
+            return out, err
+    router.report(service_node, False)
+    LOG.warning(_("xcat service node %(sn)s unreachable, running %(cmd)s "
+                  "on the management node: %(error)s"),
+                {'sn': service_node, 'cmd': cmd[0], 'error': err})
+    return get_executor().execute(cmd, priority, **kwargs)
+
+class InfoRecord(object):
+    """Compact immutable record of parsed node info.
+
+    Subclasses list their fields in __slots__.  The record supports the
+    read-only dict style access (info['xcat_node'], info.get(...)) used
+    by the callers of the former info dicts.
+    """
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(_("%s is immutable") % self.__class__.__name__)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%s=%r' % (name, getattr(self, name))
+                                     for name in self.__slots__
+                                     if name != 'password'))
+
+
+class NodeInfoCache(object):
+    """Memoize parsed node info keyed by node uuid.
+
+    A cached record is reused while the node fields the parse reads are
+    unchanged.  fields maps a node attribute (driver_info, instance_info)
+    to the keys the parse reads from it; the values of those keys are
+    compared, so a hit costs a few dict lookups and the rest of the node,
+    such as the deploy timeline in instance_info, is never looked at.
+    """
+
+    def __init__(self, parse, fields):
+        self._parse = parse
+        self._fields = tuple((attr, tuple(keys))
+                             for attr, keys in sorted(fields.items()))
+        self._cache = collections.OrderedDict()
+
+    def _key(self, node):
+        key = ()
+        for attr, keys in self._fields:
+            data = getattr(node, attr, None) or {}
+            key += tuple(map(data.get, keys))
+        return key
+
+    def __call__(self, node):
+        max_size = CONF.xcat.node_info_cache_size
+        if not max_size:
+            return self._parse(node)
+        key = self._key(node)
+        entry = self._cache.get(node.uuid)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        info = self._parse(node)
+        self._cache.pop(node.uuid, None)
+        self._cache[node.uuid] = (key, info)
+        while len(self._cache) > max_size:
+            self._cache.popitem(last=False)
+        return info
+
+
+def _paramiko():
+    """Import paramiko on first use, it is slow to import."""
+    global paramiko
+    if paramiko is None:
+        paramiko = importutils.import_module('paramiko')
+    return paramiko
+
+
+def _which(binary):
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        candidate = os.path.join(path, binary)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+def cached_probe(name, binary, probe):
+    """Return the result of a tool capability probe.
+
+    The result is persisted in CONF.xcat.probe_cache_file and reused
+    across restarts for as long as the probed binary keeps its path and
+    modification time, so the probe fork only happens after the tool is
+    upgraded.
+
+    :param name: name of the probe.
+    :param binary: the executable the probe depends on.
+    :param probe: callable running the probe, its result must be JSON
+        serializable.
+    """
+    cache_file = CONF.xcat.probe_cache_file
+    path = _which(binary)
+    if not cache_file or not path:
+        return probe()
+    key = '%s:%s:%s' % (name, path, os.path.getmtime(path))
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        cache = {}
+    if key in cache:
+        return cache[key]
+    result = probe()
+    cache = dict((k, v) for k, v in cache.items()
+                 if not k.startswith(name + ':'))
+    cache[key] = result
+    tmp = '%s.%d' % (cache_file, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.rename(tmp, cache_file)
+    except (IOError, OSError) as e:
+        LOG.warning(_("Failed to save the probe cache %(file)s: %(error)s"),
+                    {'file': cache_file, 'error': e})
+    return result
+
+
 def xcat_ssh(ip,port,username,password,cmd):
-    """ exec remote command with ssh  """
+    """ exec remote command with ssh
+
+    :param cmd: list of command lines run one after the other in the same
+        shell session.
+    :returns: list with the output of every command line.
+    """
+    with xcat_profile.timed(xcat_profile.SSH):
+        return _xcat_ssh(ip,port,username,password,cmd)
+
+def _xcat_ssh(ip,port,username,password,cmd):
+    paramiko = _paramiko()
     key =None
     if CONF.xcat.ssh_key:
         try:
             key=paramiko.RSAKey.from_private_key_file(CONF.xcat.ssh_key)
         except paramiko.PasswordRequiredException:
-            if not CONF.ssh_key_pass:
-                raise Exception.message("no pubkey password")
+            if not CONF.xcat.ssh_key_pass:
+                raise Exception("no pubkey password")
             key = paramiko.RSAKey.from_private_key_file(
-                CONF.xcat.ssh_key, CONF.xcat.ssh_key.ssh_key_pass)
+                CONF.xcat.ssh_key, CONF.xcat.ssh_key_pass)
     s = paramiko.SSHClient()
     s.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
@@ -57,24 +662,54 @@ def xcat_ssh(ip,port,username,password,cmd):
     except socket.timeout as e:
         LOG.error(_("Unable to connect to the ssh server Exception: %(exception)s"),
                       {'exception': e})
-    chan = s.invoke_shell()
-    output = chan.recv(CONF.xcat.ssh_buf_size)
-    while not output.rstrip().endswith('#') and not output.rstrip().endswith('$'):
-        output = chan.recv(CONF.xcat.ssh_buf_size)
-    for  c in cmd :
-        _xcat_ssh_exec(chan,c,password)
+    try:
+        chan = s.invoke_shell()
+        _read_to_prompt(chan, _recv(chan))
+        outputs = []
+        for  c in cmd :
+            outputs.append(_xcat_ssh_exec(chan,c,password))
+        return outputs
+    finally:
+        s.close()
+
+def _recv(chan):
+    data = chan.recv(CONF.xcat.ssh_buf_size)
+    if not isinstance(data, str):
+        data = data.decode('utf-8', 'replace')
+    return data
+
+def _at_prompt(output):
+    output = output.rstrip()
+    return output.endswith('#') or output.endswith('$')
+
+def _read_to_prompt(chan, output):
+    """ read from the shell until it shows the prompt again """
+    while not _at_prompt(output):
+        data = _recv(chan)
+        if not data:
+            break
+        output += data
+    return output
 
 def _xcat_ssh_exec(chan,cmd,password):
-    """ exec ssh command """
+    """ exec ssh command, return its output without the echo and prompt """
     chan.send(cmd + '\n')
-    time.sleep(CONF.xcat.ssh_shell_wait)
-    ret = chan.recv(CONF.xcat.ssh_buf_size)
-    if 'password' in ret and ret.rstrip().endswith(':'):
-        chan.send(password + '\n')
-        output = chan.recv(CONF.xcat.ssh_buf_size)
-        while not output.rstrip().endswith('#') and not output.rstrip().endswith('$'):
-            output = chan.recv(CONF.xcat.ssh_buf_size)
-    return output
+    eventlet.sleep(CONF.xcat.ssh_shell_wait)
+    ret = _recv(chan)
+    while not _at_prompt(ret):
+        if 'password' in ret and ret.rstrip().endswith(':'):
+            chan.send(password + '\n')
+            ret = ''
+        data = _recv(chan)
+        if not data:
+            break
+        ret += data
+    lines = ret.replace('\r', '').split('\n')
+    if lines and cmd in lines[0]:
+        lines = lines[1:]
+    if lines and _at_prompt(lines[-1]):
+        lines = lines[:-1]
+    return '\n'.join(lines)
 
 def _tsplit(string, delimiters):
     """ Behaves str.split but supports multiple delimiters. """
@@ -88,23 +723,323 @@ def _tsplit(string, delimiters):
                 stack.insert(i+j, _substring)
     return stack
 
-def exec_xcatcmd(driver_info, command, args):
-    """ excute xcat cmd """
+def _pace(xcat_node):
+    """Wait until the node may get its next command.
+
+    NOTE: ensure that no communications are excuted more often than once
+    every min_command_interval seconds.  The wait is a green sleep, the
+    other operations of the process go on meanwhile.
+    """
+    time_till_next_poll = CONF.ipmi.min_command_interval - (
+        time.time() - LAST_CMD_TIME.get(xcat_node, 0))
+    if time_till_next_poll > 0:
+        with xcat_profile.timed(xcat_profile.PACE):
+            eventlet.sleep(time_till_next_poll)
+
+
+def _bmc_failure(xcat_node, err):
+    """Count a failed command against the BMC if xcat blamed the node.
+
+    Failures of xcatd or of the management node do not name the node,
+    they say nothing about its BMC.
+    """
+    for line in (err or '').splitlines():
+        record = parse_node_line(line)
+        if record is not None and record.error and record.node == xcat_node:
+            xcat_breaker.BREAKER.failure(xcat_node, record.value)
+            return
+    xcat_breaker.BREAKER.inconclusive(xcat_node)
+
+
+def exec_xcatcmd(driver_info, command, args, priority=None):
+    """ excute xcat cmd
+
+    :param driver_info: xcat node info, must contain xcat_node.
+    :param command: the xcat command to run against the node.
+    :param args: space separated arguments of the command.
+    :param priority: one of the PRIORITY_* classes, derived from the
+        command when not given.
+    """
     cmd = [command,
             driver_info['xcat_node']
             ]
     cmd.extend(args.split(" "))
-        # NOTE: ensure that no communications are excuted more
-        #             often than once every min_command_interval seconds.
-    time_till_next_poll = CONF.ipmi.min_command_interval - (
-                time.time() - LAST_CMD_TIME.get(driver_info['xcat_node'], 0))
-    if time_till_next_poll > 0:
-        time.sleep(time_till_next_poll)
+    breaker = None
+    if command in xcat_breaker.BMC_COMMANDS:
+        breaker = xcat_breaker.BREAKER
+        if not breaker.allow(driver_info['xcat_node']):
+            state = breaker.state(driver_info['xcat_node'])
+            raise xcat_exception.xCATBMCCircuitOpen(
+                cmd=command, node=driver_info['xcat_node'],
+                retry_in=state.get('retry_in', 0),
+                error=state.get('last_error'))
+    _pace(driver_info['xcat_node'])
     try:
-        out, err = utils.execute(*cmd)
+        if priority is None:
+            priority = command_priority(command, args)
+        service_node = get_router().route(driver_info.get('xcatmaster'))
+        try:
+            out, err = xcat_execute(cmd, priority, service_node=service_node)
+        except (processutils.ProcessExecutionError, OSError) as e:
+            if breaker is not None:
+                _bmc_failure(driver_info['xcat_node'],
+                             getattr(e, 'stderr', None))
+            raise
         if err:
+            if breaker is not None:
+                _bmc_failure(driver_info['xcat_node'], err)
             raise xcat_exception.xCATCmdFailure(cmd=cmd,node=driver_info['xcat_node'],
                                             args=args)
+        if breaker is not None:
+            breaker.success(driver_info['xcat_node'])
     finally:
         LAST_CMD_TIME[driver_info['xcat_node']] = time.time()
-    return out, err
\ No newline at end of file
+    return out, err
+
+
+def _error_nodes(lines, nodes):
+    """Attribute xcat error lines to the nodes they mention.
+
+    :param lines: output lines of a xcat command.
+    :param nodes: the xcat node names the command ran against.
+    :returns: dict of node name to error message, errors which do not
+        name any node are returned under the None key.
+    """
+    errors = {}
+    for line in lines:
+        line = line.strip()
+        if not line or 'Error' not in line:
+            continue
+        words = set(re.split(r"[\s:,'\"]+", line))
+        matched = [node for node in nodes if node in words]
+        for node in matched or [None]:
+            errors.setdefault(node, line)
+    return errors
+
+
+def chdef_mac_addresses(node_macs):
+    """Set the mac address of many xcat nodes with a single chdef call.
+
+    The mac table is updated through one stanza fed to `chdef -z`, so
+    registering a whole rack is one xcat transaction instead of a chdef
+    process per node.
+
+    :param node_macs: dict of xcat node name to mac address.
+    :returns: dict of xcat node name to error message for the nodes whose
+        mac could not be set, empty when all succeeded.
+    :raises: xCATCmdFailure if chdef could not be run at all.
+    """
+    if not node_macs:
+        return {}
+    nodes = sorted(node_macs)
+    stanza = ''.join('%s:\n    objtype=node\n    mac=%s\n'
+                     % (node, node_macs[node]) for node in nodes)
+    cmd = ['chdef', '-z']
+    try:
+        out, err = xcat_execute(cmd, process_input=stanza,
+                                check_exit_code=[0, 1])
+    except (processutils.ProcessExecutionError, OSError) as e:
+        LOG.warning(_("xcat chdef -z failed for nodes %(nodes)s with "
+                      "error: %(error)s"),
+                    {'nodes': ','.join(nodes), 'error': e})
+        raise xcat_exception.xCATCmdFailure(cmd=cmd, node=','.join(nodes),
+                                            args='mac')
+    errors = _error_nodes((out + '\n' + err).splitlines(), nodes)
+    if None in errors:
+        # an error xcat did not attribute to a node, fail every node
+        # that has no error of its own
+        unknown = errors.pop(None)
+        for node in nodes:
+            errors.setdefault(node, unknown)
+    return errors
+
+
+def _chunks(items, size):
+    size = max(size, 1)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def expand_noderange(nodes):
+    """Expand a noderange string into the list of its xcat nodes.
+
+    A group such as 'rack1' is a single word to xcat, it has to be
+    expanded with nodels before its nodes can be chunked.
+
+    :param nodes: list of xcat node names or a noderange string.
+    :returns: list of xcat node names.
+    """
+    if isinstance(nodes, six.string_types):
+        out, err = xcat_execute(['nodels', nodes], PRIORITY_READ)
+        return [line.strip() for line in out.splitlines() if line.strip()]
+    return list(nodes)
+
+
+def exec_xcatcmd_range(nodes, command, args='', priority=None,
+                       service_node=None):
+    """Run a xcat command against many nodes with a noderange.
+
+    The nodes are split in chunks of CONF.xcat.noderange_chunk_size, one
+    process per chunk.  A non-zero exit status does not raise, xcat
+    reports the failed nodes in the output.
+
+    :param nodes: list of xcat node names.
+    :param command: the xcat command.
+    :param args: space separated arguments following the noderange.
+    :param priority: one of the PRIORITY_* classes.
+    :param service_node: optional service node to run the command on.
+    :returns: (stdout, stderr) of all the chunks concatenated.
+    """
+    outs = []
+    errs = []
+    for chunk in _chunks(list(nodes), CONF.xcat.noderange_chunk_size):
+        cmd = [command, ','.join(chunk)]
+        if args:
+            cmd.extend(args.split(' '))
+        out, err = xcat_execute(cmd, priority, service_node=service_node,
+                                check_exit_code=False)
+        outs.append(out)
+        errs.append(err)
+    return ''.join(outs), ''.join(errs)
+
+
+class NodeResult(InfoRecord):
+    """One record of xcat noderange output.
+
+    node is None for errors xcat did not attribute to a node.
+    """
+    __slots__ = ('node', 'value', 'error')
+
+
+def parse_node_line(line):
+    """Parse one line of xcat output into a NodeResult.
+
+    Understands 'node: value', 'node: Error: message' and
+    'Error: node: message' lines.
+
+    :returns: a NodeResult, or None for lines without a node record.
+    """
+    line = line.rstrip('\r\n')
+    if ': ' not in line:
+        if line.startswith('Error'):
+            return NodeResult(node=None, value=line, error=True)
+        return None
+    head, value = line.split(': ', 1)
+    head = head.strip()
+    value = value.strip()
+    if head == 'Error':
+        if ': ' in value:
+            node, message = value.split(': ', 1)
+            if node and ' ' not in node:
+                return NodeResult(node=node, value=message.strip(),
+                                  error=True)
+        return NodeResult(node=None, value=value, error=True)
+    if not head or ' ' in head:
+        return None
+    if value.startswith('Error:'):
+        return NodeResult(node=head, value=value[6:].strip(), error=True)
+    return NodeResult(node=head, value=value, error=False)
+
+
+def parse_node_output(text):
+    """Parse 'node: value' lines into a dict of node name to value.
+
+    Error lines and lines without a node prefix are ignored, when a node
+    has several lines the values are joined with a newline.
+    """
+    result = {}
+    for line in text.splitlines():
+        record = parse_node_line(line)
+        if record is None or record.error:
+            continue
+        if record.node in result:
+            result[record.node] += '\n' + record.value
+        else:
+            result[record.node] = record.value
+    return result
+
+
+def stream_xcatcmd(nodes, command, args='', priority=None,
+                   service_node=None):
+    """Run a xcat command against a noderange and stream the results.
+
+    stdout and stderr are read line by line while the command runs and
+    every node record is yielded as soon as it arrives, so callers can
+    act on the first nodes before the slowest BMC answers and memory
+    stays flat whatever the number of nodes.  The nodes are split in
+    chunks of CONF.xcat.noderange_chunk_size.
+
+    :param nodes: list of xcat node names or a noderange string.
+    :param command: the xcat command.
+    :param args: space separated arguments following the noderange.
+    :param priority: one of the PRIORITY_* classes.
+    :param service_node: optional service node to run the command on.
+    :returns: generator of NodeResult.
+    """
+    if isinstance(nodes, six.string_types):
+        nodes = [nodes]
+    if priority is None:
+        priority = command_priority(command, args)
+    for chunk in _chunks(list(nodes), CONF.xcat.noderange_chunk_size):
+        cmd = [command, ','.join(chunk)]
+        if args:
+            cmd.extend(args.split(' '))
+        if service_node is None:
+            routed = _local()
+        else:
+            routed = get_router().slot(service_node)
+        with routed as env, get_executor().slot(priority):
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    close_fds=True, env=env)
+            try:
+                for line in iter(proc.stdout.readline, b''):
+                    if not isinstance(line, str):
+                        line = line.decode('utf-8', 'replace')
+                    record = parse_node_line(line)
+                    if record is not None:
+                        yield record
+                proc.wait()
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                proc.stdout.close()
+
+
+def parse_lsdef_output(text):
+    """Parse the stanza output of lsdef into {node: {attr: value}}."""
+    result = {}
+    attrs = None
+    for line in text.splitlines():
+        if line.startswith('Object name:'):
+            attrs = result.setdefault(line.split(':', 1)[1].strip(), {})
+        elif attrs is not None and '=' in line:
+            key, value = line.strip().split('=', 1)
+            attrs[key] = value
+    return result
+
+
+def run_concurrently(func, items, concurrency=None):
+    """Call func on every item from a pool of green threads.
+
+    The number of commands actually running stays bound by the executor,
+    the service node limits and the rate limiter, the pool only bounds
+    the green threads waiting for them.
+
+    :param func: callable taking one item.
+    :param items: iterable of the items.
+    :param concurrency: green threads at once, defaults to
+        CONF.xcat.max_concurrent_operations.
+    :returns: list of (item, result, exception) in the order of items,
+        exception is None for the calls which succeeded.
+    """
+    pool = eventlet.GreenPool(concurrency or
+                              CONF.xcat.max_concurrent_operations)
+
+    def _call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+    return list(pool.imap(_call, items))
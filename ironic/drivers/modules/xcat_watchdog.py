@@ -0,0 +1,167 @@
+"""
+deploy watchdog for the xcat baremetal driver
+follow the serial console output conserver logs for a deploying node
+in a bounded ring buffer and report known fatal messages (kernel
+panic, kickstart errors, PXE loops) as soon as they show up
+"""
+
+import collections
+import os
+import re
+
+from oslo.config import cfg
+
+from ironic.drivers.modules import xcat_console
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import processutils
+
+xcat_opts = [
+    cfg.BoolOpt('deploy_console_watchdog',
+                default=False,
+                help='Follow the serial console of deploying nodes and '
+                'fail the deploy as soon as a fatal message shows up'),
+    cfg.ListOpt('deploy_fatal_patterns',
+                default=['Kernel panic',
+                         'kickstart.*[Ee]rror',
+                         '[Ee]rror.*kickstart',
+                         'Unable to download the kickstart',
+                         'PXE-E[0-9][0-9]',
+                         'No bootable device',
+                         'dracut.*Could not boot',
+                         'Boot failed'],
+                help='Regular expressions matching fatal deploy messages '
+                'on the serial console'),
+    cfg.StrOpt('deploy_pxe_banner',
+               default='(xNBA|iPXE|PXE [0-9]\\.[0-9]+) ',
+               help='Regular expression matching the banner printed on '
+               'every network boot, used to detect PXE loops'),
+    cfg.IntOpt('deploy_pxe_loop_limit',
+               default=4,
+               help='Number of network boots during one deploy after '
+               'which the node is considered stuck in a PXE loop, '
+               '0 disables the check'),
+    cfg.IntOpt('deploy_console_buffer_lines',
+               default=500,
+               help='Console lines kept per deploying node'),
+    cfg.IntOpt('deploy_console_tail_lines',
+               default=20,
+               help='Console lines attached to a failed deploy'),
+    cfg.IntOpt('deploy_watchdog_interval',
+               default=5,
+               help='Interval (seconds) to check the console of a '
+               'deploying node'),
+    ]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(xcat_opts, group='xcat')
+
+# never read more than this many bytes of console output per poll
+MAX_READ = 1024 * 1024
+
+
+class ConsoleWatchdog(object):
+    """Follow the conserver log of one node during a deploy."""
+
+    def __init__(self, xcat_node, patterns=None, max_lines=None):
+        self.xcat_node = xcat_node
+        self.path = os.path.join(CONF.xcat.conserver_log_dir, xcat_node)
+        if patterns is None:
+            patterns = CONF.xcat.deploy_fatal_patterns
+        self.patterns = [re.compile(p) for p in patterns]
+        self.banner = re.compile(CONF.xcat.deploy_pxe_banner)
+        self.buffer = collections.deque(
+            maxlen=max_lines or CONF.xcat.deploy_console_buffer_lines)
+        self.netboots = 0
+        self.fatal = None
+        self._offset = 0
+        self._partial = ''
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def start(self):
+        """Make sure conserver logs the node and skip the old output.
+
+        makeconservercf is idempotent and always run, a log file left by
+        a console session closed with makeconservercf -d is no longer
+        written to.  The node is kept in conserver until stop().
+        """
+        xcat_console.keep_conserver(self.xcat_node)
+        try:
+            xcat_util.xcat_execute(['makeconservercf', self.xcat_node])
+        except (processutils.ProcessExecutionError, OSError) as e:
+            LOG.warning(_("Console watchdog can not configure conserver "
+                          "for node %(node)s: %(error)s"),
+                        {'node': self.xcat_node, 'error': e})
+        self._offset = self._size()
+        return self
+
+    def stop(self):
+        """Let an idle console session remove the node from conserver."""
+        xcat_console.release_conserver(self.xcat_node)
+
+    def _read(self):
+        size = self._size()
+        if size < self._offset:
+            # the log was rotated or truncated
+            self._offset = 0
+            self._partial = ''
+        if size == self._offset:
+            return ''
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(min(size - self._offset, MAX_READ))
+        except IOError:
+            return ''
+        self._offset += len(data)
+        return data.decode('utf-8', 'replace')
+
+    def _check(self, line):
+        for pattern in self.patterns:
+            if pattern.search(line):
+                return line
+        limit = CONF.xcat.deploy_pxe_loop_limit
+        if limit and self.banner.search(line):
+            self.netboots += 1
+            if self.netboots > limit:
+                return _("PXE loop, %(count)d network boots: %(line)s") % {
+                    'count': self.netboots, 'line': line}
+        return None
+
+    def poll(self):
+        """Consume the new console output.
+
+        :returns: the first fatal console line seen, None if none yet.
+        """
+        if self.fatal:
+            return self.fatal
+        data = self._read()
+        if not data:
+            return None
+        lines = (self._partial + data).replace('\r', '').split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                continue
+            self.buffer.append(line)
+            fatal = self._check(line)
+            if fatal:
+                LOG.warning(_("Fatal console output from node %(node)s: "
+                              "%(line)s"),
+                            {'node': self.xcat_node, 'line': fatal})
+                self.fatal = fatal
+                return fatal
+        return None
+
+    def tail(self, lines=None):
+        """Return the last console lines as one string."""
+        lines = lines or CONF.xcat.deploy_console_tail_lines
+        return '\n'.join(list(self.buffer)[-lines:])
@@ -4,13 +4,21 @@ use xcat to deploy a baremetal machine
 """
 
 
+from oslo.config import cfg
+
 from ironic.drivers import base
 from ironic.drivers.modules import ipmitool
 from ironic.drivers.modules import pxe
+from ironic.drivers.modules import xcat_console
+from ironic.drivers.modules import xcat_flash
+from ironic.drivers.modules import xcat_inspect
+from ironic.drivers.modules import xcat_profile
 from ironic.drivers.modules import xcat_pxe
 from ironic.drivers import utils
 from ironic.drivers.modules import xcat_rpower
 
+CONF = cfg.CONF
+
 
 class XCATBaremetalDriver(base.BaseDriver):
     """xCAT driver
@@ -21,10 +29,29 @@ class XCATBaremetalDriver(base.BaseDriver):
     """
     def __init__(self):
         self.power = xcat_rpower.XcatPower()
-        self.console = ipmitool.IPMIShellinaboxConsole()
+        if CONF.xcat.console_mode == 'conserver':
+            self.console = xcat_console.XcatConserverConsole()
+        else:
+            # share the (cached) ipmitool probe result of the power
+            # interface instead of forking ipmitool once more
+            ipmitool._is_timing_supported(
+                xcat_rpower._is_timing_supported())
+            self.console = ipmitool.IPMIShellinaboxConsole()
         self.deploy = xcat_pxe.PXEDeploy()
         self.pxe_vendor = pxe.VendorPassthru()
         self.ipmi_vendor = ipmitool.VendorPassthru()
+        self.xcat_vendor = xcat_rpower.XcatVendorPassthru()
+        self.inspect_vendor = xcat_inspect.XcatInspect()
+        self.flash_vendor = xcat_flash.XcatFlash()
+        self.profile_vendor = xcat_profile.XcatProfile()
         self.mapping = {'pass_deploy_info': self.pxe_vendor,
                         'set_boot_device': self.ipmi_vendor}
-        self.vendor = utils.MixinVendorInterface(self.mapping)
\ No newline at end of file
+        self.driver_mapping = {}
+        for vendor in (self.xcat_vendor, self.inspect_vendor,
+                       self.flash_vendor, self.profile_vendor):
+            for method in vendor.NODE_METHODS:
+                self.mapping[method] = vendor
+            for method in vendor.DRIVER_METHODS:
+                self.driver_mapping[method] = vendor
+        self.vendor = utils.MixinVendorInterface(self.mapping,
+                                                 self.driver_mapping)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+tests of the per BMC circuit breaker
+"""
+
+import mock
+
+from ironic.drivers.modules import xcat_breaker
+from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_util
+from ironic.openstack.common import processutils
+from ironic.tests import base
+
+
+@mock.patch.object(xcat_breaker.time, 'time')
+class BMCBreakerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(BMCBreakerTestCase, self).setUp()
+        self.config(bmc_breaker_threshold=2, bmc_breaker_open_time=10,
+                    bmc_breaker_max_open_time=25,
+                    bmc_breaker_probe_interval=0, group='xcat')
+        self.breaker = xcat_breaker.BMCBreaker()
+
+    def _state(self):
+        return self.breaker.state('n01')['state']
+
+    def test_opens_at_threshold(self, time_mock):
+        time_mock.return_value = 100
+        self.breaker.failure('n01', 'Timeout')
+        self.assertEqual(xcat_breaker.CLOSED, self._state())
+        self.assertTrue(self.breaker.allow('n01'))
+        self.breaker.failure('n01', 'Timeout')
+        self.assertEqual(xcat_breaker.OPEN, self._state())
+        self.assertFalse(self.breaker.allow('n01'))
+        self.assertEqual(10, self.breaker.state('n01')['retry_in'])
+
+    def test_success_resets_count(self, time_mock):
+        time_mock.return_value = 100
+        self.breaker.failure('n01')
+        self.breaker.success('n01')
+        self.breaker.failure('n01')
+        self.assertEqual(xcat_breaker.CLOSED, self._state())
+
+    def test_half_open_probe(self, time_mock):
+        time_mock.return_value = 100
+        self.breaker.failure('n01')
+        self.breaker.failure('n01')
+        time_mock.return_value = 110
+        self.assertTrue(self.breaker.allow('n01'))
+        self.assertEqual(xcat_breaker.HALF_OPEN, self._state())
+        # only one probe runs at a time
+        self.assertFalse(self.breaker.allow('n01'))
+        self.breaker.success('n01')
+        self.assertEqual(xcat_breaker.CLOSED, self._state())
+
+    def test_failed_probe_backs_off(self, time_mock):
+        time_mock.return_value = 100
+        self.breaker.failure('n01')
+        self.breaker.failure('n01')
+        for now, open_time in ((110, 20), (130, 25)):
+            time_mock.return_value = now
+            self.assertTrue(self.breaker.allow('n01'))
+            self.breaker.failure('n01')
+            state = self.breaker.state('n01')
+            self.assertEqual(xcat_breaker.OPEN, state['state'])
+            self.assertEqual(open_time, state['open_time'])
+
+    def test_inconclusive_probe(self, time_mock):
+        time_mock.return_value = 100
+        self.breaker.failure('n01')
+        self.breaker.failure('n01')
+        time_mock.return_value = 110
+        self.assertTrue(self.breaker.allow('n01'))
+        self.breaker.inconclusive('n01')
+        state = self.breaker.state('n01')
+        self.assertEqual(xcat_breaker.OPEN, state['state'])
+        self.assertEqual(10, state['open_time'])
+        self.assertTrue(self.breaker.allow('n01'))
+
+    def test_background_probe(self, time_mock):
+        self.config(bmc_breaker_probe_interval=60, group='xcat')
+        time_mock.return_value = 100
+        self.breaker.failure('n01')
+        self.breaker.failure('n01')
+        time_mock.return_value = 110
+        self.assertFalse(self.breaker.allow('n01'))
+        self.assertEqual(['n01'], self.breaker.due())
+
+    def test_disabled(self, time_mock):
+        self.config(bmc_breaker_threshold=0, group='xcat')
+        time_mock.return_value = 100
+        for i in range(5):
+            self.breaker.failure('n01')
+        self.assertTrue(self.breaker.allow('n01'))
+
+
+class ExecXcatcmdBreakerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ExecXcatcmdBreakerTestCase, self).setUp()
+        self.config(bmc_breaker_threshold=1, group='xcat')
+        breaker_patch = mock.patch.object(xcat_breaker, 'BREAKER',
+                                          xcat_breaker.BMCBreaker())
+        self.breaker = breaker_patch.start()
+        self.addCleanup(breaker_patch.stop)
+        self.info = {'xcat_node': 'n01', 'xcatmaster': None}
+
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    def test_bmc_error_counted(self, execute_mock):
+        execute_mock.return_value = ('', 'n01: Error: No route to host\n')
+        self.assertRaises(xcat_exception.xCATCmdFailure,
+                          xcat_util.exec_xcatcmd, self.info, 'rpower', 'on')
+        state = self.breaker.state('n01')
+        self.assertEqual(xcat_breaker.OPEN, state['state'])
+        self.assertEqual('No route to host', state['last_error'])
+
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    def test_xcatd_error_not_counted(self, execute_mock):
+        execute_mock.side_effect = processutils.ProcessExecutionError(
+            stderr='Unable to open socket connection to xcatd daemon')
+        self.assertRaises(processutils.ProcessExecutionError,
+                          xcat_util.exec_xcatcmd, self.info, 'rpower', 'on')
+        self.assertEqual(xcat_breaker.CLOSED,
+                         self.breaker.state('n01')['state'])
+
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    def test_other_node_error_not_counted(self, execute_mock):
+        execute_mock.return_value = ('', 'n02: Error: Timeout\n')
+        self.assertRaises(xcat_exception.xCATCmdFailure,
+                          xcat_util.exec_xcatcmd, self.info, 'rpower', 'on')
+        self.assertEqual(xcat_breaker.CLOSED,
+                         self.breaker.state('n01')['state'])
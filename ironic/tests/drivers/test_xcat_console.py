@@ -0,0 +1,44 @@
+"""
+tests of the xcat console sessions
+"""
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from ironic.drivers.modules import xcat_console
+from ironic.drivers.modules import xcat_util
+from ironic.drivers.modules import xcat_watchdog
+from ironic.tests import base
+
+
+@mock.patch.object(xcat_util, 'xcat_execute')
+class CloseSessionTestCase(base.TestCase):
+
+    def setUp(self):
+        super(CloseSessionTestCase, self).setUp()
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.config(console_session_dir=tempdir, group='xcat')
+        self.session = os.path.join(tempdir, 'n01')
+        open(self.session, 'w').close()
+
+    def test_close(self, execute_mock):
+        xcat_console.close_session('n01')
+        execute_mock.assert_called_once_with(['makeconservercf', '-d',
+                                              'n01'])
+        self.assertFalse(os.path.exists(self.session))
+
+    def test_close_during_watchdog(self, execute_mock):
+        watchdog = xcat_watchdog.ConsoleWatchdog('n01').start()
+        execute_mock.reset_mock()
+        xcat_console.close_session('n01')
+        self.assertFalse(execute_mock.called)
+        self.assertFalse(os.path.exists(self.session))
+        watchdog.stop()
+        open(self.session, 'w').close()
+        xcat_console.close_session('n01')
+        execute_mock.assert_called_once_with(['makeconservercf', '-d',
+                                              'n01'])
@@ -0,0 +1,123 @@
+"""
+tests of the xcat rinv inventory parsing and batch inspection
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+
+import mock
+
+from ironic.drivers.modules import xcat_inspect
+from ironic.drivers.modules import xcat_util
+from ironic.tests import base
+
+
+class ParseInventoryTestCase(base.TestCase):
+
+    def test_parse(self):
+        lines = ['CPU 1: Intel(R) Xeon(R) CPU E5-2650 x86_64',
+                 'CPU 2: Intel(R) Xeon(R) CPU E5-2650 x86_64',
+                 'CPU 1 Cores: 8',
+                 'CPU 2 Cores: 8',
+                 'DIMM 1: 8192 MB PC3-12800',
+                 'DIMM 2: 8 GB PC3-12800',
+                 'Disk 1: 278.88 GB',
+                 'Disk 2: 1 TB',
+                 'MAC Address 1: 00:1A:64:F9:E1:02',
+                 'MAC Address 2: 00:1a:64:f9:e1:03',
+                 'MAC Address 3: 00:1a:64:f9:e1:02',
+                 'System Serial Number: 06DGM11',
+                 'BMC Firmware: 1.35 (1AOO47P)']
+        self.assertEqual({'cpus': 16,
+                          'cpu_arch': 'x86_64',
+                          'memory_mb': 16384,
+                          'local_gb': 1024,
+                          'macs': ['00:1a:64:f9:e1:02', '00:1a:64:f9:e1:03'],
+                          'serial': '06DGM11',
+                          'firmware': '1.35 (1AOO47P)'},
+                         xcat_inspect.parse_inventory(lines))
+
+    def test_sockets_without_cores(self):
+        lines = ['CPU 1: POWER8 ppc64le', 'CPU 2: POWER8 ppc64le']
+        self.assertEqual({'cpus': 2, 'cpu_arch': 'ppc64le'},
+                         xcat_inspect.parse_inventory(lines))
+
+    def test_total_memory_wins(self):
+        lines = ['DIMM 1: 8192 MB', 'Total Memory: 64 GB']
+        self.assertEqual({'memory_mb': 65536},
+                         xcat_inspect.parse_inventory(lines))
+
+    def test_first_serial_and_firmware(self):
+        lines = ['Product Serial Number: A1',
+                 'Board Serial Number: B2',
+                 'BIOS Version: 2.0',
+                 'Firmware Version: 3.0']
+        self.assertEqual({'serial': 'A1', 'firmware': '2.0'},
+                         xcat_inspect.parse_inventory(lines))
+
+    def test_nothing_reported(self):
+        self.assertEqual({}, xcat_inspect.parse_inventory(['garbage', '']))
+
+
+RINV = {'n01': ['System Serial Number: S1', 'BMC Firmware: 1.0',
+                'CPU 1: Xeon x86_64'],
+        'n02': ['System Serial Number: S2', 'BMC Firmware: 1.0',
+                'CPU 1: Xeon x86_64'],
+        'n03': ['System Serial Number: S3', 'BMC Firmware: 1.0',
+                'CPU 1: Xeon x86_64']}
+
+
+class InspectNodesTestCase(base.TestCase):
+
+    def setUp(self):
+        super(InspectNodesTestCase, self).setUp()
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.config(inspect_cache_file=os.path.join(tempdir, 'cache.json'),
+                    inspect_chunk_size=2, group='xcat')
+        self.locked = []
+        self.calls = []
+        lock_patch = mock.patch.object(xcat_inspect.lockutils, 'lock',
+                                       self._lock)
+        lock_patch.start()
+        self.addCleanup(lock_patch.stop)
+
+    @contextlib.contextmanager
+    def _lock(self, name, prefix=None):
+        self.locked.append(name)
+        try:
+            yield
+        finally:
+            self.locked.pop()
+
+    def _stream(self, chunk, command, args, priority=None):
+        self.assertEqual([], self.locked)
+        self.calls.append((args, list(chunk)))
+        for xcat_node in chunk:
+            for line in RINV[xcat_node]:
+                yield xcat_util.NodeResult(node=xcat_node, value=line,
+                                           error=False)
+
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    def test_noderange_chunked(self, execute_mock):
+        execute_mock.return_value = ('n01\nn02\nn03\n', '')
+        with mock.patch.object(xcat_util, 'stream_xcatcmd', self._stream):
+            result = xcat_inspect.inspect_nodes('rack1')
+        execute_mock.assert_called_once_with(['nodels', 'rack1'],
+                                             xcat_util.PRIORITY_READ)
+        self.assertEqual(['n01', 'n02', 'n03'], sorted(result))
+        self.assertEqual([('all', ['n01', 'n02']), ('all', ['n03']),
+                          ('vpd', ['n01', 'n02']), ('vpd', ['n03'])],
+                         sorted(self.calls))
+
+    def test_cached(self):
+        with mock.patch.object(xcat_util, 'stream_xcatcmd', self._stream):
+            first = xcat_inspect.inspect_nodes(['n01', 'n02'])
+            self.calls = []
+            second = xcat_inspect.inspect_nodes(['n01', 'n02'])
+        self.assertEqual(first, second)
+        self.assertEqual([('vpd', ['n01', 'n02'])], self.calls)
+        self.assertEqual(first['n01'],
+                         xcat_inspect.cached_inventory('n01'))
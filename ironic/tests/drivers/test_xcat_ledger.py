@@ -0,0 +1,32 @@
+"""
+tests of the iptables rule parsing of the xcat dhcp ledger
+"""
+
+from ironic.drivers.modules import xcat_ledger
+from ironic.tests import base
+
+
+class ParseRulesTestCase(base.TestCase):
+
+    def test_parse(self):
+        output = ('XCAT_NETNS qdhcp-net1\n'
+                  '-P INPUT ACCEPT\n'
+                  '-A INPUT -m mac --mac-source 00:1A:64:F9:E1:02 -j DROP\n'
+                  '-A INPUT -p tcp --dport 22 -j ACCEPT\n'
+                  '-A INPUT -m mac --mac-source 00:1a:64:f9:e1:03 -j DROP\n'
+                  'XCAT_NETNS qdhcp-net2\n'
+                  'XCAT_NETNS qdhcp-net3\n'
+                  '  -A INPUT -m mac --mac-source 00:1a:64:f9:e1:04 -j DROP\n')
+        self.assertEqual({'qdhcp-net1': ['00:1a:64:f9:e1:02',
+                                         '00:1a:64:f9:e1:03'],
+                          'qdhcp-net2': [],
+                          'qdhcp-net3': ['00:1a:64:f9:e1:04']},
+                         xcat_ledger._parse_rules(output))
+
+    def test_rules_before_any_netns(self):
+        output = ('-A INPUT -m mac --mac-source 00:1a:64:f9:e1:02 -j DROP\n'
+                  'sudo: unable to resolve host\n')
+        self.assertEqual({}, xcat_ledger._parse_rules(output))
+
+    def test_no_namespace(self):
+        self.assertEqual({}, xcat_ledger._parse_rules(''))
@@ -0,0 +1,92 @@
+"""
+tests of the install server placement
+"""
+
+import mock
+
+from ironic.drivers.modules import xcat_exception
+from ironic.drivers.modules import xcat_placement
+from ironic.drivers.modules import xcat_util
+from ironic.tests import base
+
+
+class InstallServersTestCase(base.TestCase):
+
+    def setUp(self):
+        super(InstallServersTestCase, self).setUp()
+        self.config(install_servers=['s1:r1', 's2:r2'],
+                    install_server_rack_weight=2, group='xcat')
+        self.servers = xcat_placement.InstallServers()
+
+    def test_spread(self):
+        self.assertEqual(['s1', 's2', 's1'],
+                         [self.servers.choose(n) for n in ('n1', 'n2', 'n3')])
+        self.assertEqual(2, self.servers.get_stats()['s1']['in_flight'])
+
+    def test_rack_preferred(self):
+        self.assertEqual(['s2', 's2', 's1'],
+                         [self.servers.choose(n, 'r2')
+                          for n in ('n1', 'n2', 'n3')])
+
+    def test_release(self):
+        self.servers.choose('n1')
+        self.servers.choose('n2')
+        self.assertEqual('s1', self.servers.placed('n1'))
+        self.servers.release('n1')
+        self.servers.release('n2', ok=False)
+        self.servers.release('n3')
+        self.assertIsNone(self.servers.placed('n1'))
+        stats = self.servers.get_stats()
+        self.assertEqual((0, 1, 0), (stats['s1']['in_flight'],
+                                     stats['s1']['completed'],
+                                     stats['s1']['failed']))
+        self.assertEqual((0, 0, 1), (stats['s2']['in_flight'],
+                                     stats['s2']['completed'],
+                                     stats['s2']['failed']))
+
+    def test_choose_again_fails_previous(self):
+        self.servers.choose('n1')
+        self.assertEqual('s2', self.servers.choose('n1'))
+        stats = self.servers.get_stats()
+        self.assertEqual((0, 1), (stats['s1']['in_flight'],
+                                  stats['s1']['failed']))
+        self.assertEqual(1, stats['s2']['in_flight'])
+
+    def test_cancel(self):
+        self.servers.choose('n1')
+        self.servers.cancel('n1')
+        stats = self.servers.get_stats()['s1']
+        self.assertEqual((0, 0, 0), (stats['in_flight'], stats['placed'],
+                                     stats['failed']))
+        self.assertIsNone(self.servers.placed('n1'))
+
+    def test_not_configured(self):
+        self.config(install_servers=[], group='xcat')
+        self.assertIsNone(self.servers.choose('n1'))
+
+
+class PlaceTestCase(base.TestCase):
+
+    def setUp(self):
+        super(PlaceTestCase, self).setUp()
+        self.config(install_servers=['s1'], group='xcat')
+        servers_patch = mock.patch.object(xcat_placement, 'SERVERS',
+                                          xcat_placement.InstallServers())
+        self.servers = servers_patch.start()
+        self.addCleanup(servers_patch.stop)
+        self.info = {'xcat_node': 'n1', 'uuid': 'uuid-1'}
+
+    @mock.patch.object(xcat_util, 'exec_xcatcmd')
+    def test_place(self, exec_mock):
+        self.assertEqual('s1', xcat_placement.place(self.info))
+        exec_mock.assert_called_once_with(
+            self.info, 'chdef', 'xcatmaster=s1 nfsserver=s1 tftpserver=s1')
+        self.assertEqual('s1', xcat_placement.placed('n1'))
+
+    @mock.patch.object(xcat_util, 'exec_xcatcmd')
+    def test_chdef_failure_cancels(self, exec_mock):
+        exec_mock.side_effect = xcat_exception.xCATCmdFailure(
+            cmd='chdef', node='n1', args='')
+        self.assertIsNone(xcat_placement.place(self.info))
+        self.assertIsNone(xcat_placement.placed('n1'))
+        self.assertEqual(0, self.servers.get_stats()['s1']['placed'])
@@ -0,0 +1,136 @@
+"""
+tests of the xcat warm pool planning
+"""
+
+import contextlib
+
+import mock
+
+from ironic.common import exception
+from ironic.common import states
+from ironic.drivers.modules import xcat_pool
+from ironic.drivers.modules import xcat_util
+from ironic.tests import base
+
+
+class TargetsTestCase(base.TestCase):
+
+    def test_largest_remainder(self):
+        self.assertEqual({'a': 3, 'b': 1},
+                         xcat_pool.targets({'a': 6.0, 'b': 3.0, 'c': 1.0},
+                                           size=4, images=2))
+
+    def test_no_more_images_than_slots(self):
+        self.assertEqual({'a': 1},
+                         xcat_pool.targets({'a': 2.0, 'b': 1.0},
+                                           size=1, images=3))
+
+    def test_empty(self):
+        self.assertEqual({}, xcat_pool.targets({}, size=4, images=2))
+        self.assertEqual({}, xcat_pool.targets({'a': 1.0}, size=0,
+                                               images=2))
+
+
+class PlanTestCase(base.TestCase):
+
+    def setUp(self):
+        super(PlanTestCase, self).setUp()
+        self.config(warm_pool_size=3, warm_pool_images=2, group='xcat')
+
+    def _entry(self, state, image=None, node='uuid'):
+        entry = {'state': state, 'image': image, 'since': 0}
+        if node:
+            entry['node'] = node
+        return entry
+
+    def test_plan(self):
+        state = xcat_pool._empty()
+        state['popularity'] = {'a': 2.0, 'b': 1.0}
+        state['nodes'] = {'n1': self._entry(xcat_pool.IDLE),
+                          'n2': self._entry(xcat_pool.READY, 'a'),
+                          'n3': self._entry(xcat_pool.READY, 'c'),
+                          'n4': self._entry(xcat_pool.IDLE),
+                          'n5': self._entry(xcat_pool.IDLE, node=None)}
+        plan = xcat_pool._plan(state, set(['n1', 'n2', 'n3', 'n5']))
+        # n4 left the pool noderange, n5 has no ironic node, the stale
+        # image of n3 is evicted for b
+        self.assertEqual([('n1', 'a'), ('n3', 'b')], plan)
+        self.assertEqual(1, state['stats']['evictions'])
+
+    def test_pool_full(self):
+        state = xcat_pool._empty()
+        state['popularity'] = {'a': 1.0}
+        state['nodes'] = {'n1': self._entry(xcat_pool.READY, 'a'),
+                          'n2': self._entry(xcat_pool.INSTALLING, 'a'),
+                          'n3': self._entry(xcat_pool.READY, 'a'),
+                          'n4': self._entry(xcat_pool.IDLE)}
+        self.assertEqual([], xcat_pool._plan(state, set(state['nodes'])))
+
+
+class CheckInstallsTestCase(base.TestCase):
+
+    def setUp(self):
+        super(CheckInstallsTestCase, self).setUp()
+        self.state = xcat_pool._empty()
+        self.state['nodes']['n1'] = {'state': xcat_pool.INSTALLING,
+                                     'image': 'a', 'node': 'uuid-1',
+                                     'since': 0}
+        state_patch = mock.patch.object(xcat_pool, '_state', [self.state])
+        state_patch.start()
+        self.addCleanup(state_patch.stop)
+        save_patch = mock.patch.object(xcat_pool, '_save')
+        save_patch.start()
+        self.addCleanup(save_patch.stop)
+        self.node = mock.Mock(instance_uuid=None,
+                              provision_state=states.NOSTATE)
+        self.locked = []
+
+    @contextlib.contextmanager
+    def _acquire(self, ctx, node_uuid):
+        self.locked.append(node_uuid)
+        try:
+            yield mock.Mock(node=self.node)
+        finally:
+            self.locked.remove(node_uuid)
+
+    def _execute(self, cmd, priority=None):
+        self.assertEqual(['uuid-1'], self.locked)
+        return '', ''
+
+    @mock.patch.object(xcat_pool.task_manager, 'acquire')
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    @mock.patch.object(xcat_util, 'exec_xcatcmd_range')
+    def test_booted(self, range_mock, execute_mock, acquire_mock):
+        range_mock.return_value = ('n1: booted\n', '')
+        execute_mock.side_effect = self._execute
+        acquire_mock.side_effect = self._acquire
+        xcat_pool._check_installs(['n1'])
+        execute_mock.assert_called_once_with(['rpower', 'n1', 'off'],
+                                             xcat_pool.POOL_PRIORITY)
+        self.assertEqual(xcat_pool.READY, self.state['nodes']['n1']['state'])
+
+    @mock.patch.object(xcat_pool.task_manager, 'acquire')
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    @mock.patch.object(xcat_util, 'exec_xcatcmd_range')
+    def test_booted_node_deployed(self, range_mock, execute_mock,
+                                  acquire_mock):
+        range_mock.return_value = ('n1: booted\n', '')
+        acquire_mock.side_effect = self._acquire
+        self.node.provision_state = states.DEPLOYING
+        xcat_pool._check_installs(['n1'])
+        self.assertFalse(execute_mock.called)
+        self.assertEqual(xcat_pool.INSTALLING,
+                         self.state['nodes']['n1']['state'])
+
+    @mock.patch.object(xcat_pool.task_manager, 'acquire')
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    @mock.patch.object(xcat_util, 'exec_xcatcmd_range')
+    def test_booted_node_locked(self, range_mock, execute_mock,
+                                acquire_mock):
+        range_mock.return_value = ('n1: booted\n', '')
+        acquire_mock.side_effect = exception.NodeLocked(node='uuid-1',
+                                                        host='host')
+        xcat_pool._check_installs(['n1'])
+        self.assertFalse(execute_mock.called)
+        self.assertEqual(xcat_pool.INSTALLING,
+                         self.state['nodes']['n1']['state'])
@@ -0,0 +1,55 @@
+"""
+tests of the xcat power driver helpers
+"""
+
+import timeit
+
+from ironic.drivers.modules import xcat_rpower
+from ironic.tests import base
+
+
+class FakeNode(object):
+
+    def __init__(self, uuid, driver_info, instance_info):
+        self.uuid = uuid
+        self.driver_info = driver_info
+        self.instance_info = instance_info
+
+
+DRIVER_INFO = {'ipmi_address': '10.0.0.1',
+               'ipmi_username': 'admin',
+               'ipmi_password': 'secret',
+               'ipmi_terminal_port': '0',
+               'xcat_node': 'n01',
+               'xcatmaster': '10.0.0.254',
+               'netboot': 'xnba'}
+
+
+class DriverInfoCacheTestCase(base.TestCase):
+
+    def setUp(self):
+        super(DriverInfoCacheTestCase, self).setUp()
+        # a deploy timeline, which the driver info does not depend on
+        phases = [{'name': 'phase%d' % i, 'started_at': i, 'finished_at': i}
+                  for i in range(20)]
+        self.node = FakeNode('uuid-1', dict(DRIVER_INFO),
+                             {'image_source': 'image',
+                              'xcat_timeline': {'phases': phases}})
+
+    def test_cached(self):
+        info = xcat_rpower._parse_driver_info(self.node)
+        self.assertEqual('n01', info['xcat_node'])
+        self.assertIs(info, xcat_rpower._parse_driver_info(self.node))
+        self.node.driver_info = dict(DRIVER_INFO, xcat_node='n02')
+        self.assertEqual('n02',
+                         xcat_rpower._parse_driver_info(self.node).xcat_node)
+
+    def test_hit_cheaper_than_parse(self):
+        xcat_rpower._parse_driver_info(self.node)
+        hit = min(timeit.repeat(
+            lambda: xcat_rpower._parse_driver_info(self.node),
+            number=2000, repeat=3))
+        parse = min(timeit.repeat(
+            lambda: xcat_rpower._do_parse_driver_info(self.node),
+            number=2000, repeat=3))
+        self.assertLess(hit, parse)
@@ -0,0 +1,49 @@
+"""
+tests of the bulk loaded xcat node state
+"""
+
+import mock
+
+from ironic.common import states
+from ironic.drivers.modules import xcat_state
+from ironic.drivers.modules import xcat_util
+from ironic.tests import base
+
+
+class WarmUpTestCase(base.TestCase):
+
+    def setUp(self):
+        super(WarmUpTestCase, self).setUp()
+        self.config(noderange_chunk_size=2, group='xcat')
+        state_patch = mock.patch.object(xcat_state, 'STATE',
+                                        xcat_state.NodeStateCache())
+        state_patch.start()
+        self.addCleanup(state_patch.stop)
+
+    def _execute(self, cmd, priority=None, **kwargs):
+        if cmd[0] == 'nodels':
+            return 'n01\nn02\nn03\n', ''
+        return ''.join('Object name: %s\n    rack=r1\n' % name
+                       for name in cmd[1].split(',')), ''
+
+    def _stream(self, nodes, command, args='', priority=None,
+                service_node=None):
+        for name in nodes:
+            yield xcat_util.NodeResult(
+                node=name, value='on' if command == 'rpower' else 'booted',
+                error=False)
+
+    @mock.patch.object(xcat_util, 'stream_xcatcmd')
+    @mock.patch.object(xcat_util, 'xcat_execute')
+    def test_noderange(self, execute_mock, stream_mock):
+        execute_mock.side_effect = self._execute
+        stream_mock.side_effect = self._stream
+        self.assertEqual(3, xcat_state.warm_up('rack1'))
+        self.assertEqual([['nodels', 'rack1'], ['lsdef', 'n01,n02'],
+                          ['lsdef', 'n03']],
+                         [c[0][0] for c in execute_mock.call_args_list])
+        self.assertEqual({'rack': 'r1'},
+                         xcat_state.STATE.get('n03', 'attrs'))
+        self.assertEqual(states.POWER_ON,
+                         xcat_state.STATE.get('n03', 'power'))
+        self.assertEqual('booted', xcat_state.STATE.get('n03', 'status'))
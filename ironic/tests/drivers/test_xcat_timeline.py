@@ -0,0 +1,97 @@
+"""
+tests of the deploy timeline statistics and history
+"""
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from ironic.drivers.modules import xcat_timeline
+from ironic.tests import base
+
+
+class PercentileTestCase(base.TestCase):
+
+    def test_nearest_rank(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(1, xcat_timeline.percentile(values, 0))
+        self.assertEqual(3, xcat_timeline.percentile(values, 50))
+        self.assertEqual(5, xcat_timeline.percentile(values, 95))
+        self.assertEqual(5, xcat_timeline.percentile(values, 100))
+
+    def test_two_values(self):
+        self.assertEqual(0.031, xcat_timeline.percentile([0.0002, 0.031],
+                                                         95))
+        self.assertEqual(0.0002, xcat_timeline.percentile([0.0002, 0.031],
+                                                          50))
+
+    def test_empty(self):
+        self.assertIsNone(xcat_timeline.percentile([], 95))
+
+
+def _timeline(image, **durations):
+    return {'image': image,
+            'phases': dict((name, {'duration': duration})
+                           for name, duration in durations.items())}
+
+
+class SummarizeTestCase(base.TestCase):
+
+    def test_summarize(self):
+        report = xcat_timeline.summarize([
+            _timeline('rhels', install=100.0, reboot=10.0),
+            _timeline('rhels', install=300.0),
+            _timeline('sles', install=200.0),
+            _timeline(None, reboot=20.0),
+            None])
+        self.assertEqual(['all', 'rhels', 'sles'], sorted(report))
+        self.assertEqual({'count': 3, 'p50': 200.0, 'p95': 300.0,
+                          'max': 300.0}, report['all']['install'])
+        self.assertEqual({'count': 2, 'p50': 10.0, 'p95': 20.0,
+                          'max': 20.0}, report['all']['reboot'])
+        self.assertEqual({'count': 2, 'p50': 100.0, 'p95': 300.0,
+                          'max': 300.0}, report['rhels']['install'])
+        self.assertNotIn('reboot', report['sles'])
+
+    def test_format_report(self):
+        report = xcat_timeline.summarize([_timeline('rhels', install=5.0,
+                                                    custom=1.0)])
+        lines = xcat_timeline.format_report(report).splitlines()
+        self.assertEqual('all', lines[0])
+        self.assertIn('install', lines[1])
+        self.assertIn('custom', lines[2])
+
+
+class HistoryTestCase(base.TestCase):
+
+    def setUp(self):
+        super(HistoryTestCase, self).setUp()
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.config(timeline_file=os.path.join(tempdir, 'timelines.json'),
+                    timeline_history=2, group='xcat')
+
+    def _node(self):
+        return mock.Mock(spec=['uuid', 'instance_info', 'save'],
+                         uuid='uuid-1', instance_info={})
+
+    def test_unfinished_not_kept(self):
+        xcat_timeline.DeployTimeline.start('rhels').save(self._node())
+        self.assertEqual([], xcat_timeline.load_history())
+
+    def test_finished_kept(self):
+        node = self._node()
+        for started_at in (1, 2, 3):
+            timeline = xcat_timeline.DeployTimeline.start('rhels')
+            timeline.data['started_at'] = started_at
+            timeline.finish('deploy complete')
+            timeline.save(node)
+            # saving it again replaces its copy
+            timeline.save(node)
+        history = xcat_timeline.load_history()
+        self.assertEqual([2, 3], [t['started_at'] for t in history])
+        self.assertEqual('uuid-1', history[0]['node'])
+        self.assertEqual(timeline.data,
+                         node.instance_info[xcat_timeline.TIMELINE_KEY])
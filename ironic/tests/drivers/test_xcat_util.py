@@ -0,0 +1,245 @@
+"""
+tests of the xcat noderange output parsing
+"""
+
+import io
+import threading
+import time
+
+import mock
+
+from ironic.drivers.modules import xcat_util
+from ironic.tests import base
+
+
+class ParseNodeLineTestCase(base.TestCase):
+
+    def _parse(self, line):
+        record = xcat_util.parse_node_line(line)
+        if record is None:
+            return None
+        return (record.node, record.value, record.error)
+
+    def test_value(self):
+        self.assertEqual(('n01', 'on', False), self._parse('n01: on\n'))
+
+    def test_value_with_colon(self):
+        self.assertEqual(('n01', 'MAC Address 1: 00:1a:64:f9:e1:02', False),
+                         self._parse('n01: MAC Address 1: 00:1a:64:f9:e1:02'))
+
+    def test_node_error(self):
+        self.assertEqual(('n01', 'Timeout', True),
+                         self._parse('n01: Error: Timeout'))
+
+    def test_error_naming_node(self):
+        self.assertEqual(('n02', 'Invalid nodes in noderange', True),
+                         self._parse('Error: n02: Invalid nodes in noderange'))
+
+    def test_error_without_node(self):
+        self.assertEqual((None, 'Permission denied for request', True),
+                         self._parse('Error: Permission denied for request'))
+        self.assertEqual((None, 'Error', True), self._parse('Error'))
+
+    def test_not_a_record(self):
+        self.assertIsNone(self._parse(''))
+        self.assertIsNone(self._parse('no node prefix'))
+        self.assertIsNone(self._parse('two words: value'))
+
+
+class ParseNodeOutputTestCase(base.TestCase):
+
+    def test_parse(self):
+        text = ('n01: on\n'
+                'n02: Error: Timeout\n'
+                'garbage\n'
+                'n03: off\n')
+        self.assertEqual({'n01': 'on', 'n03': 'off'},
+                         xcat_util.parse_node_output(text))
+
+    def test_join_lines(self):
+        text = 'n01: CPU 1: x86_64\nn01: CPU 2: x86_64\n'
+        self.assertEqual({'n01': 'CPU 1: x86_64\nCPU 2: x86_64'},
+                         xcat_util.parse_node_output(text))
+
+
+class ParseLsdefOutputTestCase(base.TestCase):
+
+    def test_parse(self):
+        text = ('Object name: n01\n'
+                '    groups=all,rack1\n'
+                '    mgt=ipmi\n'
+                'Object name: n02\n'
+                '    rack=r2\n')
+        self.assertEqual({'n01': {'groups': 'all,rack1', 'mgt': 'ipmi'},
+                          'n02': {'rack': 'r2'}},
+                         xcat_util.parse_lsdef_output(text))
+
+
+@mock.patch.object(xcat_util, 'get_executor')
+@mock.patch.object(xcat_util.subprocess, 'Popen')
+class StreamXcatcmdTestCase(base.TestCase):
+
+    def _proc(self, output):
+        proc = mock.Mock()
+        proc.stdout = io.BytesIO(output)
+        proc.poll.return_value = 0
+        return proc
+
+    def test_stream(self, popen_mock, executor_mock):
+        popen_mock.return_value = self._proc(b'n01: on\n'
+                                             b'n02: Error: Timeout\n'
+                                             b'garbage\n')
+        records = [(r.node, r.value, r.error) for r in
+                   xcat_util.stream_xcatcmd(['n01', 'n02'], 'rpower', 'stat')]
+        self.assertEqual([('n01', 'on', False), ('n02', 'Timeout', True)],
+                         records)
+        self.assertEqual(['rpower', 'n01,n02', 'stat'],
+                         popen_mock.call_args[0][0])
+        executor_mock.return_value.slot.assert_called_once_with(
+            xcat_util.PRIORITY_READ)
+
+    def test_stream_chunks(self, popen_mock, executor_mock):
+        self.config(noderange_chunk_size=2, group='xcat')
+        popen_mock.side_effect = [self._proc(b'n01: on\nn02: on\n'),
+                                  self._proc(b'n03: off\n')]
+        records = [r.node for r in xcat_util.stream_xcatcmd(
+            ['n01', 'n02', 'n03'], 'rpower', 'stat')]
+        self.assertEqual(['n01', 'n02', 'n03'], records)
+        self.assertEqual([['rpower', 'n01,n02', 'stat'],
+                          ['rpower', 'n03', 'stat']],
+                         [c[0][0] for c in popen_mock.call_args_list])
+
+    def test_stream_kill_on_close(self, popen_mock, executor_mock):
+        proc = self._proc(b'n01: on\nn02: on\n')
+        proc.poll.return_value = None
+        popen_mock.return_value = proc
+        stream = xcat_util.stream_xcatcmd(['n01', 'n02'], 'rpower', 'stat')
+        next(stream)
+        stream.close()
+        proc.kill.assert_called_once_with()
+
+
+class NodeInfoCacheTestCase(base.TestCase):
+
+    def setUp(self):
+        super(NodeInfoCacheTestCase, self).setUp()
+        self.parsed = []
+        self.cache = xcat_util.NodeInfoCache(self._parse, {
+            'driver_info': ('xcat_node',), 'instance_info': ('root_gb',)})
+        self.node = mock.Mock(uuid='uuid-1',
+                              driver_info={'xcat_node': 'n01'},
+                              instance_info={'root_gb': 10})
+
+    def _parse(self, node):
+        self.parsed.append(node.uuid)
+        return (node.driver_info['xcat_node'],
+                node.instance_info.get('root_gb'))
+
+    def test_hit(self):
+        self.assertEqual(('n01', 10), self.cache(self.node))
+        self.assertEqual(('n01', 10), self.cache(self.node))
+        self.assertEqual(['uuid-1'], self.parsed)
+
+    def test_unread_field_change_hits(self):
+        self.cache(self.node)
+        self.node.instance_info = {'root_gb': 10,
+                                   'xcat_timeline': {'phases': []}}
+        self.node.driver_info = {'xcat_node': 'n01', 'rack': 'r1'}
+        self.cache(self.node)
+        self.assertEqual(['uuid-1'], self.parsed)
+
+    def test_read_field_change_parses(self):
+        self.cache(self.node)
+        self.node.driver_info = {'xcat_node': 'n02'}
+        self.assertEqual(('n02', 10), self.cache(self.node))
+        self.node.instance_info = {}
+        self.assertEqual(('n02', None), self.cache(self.node))
+        self.assertEqual(3, len(self.parsed))
+
+    def test_size_bound(self):
+        self.config(node_info_cache_size=1, group='xcat')
+        other = mock.Mock(uuid='uuid-2', driver_info={'xcat_node': 'n02'},
+                          instance_info={})
+        self.cache(self.node)
+        self.cache(other)
+        self.cache(self.node)
+        self.assertEqual(['uuid-1', 'uuid-2', 'uuid-1'], self.parsed)
+
+    def test_disabled(self):
+        self.config(node_info_cache_size=0, group='xcat')
+        self.cache(self.node)
+        self.cache(self.node)
+        self.assertEqual(['uuid-1', 'uuid-1'], self.parsed)
+
+
+class XcatdUnreachableTestCase(base.TestCase):
+
+    def test_client_failure(self):
+        err = ('Unable to open socket connection to xcatd daemon on '
+               'sn1:3001.\nVerify that the xcatd daemon is running and '
+               'that your SSL setup is correct.\n')
+        self.assertTrue(xcat_util._xcatd_unreachable(err))
+
+    def test_bmc_errors(self):
+        err = ('n01: Error: Unable to connect: No route to host\n'
+               'n02: Error: Connection refused\n'
+               'Error: n03: Unable to open socket connection to xcatd\n')
+        self.assertFalse(xcat_util._xcatd_unreachable(err))
+
+    def test_empty(self):
+        self.assertFalse(xcat_util._xcatd_unreachable(''))
+        self.assertFalse(xcat_util._xcatd_unreachable(None))
+
+
+class XcatExecutorTestCase(base.TestCase):
+
+    def test_priority_order(self):
+        executor = xcat_util.XcatExecutor(1)
+        executor._acquire(xcat_util.PRIORITY_NORMAL)
+        order = []
+
+        def _run(priority, name):
+            executor._acquire(priority)
+            order.append(name)
+            executor._release()
+
+        threads = []
+        for priority, name in ((xcat_util.PRIORITY_READ, 'read'),
+                               (xcat_util.PRIORITY_NORMAL, 'normal'),
+                               (xcat_util.PRIORITY_CRITICAL, 'critical 1'),
+                               (xcat_util.PRIORITY_CRITICAL, 'critical 2')):
+            thread = threading.Thread(target=_run, args=(priority, name))
+            thread.start()
+            threads.append(thread)
+            while len(executor._waiters) < len(threads):
+                time.sleep(0.001)
+        self.assertEqual(4, executor.get_stats()['queued'])
+        executor._release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['critical 1', 'critical 2', 'normal', 'read'],
+                         order)
+        stats = executor.get_stats()
+        self.assertEqual(0, stats['running'])
+        self.assertEqual(1, stats['peak_running'])
+
+    def test_unbounded(self):
+        executor = xcat_util.XcatExecutor(0)
+        for i in range(3):
+            executor._acquire(xcat_util.PRIORITY_READ)
+        self.assertEqual(3, executor.get_stats()['running'])
+        self.assertEqual([], executor._waiters)
+
+    def test_stats(self):
+        executor = xcat_util.XcatExecutor(1)
+        executor._record(xcat_util.PRIORITY_READ, 0.031)
+        executor._record(xcat_util.PRIORITY_READ, 0.0002)
+        stats = executor.get_stats()['classes']
+        read = stats[xcat_util.PRIORITY_NAMES[xcat_util.PRIORITY_READ]]
+        self.assertEqual(2, read['count'])
+        self.assertEqual(0.031, read['wait_p95'])
+        self.assertEqual(0.031, read['wait_max'])
+        self.assertAlmostEqual(0.0156, read['wait_avg'])
+        idle = stats[xcat_util.PRIORITY_NAMES[xcat_util.PRIORITY_CRITICAL]]
+        self.assertEqual({'count': 0, 'queued': 0, 'wait_avg': 0.0,
+                          'wait_p95': 0.0, 'wait_max': 0.0}, idle)
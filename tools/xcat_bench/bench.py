@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of the xcat baremetal driver.
+
+Runs XcatPower and PXEDeploy against a fake xCAT toolchain (see
+fake_xcat.py), a fake ssh network node and in-memory neutron/glance
+services, so the driver overhead can be measured without hardware.
+
+Scenarios:
+  power   get_power_state on every node, the conductor power sync
+  deploy  prepare + deploy on every node, a deploy wave
+
+usage: bench.py [--nodes 10,100,1000] [--concurrency 64]
+                [--scenario power,deploy] [--latency 0.05]
+                [--failrate 0] [--install-time 2] [--json]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import mock
+from oslo.config import cfg
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_services  # noqa
+import fake_xcat  # noqa
+
+from ironic.common import image_service  # noqa
+from ironic.common import neutron  # noqa
+from ironic.common import states  # noqa
+from ironic.conductor import utils as manager_utils  # noqa
+from ironic.drivers.modules import xcat_pxe  # noqa
+from ironic.drivers.modules import xcat_rpower  # noqa
+from ironic.drivers.modules import xcat_timeline  # noqa
+
+CONF = cfg.CONF
+
+IMAGE_ID = 'bench-image'
+IMAGE_NAME = 'rhels6.4-x86_64-install-compute'
+
+
+class FakePort(object):
+    def __init__(self, address, vif_port_id):
+        self.uuid = str(uuid.uuid4())
+        self.address = address
+        self.extra = {'vif_port_id': vif_port_id}
+
+
+class FakeNode(object):
+    def __init__(self, index):
+        self.id = index
+        self.uuid = str(uuid.uuid4())
+        self.updated_at = None
+        self.power_state = states.NOSTATE
+        self.driver_info = {'ipmi_address': '10.0.%d.%d' % (index // 250,
+                                                            index % 250),
+                            'ipmi_username': 'USERID',
+                            'ipmi_password': 'PASSW0RD',
+                            'ipmi_terminal_port': 10000 + index,
+                            'xcat_node': 'bench%04d' % index,
+                            'xcatmaster': '10.1.0.1',
+                            'netboot': 'xnba'}
+        self.instance_info = {'image_source': IMAGE_ID,
+                              'root_gb': 10}
+        self.driver_internal_info = {}
+        self.saves = 0
+
+    def save(self, context=None):
+        self.saves += 1
+
+
+class FakeDriver(object):
+    def __init__(self, power, deploy):
+        self.power = power
+        self.deploy = deploy
+
+
+class FakeTask(object):
+    def __init__(self, node, ports, driver):
+        self.node = node
+        self.ports = ports
+        self.driver = driver
+        self.context = None
+        self.shared = False
+
+
+def _node_power_action(task, state):
+    if state == states.REBOOT:
+        task.driver.power.reboot(task)
+    else:
+        task.driver.power.set_power_state(task, state)
+
+
+def _node_set_boot_device(task, device, persistent=False):
+    pass
+
+
+def _percentile(values, percent):
+    return xcat_timeline.percentile(values, percent) or 0.0
+
+
+def _make_tasks(count, driver, neutron_client):
+    tasks = []
+    for i in range(count):
+        node = FakeNode(i)
+        mac = '52:54:00:%02x:%02x:%02x' % ((i >> 16) & 0xff,
+                                           (i >> 8) & 0xff, i & 0xff)
+        port_id = 'port-%d' % i
+        neutron_client.add_port(port_id, mac, '192.168.%d.%d'
+                                % (i // 250, i % 250 + 2))
+        tasks.append(FakeTask(node, [FakePort(mac, port_id)], driver))
+    return tasks
+
+
+def _run_wave(tasks, concurrency, func):
+    latencies = []
+    errors = []
+
+    def _one(task):
+        start = time.time()
+        try:
+            func(task)
+        except Exception as e:
+            errors.append('%s: %s' % (task.node.driver_info['xcat_node'], e))
+        latencies.append(time.time() - start)
+
+    pool = eventlet.GreenPool(concurrency)
+    start = time.time()
+    for task in tasks:
+        pool.spawn_n(_one, task)
+    pool.waitall()
+    return time.time() - start, latencies, errors
+
+
+def _power_sync(task):
+    task.driver.power.get_power_state(task)
+
+
+def _deploy(task):
+    task.driver.deploy.prepare(task)
+    result = task.driver.deploy.deploy(task)
+    if result != states.DEPLOYDONE:
+        raise Exception('deploy returned %s' % result)
+
+
+SCENARIOS = {'power': _power_sync,
+             'deploy': _deploy}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='xcat-bench-')
+    state_dir = os.path.join(workdir, 'state')
+    fake_xcat.install(os.path.join(workdir, 'bin'), state_dir)
+    fake_xcat.configure(latency=args.latency, failrate=args.failrate,
+                        install_time=args.install_time)
+
+    ssh = fake_services.FakeSSHServer(latency=args.ssh_latency).start()
+    hosts = os.path.join(workdir, 'hosts')
+    open(hosts, 'w').close()
+
+    CONF.set_override('min_command_interval', 0, group='ipmi')
+    CONF.set_override('retry_timeout', 120, group='ipmi')
+    CONF.set_override('network_node_ip', ssh.host, group='xcat')
+    CONF.set_override('ssh_port', ssh.port, group='xcat')
+    CONF.set_override('ssh_password', ssh.password, group='xcat')
+    CONF.set_override('ssh_shell_wait', 0.01, group='xcat')
+    CONF.set_override('host_filepath', hosts, group='xcat')
+    CONF.set_override('deploy_checking_interval', 1, group='xcat')
+    CONF.set_override('deploy_timeout', 600, group='xcat')
+    # keep the driver state files out of the real state_path and /tmp
+    for name in ('ledger_file', 'warm_pool_file', 'probe_cache_file',
+                 'timeline_file'):
+        CONF.set_override(name, os.path.join(state_dir, '%s.json' % name),
+                          group='xcat')
+    CONF.set_override('profile_dir', os.path.join(state_dir, 'profiles'),
+                      group='xcat')
+
+    neutron_client = fake_services.FakeNeutronClient()
+    fake_services.FakeNeutronAPI.client = neutron_client
+    fake_services.FakeGlanceService.images = {
+        IMAGE_ID: {'name': IMAGE_NAME, 'properties': {}}}
+
+    patches = [
+        mock.patch.object(image_service, 'Service',
+                          fake_services.FakeGlanceService),
+        mock.patch.object(neutron, 'NeutronAPI',
+                          fake_services.FakeNeutronAPI),
+        mock.patch.object(manager_utils, 'node_power_action',
+                          _node_power_action),
+        mock.patch.object(manager_utils, 'node_set_boot_device',
+                          _node_set_boot_device),
+    ]
+    for p in patches:
+        p.start()
+
+    results = []
+    try:
+        driver = FakeDriver(xcat_rpower.XcatPower(), xcat_pxe.PXEDeploy())
+        fake_xcat.fork_counts(state_dir, reset=True)
+        for count in args.nodes:
+            for name in args.scenario:
+                tasks = _make_tasks(count, driver, neutron_client)
+                fake_xcat.fork_counts(state_dir, reset=True)
+                ssh_sessions = ssh.sessions
+                glance_calls = fake_services.FakeGlanceService.calls
+                neutron_calls = neutron_client.calls
+                elapsed, latencies, errors = _run_wave(
+                    tasks, args.concurrency, SCENARIOS[name])
+                forks = fake_xcat.fork_counts(state_dir, reset=True)
+                results.append({
+                    'scenario': name,
+                    'nodes': count,
+                    'concurrency': args.concurrency,
+                    'elapsed': elapsed,
+                    'throughput': count / elapsed if elapsed else 0.0,
+                    'p50': _percentile(latencies, 50),
+                    'p95': _percentile(latencies, 95),
+                    'p99': _percentile(latencies, 99),
+                    'max': max(latencies) if latencies else 0.0,
+                    'errors': len(errors),
+                    'forks': forks,
+                    'forks_total': sum(forks.values()),
+                    'ssh_sessions': ssh.sessions - ssh_sessions,
+                    'glance_calls': (fake_services.FakeGlanceService.calls -
+                                     glance_calls),
+                    'neutron_calls': neutron_client.calls - neutron_calls,
+                    'sample_errors': errors[:5]})
+    finally:
+        for p in patches:
+            p.stop()
+        ssh.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _print_results(results):
+    for r in results:
+        print("%(scenario)-7s nodes=%(nodes)-5d conc=%(concurrency)-4d "
+              "elapsed=%(elapsed)8.2fs thr=%(throughput)8.2f/s "
+              "p50=%(p50)7.3fs p95=%(p95)7.3fs p99=%(p99)7.3fs "
+              "errors=%(errors)d forks=%(forks_total)d "
+              "ssh=%(ssh_sessions)d" % r)
+        print("        forks per command: %s" %
+              ', '.join('%s=%d' % kv for kv in sorted(r['forks'].items())))
+        for error in r['sample_errors']:
+            print("        error: %s" % error)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--nodes', type=_int_list, default=[10, 100],
+                        help='comma separated wave sizes')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='green threads driving the wave')
+    parser.add_argument('--scenario', default='power,deploy',
+                        type=lambda v: v.split(','),
+                        help='comma separated scenarios: %s'
+                        % ', '.join(sorted(SCENARIOS)))
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='latency of every fake xCAT command')
+    parser.add_argument('--failrate', type=float, default=0.0,
+                        help='failure rate of every fake xCAT command')
+    parser.add_argument('--install-time', type=float, default=2.0,
+                        help='seconds until a deploying node is booted')
+    parser.add_argument('--ssh-latency', type=float, default=0.0,
+                        help='latency of every fake network node command')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the fake toolchain directory')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+    for name in args.scenario:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario %s' % name)
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        _print_results(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
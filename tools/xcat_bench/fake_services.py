@@ -0,0 +1,181 @@
+"""
+fake network node ssh server and in-memory neutron/glance services
+for the xcat driver benchmark
+"""
+
+import socket
+import threading
+import time
+
+import paramiko
+
+
+class _ShellServer(paramiko.ServerInterface):
+
+    def __init__(self, password):
+        self.password = password
+        self.event = threading.Event()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_auth_password(self, username, password):
+        if password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_shell_request(self, channel):
+        self.event.set()
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height,
+                                  pixelwidth, pixelheight, modes):
+        return True
+
+
+class FakeSSHServer(object):
+    """Shell-only ssh server standing in for the neutron network node.
+
+    Every command line received is recorded in `commands`, answered
+    after `latency` seconds with the prompt, and `iptables -S` style
+    commands are answered with the rules appended so far.
+    """
+
+    def __init__(self, password='cluster', latency=0.0, host='127.0.0.1'):
+        self.password = password
+        self.latency = latency
+        self.commands = []
+        self.sessions = 0
+        self.rules = []
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, 0))
+        self.sock.listen(128)
+        self.host, self.port = self.sock.getsockname()
+        self._stopped = False
+
+    def start(self):
+        thread = threading.Thread(target=self._serve)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self.sock.close()
+
+    def _serve(self):
+        while not self._stopped:
+            try:
+                client, addr = self.sock.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self._session, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _session(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        server = _ShellServer(self.password)
+        try:
+            transport.start_server(server=server)
+            chan = transport.accept(20)
+            if chan is None:
+                return
+            server.event.wait(10)
+            self.sessions += 1
+            chan.send('[root@network ~]# ')
+            buf = ''
+            while True:
+                data = chan.recv(1024)
+                if not data:
+                    break
+                if not isinstance(data, str):
+                    data = data.decode()
+                buf += data
+                while '\n' in buf:
+                    line, buf = buf.split('\n', 1)
+                    chan.send(self._handle(line.strip()))
+        except (EOFError, socket.error, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+    def _handle(self, line):
+        self.commands.append(line)
+        if self.latency:
+            time.sleep(self.latency)
+        out = ''
+        if ' iptables -A ' in line:
+            self.rules.append(line.split(' iptables ', 1)[1])
+        elif ' iptables -D ' in line:
+            rule = line.split(' iptables ', 1)[1].replace('-D ', '-A ', 1)
+            if rule in self.rules:
+                self.rules.remove(rule)
+        elif ' iptables -S' in line:
+            out = ''.join(r + '\r\n' for r in self.rules)
+        elif line.endswith('ip netns list') or line.endswith('ip netns'):
+            out = 'qdhcp-fake-net\r\n'
+        return out + '[root@network ~]# '
+
+
+class FakeNeutronClient(object):
+    """In-memory neutron client answering show_port/update_port."""
+
+    def __init__(self, latency=0.0):
+        self.ports = {}
+        self.calls = 0
+        self.latency = latency
+
+    def add_port(self, port_id, mac, ip, network_id='fake-net'):
+        self.ports[port_id] = {'id': port_id,
+                               'mac_address': mac,
+                               'network_id': network_id,
+                               'fixed_ips': [{'ip_address': ip}],
+                               'extra_dhcp_opts': []}
+
+    def show_port(self, port_id):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {'port': dict(self.ports[port_id])}
+
+    def update_port(self, port_id, body):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.ports[port_id].update(body['port'])
+        return {'port': dict(self.ports[port_id])}
+
+
+class FakeNeutronAPI(object):
+    """Replacement for ironic.common.neutron.NeutronAPI."""
+
+    client = None
+
+    def __init__(self, context=None):
+        pass
+
+
+class FakeGlanceService(object):
+    """Replacement for ironic.common.image_service.Service."""
+
+    images = {}
+    calls = 0
+    latency = 0.0
+
+    def __init__(self, version=1, context=None):
+        pass
+
+    def show(self, image_id):
+        FakeGlanceService.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return dict(self.images[image_id])
@@ -0,0 +1,182 @@
+"""
+fake xCAT toolchain for the xcat driver benchmark
+
+install() writes stub rpower, nodeset, nodels, chdef, makedhcp, rsetboot,
+lsdef, rinv and ipmitool executables into a bin directory.  The stubs keep
+the node power state and install status in a state directory, sleep a
+configurable latency and fail at a configurable rate:
+
+XCAT_FAKE_STATE                 state directory (set by install())
+XCAT_FAKE_LATENCY               default latency in seconds for every command
+XCAT_FAKE_LATENCY_<COMMAND>     latency of one command, e.g. _RPOWER
+XCAT_FAKE_FAILRATE              default failure rate between 0 and 1
+XCAT_FAKE_FAILRATE_<COMMAND>    failure rate of one command
+XCAT_FAKE_INSTALL_TIME          seconds from power on after nodeset until
+                                nodelist.status reports booted
+
+Every invocation appends the command name to forks.log in the state
+directory so the benchmark can count the processes forked per command.
+"""
+
+import os
+import stat
+import sys
+
+COMMANDS = ('rpower', 'nodeset', 'nodels', 'chdef', 'nodech', 'makedhcp',
+            'rsetboot', 'lsdef', 'rinv', 'rvitals', 'rflash',
+            'makeconservercf', 'ipmitool')
+
+STUB = r'''
+import os
+import random
+import sys
+import time
+
+state = os.environ['XCAT_FAKE_STATE']
+command = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+
+
+def env(name, default):
+    return float(os.environ.get('XCAT_FAKE_%s_%s' % (name, command.upper()),
+                 os.environ.get('XCAT_FAKE_%s' % name, default)))
+
+
+fd = os.open(os.path.join(state, 'forks.log'),
+             os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+os.write(fd, (command + '\n').encode())
+os.close(fd)
+
+if command == 'ipmitool':
+    sys.exit(0)
+
+time.sleep(env('LATENCY', 0))
+
+nodes = []
+if args and not args[0].startswith('-') and '=' not in args[0]:
+    nodes = args.pop(0).split(',')
+
+
+def path(kind, node):
+    d = os.path.join(state, kind)
+    if not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError:
+            pass
+    return os.path.join(d, node)
+
+
+def read(kind, node, default=''):
+    try:
+        with open(path(kind, node)) as f:
+            return f.read().strip()
+    except IOError:
+        return default
+
+
+def write(kind, node, value):
+    with open(path(kind, node), 'w') as f:
+        f.write(value)
+
+
+failrate = env('FAILRATE', 0)
+rc = 0
+for node in nodes or ['']:
+    if failrate and random.random() < failrate:
+        sys.stderr.write('Error: %s: simulated failure\n' % node)
+        rc = 1
+        continue
+    if command == 'rpower':
+        action = args[0] if args else 'stat'
+        if action in ('on', 'boot', 'reset'):
+            write('power', node, 'on')
+            if read('status', node) == 'nodeset':
+                write('status', node, 'installing %f' % time.time())
+        elif action == 'off':
+            write('power', node, 'off')
+        sys.stdout.write('%s: %s\n' % (node, read('power', node, 'off')))
+    elif command == 'nodeset':
+        write('status', node, 'nodeset')
+        sys.stdout.write('%s: install %s\n' % (node, ' '.join(args)))
+    elif command == 'nodels':
+        status = read('status', node, 'booted')
+        if status.startswith('installing'):
+            started = float(status.split()[1])
+            if time.time() - started >= env('INSTALL_TIME', 5):
+                status = 'booted'
+                write('status', node, status)
+            else:
+                status = 'installing'
+        elif status == 'nodeset':
+            status = 'powering-on'
+        sys.stdout.write('%s: %s\n' % (node, status))
+    elif command == 'lsdef':
+        for name in nodes:
+            sys.stdout.write('Object name: %s\n    groups=all\n'
+                             '    mgt=ipmi\n' % name)
+        break
+    elif command == 'rinv':
+        sys.stdout.write('%s: Processor: 8 cores\n%s: Memory: 2048 MB\n'
+                         % (node, node))
+    elif command in ('rsetboot', 'rflash', 'rvitals'):
+        sys.stdout.write('%s: ok\n' % node)
+sys.exit(rc)
+'''
+
+
+def install(bin_dir, state_dir, python=None):
+    """Write the stub executables and point the environment at them.
+
+    :param bin_dir: directory for the executables, prepended to PATH.
+    :param state_dir: directory for the fake power and install state.
+    :param python: interpreter for the stubs, defaults to sys.executable.
+    """
+    python = python or sys.executable
+    for d in (bin_dir, state_dir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    for command in COMMANDS:
+        stub = os.path.join(bin_dir, command)
+        with open(stub, 'w') as f:
+            f.write('#!%s\n' % python)
+            f.write(STUB)
+        os.chmod(stub, os.stat(stub).st_mode | stat.S_IXUSR | stat.S_IXGRP
+                 | stat.S_IXOTH)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    os.environ['XCAT_FAKE_STATE'] = state_dir
+
+
+def configure(latency=None, failrate=None, install_time=None, **per_command):
+    """Set the stub behaviour through the environment.
+
+    Keyword arguments named latency_<command> or failrate_<command> set
+    the value of one command only.
+    """
+    if latency is not None:
+        os.environ['XCAT_FAKE_LATENCY'] = str(latency)
+    if failrate is not None:
+        os.environ['XCAT_FAKE_FAILRATE'] = str(failrate)
+    if install_time is not None:
+        os.environ['XCAT_FAKE_INSTALL_TIME'] = str(install_time)
+    for key, value in per_command.items():
+        name, command = key.split('_', 1)
+        os.environ['XCAT_FAKE_%s_%s' % (name.upper(),
+                                        command.upper())] = str(value)
+
+
+def fork_counts(state_dir, reset=False):
+    """Return {command: number of invocations} since the last reset."""
+    log = os.path.join(state_dir, 'forks.log')
+    counts = {}
+    try:
+        with open(log) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    counts[line] = counts.get(line, 0) + 1
+    except IOError:
+        pass
+    if reset and os.path.exists(log):
+        os.unlink(log)
+    return counts
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Startup benchmark of the xcat baremetal driver.
+
+Imports ironic.drivers.xcat and constructs XCATBaremetalDriver in fresh
+interpreters, against the fake xCAT toolchain, and reports the import
+and construction times and the processes forked, once with a cold
+probe cache and then with the cache warm.
+
+usage: load_bench.py [--runs 5] [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_xcat  # noqa
+
+CHILD = r'''
+import json
+import sys
+import time
+
+from oslo.config import cfg
+
+start = time.time()
+from ironic.drivers import xcat
+imported = time.time()
+cfg.CONF.set_override('probe_cache_file', sys.argv[1], group='xcat')
+xcat.XCATBaremetalDriver()
+done = time.time()
+print(json.dumps({'import': imported - start,
+                  'construct': done - imported,
+                  'modules': len(sys.modules)}))
+'''
+
+
+def _median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def _run_child(cache_file):
+    out = subprocess.check_output([sys.executable, '-c', CHILD, cache_file])
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def run(runs):
+    workdir = tempfile.mkdtemp(prefix='xcat-load-bench-')
+    state_dir = os.path.join(workdir, 'state')
+    fake_xcat.install(os.path.join(workdir, 'bin'), state_dir)
+    cache_file = os.path.join(workdir, 'probe_cache.json')
+    results = []
+    try:
+        for label in ('cold', 'warm'):
+            samples = []
+            forks = {}
+            for i in range(runs):
+                if label == 'cold' and os.path.exists(cache_file):
+                    os.unlink(cache_file)
+                fake_xcat.fork_counts(state_dir, reset=True)
+                samples.append(_run_child(cache_file))
+                for command, count in fake_xcat.fork_counts(
+                        state_dir, reset=True).items():
+                    forks[command] = forks.get(command, 0) + count
+            results.append({
+                'cache': label,
+                'runs': runs,
+                'import': _median([s['import'] for s in samples]),
+                'construct': _median([s['construct'] for s in samples]),
+                'modules': _median([s['modules'] for s in samples]),
+                'forks_per_load': dict((c, float(n) / runs)
+                                       for c, n in forks.items())})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--runs', type=int, default=5,
+                        help='driver loads per cache state')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+    results = run(args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    for r in results:
+        print("%(cache)-5s probe cache: import=%(import)6.3fs "
+              "construct=%(construct)6.3fs modules=%(modules)d" % r)
+        print("      forks per load: %s" % (', '.join(
+            '%s=%.1f' % kv for kv in sorted(r['forks_per_load'].items()))
+            or 'none'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Report the p50/p95 duration of every deploy phase recorded by the xcat
+baremetal driver, across all nodes and per image.
+
+The timelines are read from the history file the driver keeps on the
+conductor (--history), from the ironic API (credentials from the usual
+OS_* environment variables) or from a JSON file holding a list of node
+details as returned by `ironic node-show`.  The nodes only hold the
+timeline of their current instance, the history keeps the torn down
+ones too.
+
+usage: xcat_deploy_report.py [--history xcat_timelines.json]
+                             [--file nodes.json] [--driver pxe_xcat]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from ironic.drivers.modules import xcat_timeline
+
+
+def _timeline_of(node):
+    for field in ('driver_internal_info', 'instance_info'):
+        info = node.get(field) or {}
+        if info.get(xcat_timeline.TIMELINE_KEY):
+            return info[xcat_timeline.TIMELINE_KEY]
+    return None
+
+
+def _nodes_from_api(driver):
+    from ironicclient import client
+
+    kwargs = {'os_username': os.environ.get('OS_USERNAME'),
+              'os_password': os.environ.get('OS_PASSWORD'),
+              'os_tenant_name': os.environ.get('OS_TENANT_NAME'),
+              'os_auth_url': os.environ.get('OS_AUTH_URL')}
+    ironic = client.get_client(1, **kwargs)
+    nodes = []
+    for node in ironic.node.list(detail=True):
+        if node.driver != driver:
+            continue
+        nodes.append(node.to_dict())
+    return nodes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--history',
+                        help='deploy timeline history file of a conductor, '
+                        '[xcat] timeline_file')
+    parser.add_argument('--file', help='JSON file with a list of nodes')
+    parser.add_argument('--driver', default='pxe_xcat',
+                        help='only report nodes using this driver')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.history:
+        with open(args.history) as f:
+            timelines = json.load(f)
+    else:
+        if args.file:
+            with open(args.file) as f:
+                nodes = json.load(f)
+        else:
+            nodes = _nodes_from_api(args.driver)
+        timelines = [t for t in (_timeline_of(n) for n in nodes) if t]
+    if not timelines:
+        sys.stderr.write("no deploy timeline found\n")
+        return 1
+    report = xcat_timeline.summarize(timelines)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(xcat_timeline.format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())